@@ -104,10 +104,21 @@ const GraphEvents = ({
 					console.log(`Node: ${nodeId} double clicked`, event);
 
 					try {
-						const connectedWallets = await BackendService.fetchConnectedWallets(
-							nodeId
-						);
+						// The wallet, its connections and the class of its neighbours in one request
+						const graphNode = await BackendService.fetchGraphNode(nodeId);
+						const connectedWallets = graphNode.connected_wallets;
 						const graph = sigma.getGraph();
+						graph.setNodeAttribute(
+							nodeId,
+							"color",
+							getNodeColor(graphNode.wallet_data)
+						);
+						if (graphNode.wallet_data.is_populated) {
+							await globalState.walletCache.cacheWalletData(
+								nodeId,
+								graphNode.wallet_data
+							);
+						}
 						const node = graph.getNodeAttributes(nodeId);
 						const nodeCoords: Coordinates = {
 							x: node.x,
@@ -126,11 +137,11 @@ const GraphEvents = ({
 								});
 							}
 
-							if (!graph.hasEdge(nodeId, connection)) {
+							if (!graph.hasEdge(connection, nodeId)) {
 								const num_transactions =
 									connectedWallets.inbound_connections[connection]
 										.num_transactions;
-								graph.addEdge(nodeId, connection, {
+								graph.addEdge(connection, nodeId, {
 									size: 3,
 									label:
 										num_transactions === -1
@@ -156,11 +167,11 @@ const GraphEvents = ({
 								});
 							}
 
-							if (!graph.hasEdge(connection, nodeId)) {
+							if (!graph.hasEdge(nodeId, connection)) {
 								const num_transactions =
 									connectedWallets.outbound_connections[connection]
 										.num_transactions;
-								graph.addEdge(connection, nodeId, {
+								graph.addEdge(nodeId, connection, {
 									size: 3,
 									label:
 										num_transactions === -1
@@ -174,6 +185,13 @@ const GraphEvents = ({
 								}
 							}
 						}
+						for (const neighbour of graphNode.neighbours) {
+							graph.setNodeAttribute(
+								neighbour.address,
+								"color",
+								getNodeColor(neighbour)
+							);
+						}
 					} catch (error: unknown) {
 						if (error instanceof Error && error.name === "AbortError") {
 							console.error("Connected wallets request timed out");
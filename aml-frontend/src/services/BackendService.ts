@@ -1,6 +1,8 @@
 import Config from "../config/Config";
 import { GlobalState } from "../contexts/GlobalContext";
 import ConnectedWallets from "../types/ConnectedWallets";
+import GraphNode from "../types/GraphNode";
+import ScoringJob from "../types/ScoringJob";
 import { WalletData } from "../types/WalletData";
 
 class BackendService {
@@ -27,6 +29,13 @@ class BackendService {
 				throw new Error(`HTTP error! status: ${response.status}`);
 			}
 
+			// Wallets with a long history are scored in a background job, wait for it to finish
+			if (response.status === 202) {
+				const job: ScoringJob = await response.json();
+				await this.waitForScoringJob(job, timeout);
+				return this.fetchWalletData(walletAddress, timeout);
+			}
+
 			const data = await response.json();
 			return data;
 		} finally {
@@ -34,6 +43,60 @@ class BackendService {
 		}
 	}
 
+	static async fetchScoringJob(
+		jobId: string,
+		timeout: number = 5000
+	): Promise<ScoringJob> {
+		const controller = new AbortController();
+		const timeoutId = setTimeout(() => controller.abort(), timeout);
+
+		try {
+			const response = await fetch(
+				`${Config.getBackendBaseUrl()}/jobs/${jobId}`,
+				{
+					method: "GET",
+					headers: {
+						"Content-Type": "application/json",
+					},
+					signal: controller.signal,
+				}
+			);
+
+			if (!response.ok) {
+				throw new Error(`HTTP error! status: ${response.status}`);
+			}
+
+			const data = await response.json();
+			return data;
+		} finally {
+			clearTimeout(timeoutId);
+		}
+	}
+
+	static async waitForScoringJob(
+		job: ScoringJob,
+		timeout: number = 10000,
+		pollInterval: number = 2000,
+		maxWait: number = 30 * 60 * 1000
+	): Promise<ScoringJob> {
+		const deadline = Date.now() + maxWait;
+		while (job.status === "pending" || job.status === "running") {
+			if (Date.now() > deadline) {
+				throw new Error(`Scoring job ${job.job_id} did not finish in time`);
+			}
+			await new Promise((resolve) => setTimeout(resolve, pollInterval));
+			job = await this.fetchScoringJob(job.job_id, timeout);
+		}
+
+		if (job.status === "not_found") {
+			throw new Error("HTTP error! status: 404");
+		}
+		if (job.status === "failed") {
+			throw new Error(`Scoring job failed: ${job.error}`);
+		}
+		return job;
+	}
+
 	static async fetchWalletDataWithCache(
 		walletAddress: string,
 		globalState: GlobalState,
@@ -94,6 +157,36 @@ class BackendService {
 			clearTimeout(timeoutId);
 		}
 	}
+
+	static async fetchGraphNode(
+		walletAddress: string,
+		timeout: number = 5000
+	): Promise<GraphNode> {
+		const controller = new AbortController();
+		const timeoutId = setTimeout(() => controller.abort(), timeout);
+
+		try {
+			const response = await fetch(
+				`${Config.getBackendBaseUrl()}/graph-node/${walletAddress}`,
+				{
+					method: "GET",
+					headers: {
+						"Content-Type": "application/json",
+					},
+					signal: controller.signal,
+				}
+			);
+
+			if (!response.ok) {
+				throw new Error(`HTTP error! status: ${response.status}`);
+			}
+
+			const data = await response.json();
+			return data;
+		} finally {
+			clearTimeout(timeoutId);
+		}
+	}
 }
 
 export default BackendService;
@@ -3,10 +3,19 @@ interface Connection {
 	amount_transacted: number;
 }
 
+interface ConnectionSummary {
+	inbound_degree: number;
+	outbound_degree: number;
+	inbound_volume: number;
+	outbound_volume: number;
+}
+
 interface ConnectedWallets {
 	wallet_address: string;
 	inbound_connections: Record<string, Connection>;
 	outbound_connections: Record<string, Connection>;
+	// Only set for hub wallets, whose connections are limited to the top counterparties
+	summary?: ConnectionSummary | null;
 }
 
 export default ConnectedWallets;
@@ -0,0 +1,17 @@
+import ConnectedWallets from "./ConnectedWallets";
+import { WalletData } from "./WalletData";
+
+interface GraphNeighbour {
+	address: string;
+	class_inference: number;
+	is_populated: boolean;
+}
+
+interface GraphNode {
+	// A stub, with is_populated false, if the wallet has not been fetched yet
+	wallet_data: WalletData;
+	connected_wallets: ConnectedWallets;
+	neighbours: GraphNeighbour[];
+}
+
+export default GraphNode;
@@ -0,0 +1,17 @@
+type ScoringJobStatus = "pending" | "running" | "done" | "not_found" | "failed";
+
+interface ScoringJob {
+	job_id: string;
+	address: string;
+	force_update: boolean;
+	status: ScoringJobStatus;
+	tx_count: number | null;
+	estimated_pages: number | null;
+	estimated_seconds: number | null;
+	pages_fetched: number;
+	created_at: number;
+	updated_at: number;
+	error: string | null;
+}
+
+export default ScoringJob;
@@ -47,6 +47,7 @@ export interface WalletData {
 	fees_total: number;
 	first_received_block: number;
 	first_sent_block: number;
+	is_populated: boolean;
 	last_updated: number;
 	lifetime_in_blocks: number;
 	num_addr_transacted_multiple: number;
@@ -56,6 +57,8 @@ export interface WalletData {
 	transacted_w_address_median: number;
 	transacted_w_address_min: number;
 	transacted_w_address_total: number;
+	risk_score?: number | null;
+	is_approximate?: boolean;
 }
 
 /**
@@ -65,7 +68,9 @@ export interface WalletData {
  * @returns The color of the node as a string. Returns "green" if class_inference is 0 (licit),
  *          "red" if class_inference is 1 (illicit), and "grey" for any other value (often -1 if unset).
  */
-export function getNodeColor(walletData: WalletData): string {
+export function getNodeColor(
+	walletData: Pick<WalletData, "class_inference">
+): string {
 	if (walletData.class_inference == 0) {
 		return "green";
 	} else if (walletData.class_inference == 1) {
@@ -0,0 +1,145 @@
+"""
+Round trip of the bulk import against a local Neo4j, e.g. the container of docker-compose.yml.
+
+A synthetic chain of wallets, each connected to the next few ones, is written to small shards so the
+same wallets and connections land in several of them, merged and loaded with LOAD CSV. The loaded
+graph is checked against the expected one and deleted afterwards. The files are written under
+BULK_IMPORT_DIR and read by the server from BULK_IMPORT_NEO4J_URL, see src/db/bulk_import.py. Start
+the neo4j service, then run from the api directory:
+
+    python -m bench.bulk_import --wallets 20000 --connections 5
+"""
+
+import argparse
+import os
+import shutil
+import sys
+from time import perf_counter, time
+
+import numpy as np
+from neo4j import GraphDatabase
+
+from src.config import (
+    BULK_IMPORT_DIR,
+    BULK_IMPORT_NEO4J_URL,
+    NEO4J_PASSWORD,
+    NEO4J_URI,
+    NEO4J_USERNAME,
+)
+from src.db.bulk_import import BulkGraphWriter, load_with_cypher
+from src.models import (
+    WALLET_FEATURE_NAMES,
+    ConnectedWallets,
+    WalletConnectionDetails,
+    WalletData,
+)
+
+ADDRESS_PREFIX = "bc1qbulkbench"
+SUBDIRECTORY = "bench"
+
+
+def address(i: int, num_wallets: int) -> str:
+    return f"{ADDRESS_PREFIX}{i % num_wallets}"
+
+
+def write_shards(
+    writer: BulkGraphWriter, num_wallets: int, num_connections: int
+) -> None:
+    """
+    Write each wallet with outbound connections to the next num_connections wallets, and an inbound
+    connection from the previous one, which is also the outbound connection of that wallet.
+    """
+    for i in range(num_wallets):
+        wallet_data = WalletData.from_feature_vector(
+            address(i, num_wallets),
+            np.full(len(WALLET_FEATURE_NAMES), i, dtype=np.float64),
+            class_inference=i % 2,
+            last_updated=int(time()),
+            is_populated=True,
+        )
+        details = WalletConnectionDetails(num_transactions=1, amount_transacted=1.0)
+        writer.add_wallet(wallet_data)
+        writer.add_connected_wallets(
+            wallet_data.address,
+            ConnectedWallets(
+                wallet_address=wallet_data.address,
+                inbound_connections={address(i - 1, num_wallets): details},
+                outbound_connections={
+                    address(i + offset, num_wallets): details
+                    for offset in range(1, num_connections + 1)
+                },
+            ),
+        )
+
+
+def count_loaded(driver) -> tuple:
+    """
+    Count the loaded wallets, the populated ones and their connections.
+    """
+    with driver.session() as session:
+        record = session.run(
+            """
+            MATCH (w:Wallet) WHERE w.address STARTS WITH $prefix
+            OPTIONAL MATCH (w)-[r:TRANSACTED_WITH]->()
+            RETURN count(DISTINCT w) AS wallets,
+                   count(DISTINCT CASE WHEN w.is_populated THEN w END) AS populated,
+                   count(r) AS connections
+            """,
+            prefix=ADDRESS_PREFIX,
+        ).single()
+    return record["wallets"], record["populated"], record["connections"]
+
+
+def delete_loaded(driver) -> None:
+    """
+    Delete the loaded wallets and their connections.
+    """
+    with driver.session() as session:
+        session.run(
+            """
+            MATCH (w:Wallet) WHERE w.address STARTS WITH $prefix
+            CALL { WITH w DETACH DELETE w } IN TRANSACTIONS OF 10000 ROWS
+            """,
+            prefix=ADDRESS_PREFIX,
+        ).consume()
+
+
+def main(num_wallets: int, num_connections: int, shard_size: int) -> int:
+    directory = os.path.join(BULK_IMPORT_DIR, SUBDIRECTORY)
+    base_url = f"{BULK_IMPORT_NEO4J_URL.rstrip('/')}/{SUBDIRECTORY}"
+    shutil.rmtree(directory, ignore_errors=True)
+    writer = BulkGraphWriter(directory, shard_size=shard_size)
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+    try:
+        delete_loaded(driver)
+
+        start = perf_counter()
+        write_shards(writer, num_wallets, num_connections)
+        writer.flush()
+        num_shards = writer.num_shards
+        writer.merge_shards()
+        merged = perf_counter() - start
+        print(f"Wrote and merged {num_shards} shards in {merged:.1f}s")
+
+        start = perf_counter()
+        load_with_cypher(driver, base_url=base_url)
+        loaded = perf_counter() - start
+        print(f"Loaded in {loaded:.1f}s ({num_wallets / loaded:.0f} wallets/s)")
+
+        expected = (num_wallets, num_wallets, num_wallets * num_connections)
+        actual = count_loaded(driver)
+        print(f"Wallets, populated, connections: expected {expected}, loaded {actual}")
+        return 0 if actual == expected else 1
+    finally:
+        delete_loaded(driver)
+        driver.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--wallets", type=int, default=20000)
+    parser.add_argument("--connections", type=int, default=5)
+    parser.add_argument("--shard-size", type=int, default=10000)
+    args = parser.parse_args()
+    sys.exit(main(args.wallets, args.connections, args.shard_size))
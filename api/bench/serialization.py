@@ -0,0 +1,89 @@
+"""
+Benchmark of the encoding of connected wallets responses, FastAPI's default path against the fast path.
+
+The default path is what FastAPI does with a model returned from a route with a response model:
+dump it, validate it again, serialize it and encode the result with json.dumps. The fast path
+encodes the model once with pydantic, then compresses it. Run from the api directory:
+
+    python -m bench.serialization --repeat 20
+"""
+
+import argparse
+import asyncio
+from time import perf_counter
+from typing import Callable
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from src.models import ConnectedWallets, WalletConnectionDetails
+from src.shared.responses import compress, encode_model
+
+EDGE_COUNTS = [10, 1000, 50000]
+
+
+def make_connected_wallets(num_edges: int) -> ConnectedWallets:
+    """
+    Build connected wallets with num_edges connections, split between both directions.
+    """
+    connections = {
+        f"bc1qbenchmark{i:08d}": WalletConnectionDetails(
+            num_transactions=i % 17 + 1, amount_transacted=i * 0.00012345
+        )
+        for i in range(num_edges)
+    }
+    addresses = list(connections)
+    half = num_edges // 2
+    return ConnectedWallets(
+        wallet_address="bc1qbenchmarkroot",
+        inbound_connections={a: connections[a] for a in addresses[:half]},
+        outbound_connections={a: connections[a] for a in addresses[half:]},
+    )
+
+
+def time_call(call: Callable[[], bytes], repeat: int) -> float:
+    """
+    Returns:
+    - The best time of a call out of repeat calls, in milliseconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        call()
+        best = min(best, perf_counter() - start)
+    return best * 1000
+
+
+def main(repeat: int) -> None:
+    field = create_model_field("Response", ConnectedWallets, mode="serialization")
+    loop = asyncio.new_event_loop()
+
+    def default_path(model: ConnectedWallets) -> bytes:
+        content = loop.run_until_complete(
+            serialize_response(field=field, response_content=model)
+        )
+        return JSONResponse(content).body
+
+    print(
+        f"{'edges':>7} {'default ms':>11} {'fast ms':>9} {'speedup':>8} "
+        f"{'json KB':>9} {'gzip ms':>8} {'gzip KB':>8}"
+    )
+    for num_edges in EDGE_COUNTS:
+        model = make_connected_wallets(num_edges)
+        body = encode_model(model)
+        default_ms = time_call(lambda: default_path(model), repeat)
+        fast_ms = time_call(lambda: encode_model(model), repeat)
+        gzip_ms = time_call(lambda: compress(body, "gzip"), repeat)
+        print(
+            f"{num_edges:>7} {default_ms:>11.3f} {fast_ms:>9.3f} {default_ms / fast_ms:>7.1f}x "
+            f"{len(body) / 1024:>9.1f} {gzip_ms:>8.3f} {len(compress(body, 'gzip')) / 1024:>8.1f}"
+        )
+    loop.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.repeat)
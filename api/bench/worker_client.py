@@ -0,0 +1,104 @@
+"""
+Benchmark of the API to worker calls, with a new client session per call against the pooled session.
+
+A local aiohttp server stands in for the worker and answers every wallet request with the same
+wallet data, so the numbers measure the HTTP client overhead only. Run from the api directory:
+
+    python -m bench.worker_client --requests 2000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import os
+from time import perf_counter
+
+from aiohttp import web
+import aiohttp
+import numpy as np
+
+HOST = "127.0.0.1"
+PORT = 8765
+# Must be set before importing src.config
+os.environ["WORKER_API_URL"] = f"http://{HOST}:{PORT}"
+
+from src.config import WORKER_WALLET_ROUTE_PREFIX  # noqa: E402
+from src.models import WALLET_FEATURE_NAMES, WalletData  # noqa: E402
+from src.shared.worker_client import get_wallet_data_from_worker  # noqa: E402
+from src.shared.http_client import create_worker_client_session  # noqa: E402
+
+
+async def start_fake_worker() -> web.AppRunner:
+    """
+    Start a local server answering the worker wallet route.
+    """
+    wallet_data = WalletData.from_feature_vector(
+        "bc1qbenchmark",
+        np.arange(len(WALLET_FEATURE_NAMES), dtype=np.float64),
+        class_inference=0,
+        last_updated=0,
+        is_populated=True,
+    ).model_dump(mode="json")
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.json_response(wallet_data)
+
+    app = web.Application()
+    app.router.add_get(f"{WORKER_WALLET_ROUTE_PREFIX}/{{address}}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, HOST, PORT).start()
+    return runner
+
+
+async def per_call_session(address: str) -> None:
+    """
+    Call the worker with a new session, as done before the pooled session.
+    """
+    async with aiohttp.ClientSession() as session:
+        await get_wallet_data_from_worker(session, address)
+
+
+async def run(num_requests: int, concurrency: int, call) -> float:
+    """
+    Issue the requests with a bounded concurrency.
+
+    Returns:
+    - The number of requests per second
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(i: int) -> None:
+        async with semaphore:
+            await call(f"bc1qbenchmark{i}")
+
+    start = perf_counter()
+    await asyncio.gather(*(bounded(i) for i in range(num_requests)))
+    return num_requests / (perf_counter() - start)
+
+
+async def main(num_requests: int, concurrency: int) -> None:
+    runner = await start_fake_worker()
+    try:
+        per_call = await run(num_requests, concurrency, per_call_session)
+        print(f"Session per call: {per_call:8.0f} requests/s")
+
+        session = create_worker_client_session()
+        try:
+            pooled = await run(
+                num_requests,
+                concurrency,
+                lambda address: get_wallet_data_from_worker(session, address),
+            )
+        finally:
+            await session.close()
+        print(f"Pooled session:   {pooled:8.0f} requests/s ({pooled / per_call:.1f}x)")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
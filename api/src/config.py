@@ -10,7 +10,9 @@ SETUP_MONGO_DB = os.getenv("SETUP_MONGO_DB", "False") == "True"
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # or "DEBUG", "WARNING", "ERROR", "CRITICAL"
 APPLICATION_TYPE_API = "API"
 APPLICATION_TYPE_WORKER = "WORKER"
-APPLICATION_TYPE = os.getenv("APPLICATION_TYPE", APPLICATION_TYPE_API)  # or "WORKER"
+# Runs the API and the worker in one process, the API calls the worker logic directly
+APPLICATION_TYPE_ALL = "ALL"
+APPLICATION_TYPE = os.getenv("APPLICATION_TYPE", APPLICATION_TYPE_API)  # or "WORKER" or "ALL"
 
 API_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
 WORKER_API_URL = os.getenv("WORKER_API_URL", "http://127.0.0.1:8001")
@@ -22,3 +24,208 @@ BLOCKSTREAM_RATE_LIMIT_MS = int(os.getenv("BLOCKSTREAM_RATE_LIMIT_MS", 250))
 API_WALLET_ROUTE_PREFIX = "/wallet"
 API_CONNECTED_WALLETS_ROUTE_PREFIX = "/connected-wallets"
 WORKER_WALLET_ROUTE_PREFIX = "/wallet"
+API_SUBGRAPH_ROUTE_PREFIX = "/subgraph"
+API_GRAPH_NODE_ROUTE_PREFIX = "/graph-node"
+# Prefix of the worker routes when the API and the worker run in one process
+ALL_WORKER_ROUTE_PREFIX = "/worker"
+
+# Wallets with more connections than the threshold are stored as hubs: only their top connections by
+# amount transacted are stored as edges in Neo4j, their full connection list is stored in MongoDB
+HUB_DEGREE_THRESHOLD = int(os.getenv("HUB_DEGREE_THRESHOLD", 1000))
+HUB_TOP_K = int(os.getenv("HUB_TOP_K", 100))
+HUB_CONNECTIONS_CHUNK_SIZE = int(os.getenv("HUB_CONNECTIONS_CHUNK_SIZE", 1000))
+CONNECTIONS_PAGE_MAX_LIMIT = int(os.getenv("CONNECTIONS_PAGE_MAX_LIMIT", 1000))
+
+# Upper bounds for the k-hop subgraph queries of the graph explorer
+SUBGRAPH_MAX_DEPTH = int(os.getenv("SUBGRAPH_MAX_DEPTH", 3))
+SUBGRAPH_MAX_FAN_OUT = int(os.getenv("SUBGRAPH_MAX_FAN_OUT", 100))
+SUBGRAPH_MAX_NODES = int(os.getenv("SUBGRAPH_MAX_NODES", 2000))
+
+# Propagation of illicit wallet risk over the TRANSACTED_WITH graph, run by the worker
+RISK_PROPAGATION_ENABLED = os.getenv("RISK_PROPAGATION_ENABLED", "False") == "True"
+RISK_PROPAGATION_INTERVAL_S = int(os.getenv("RISK_PROPAGATION_INTERVAL_S", 3600))
+RISK_PROPAGATION_FULL_RUN_EVERY = int(os.getenv("RISK_PROPAGATION_FULL_RUN_EVERY", 24))
+RISK_PROPAGATION_DAMPING = float(os.getenv("RISK_PROPAGATION_DAMPING", 0.85))
+RISK_PROPAGATION_TOLERANCE = float(os.getenv("RISK_PROPAGATION_TOLERANCE", 1e-6))
+RISK_PROPAGATION_MAX_ITERATIONS = int(os.getenv("RISK_PROPAGATION_MAX_ITERATIONS", 100))
+RISK_PROPAGATION_CHUNK_SIZE = int(os.getenv("RISK_PROPAGATION_CHUNK_SIZE", 10000))
+RISK_PROPAGATION_WRITE_BATCH_SIZE = int(
+    os.getenv("RISK_PROPAGATION_WRITE_BATCH_SIZE", 10000)
+)
+
+# Bulk import mode for historical backfills: far from the chain tip the block worker writes wallets
+# and connections to CSV shards instead of merging them into Neo4j one by one, the shards are loaded
+# in batched transactions once the worker gets within BULK_IMPORT_TIP_DISTANCE blocks of the tip
+BULK_IMPORT_ENABLED = os.getenv("BULK_IMPORT_ENABLED", "False") == "True"
+# Relative to the api directory the worker runs from, under the import directory docker-compose.yml
+# mounts into the Neo4j container, which sees it as BULK_IMPORT_NEO4J_URL
+BULK_IMPORT_DIR = os.getenv("BULK_IMPORT_DIR", "../neo4j_db/import/bulk")
+BULK_IMPORT_NEO4J_URL = os.getenv("BULK_IMPORT_NEO4J_URL", "file:///bulk")
+BULK_IMPORT_TIP_DISTANCE = int(os.getenv("BULK_IMPORT_TIP_DISTANCE", 100))
+BULK_IMPORT_SHARD_SIZE = int(os.getenv("BULK_IMPORT_SHARD_SIZE", 1000000))
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", 10000))
+# Into an empty store, stop the worker once the files are merged and log the neo4j-admin command to
+# import them with, which is much faster than LOAD CSV but needs the database stopped
+BULK_IMPORT_NEO4J_ADMIN = os.getenv("BULK_IMPORT_NEO4J_ADMIN", "False") == "True"
+
+# Pooled HTTP client used by the API to call the worker
+WORKER_CLIENT_MAX_CONNECTIONS = int(os.getenv("WORKER_CLIENT_MAX_CONNECTIONS", 100))
+WORKER_CLIENT_KEEPALIVE_S = float(os.getenv("WORKER_CLIENT_KEEPALIVE_S", 30))
+WORKER_CLIENT_CONNECT_TIMEOUT_S = float(os.getenv("WORKER_CLIENT_CONNECT_TIMEOUT_S", 5))
+# Fetching a large wallet from the Blockstream API can take minutes because of the rate limit
+WORKER_CLIENT_TIMEOUT_S = float(os.getenv("WORKER_CLIENT_TIMEOUT_S", 300))
+# Separate HTTP client for the event streams proxied from the worker, each open stream holds one of
+# its connections for as long as the subscriber stays connected
+WORKER_EVENTS_MAX_CONNECTIONS = int(os.getenv("WORKER_EVENTS_MAX_CONNECTIONS", 1000))
+
+# In-process cache of the API responses, invalidated through the wallet_changes collection the
+# worker writes to after updating a wallet, so the API polls MongoDB while it is enabled
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "False") == "True"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 10000))
+RESPONSE_CACHE_TTL_S = float(os.getenv("RESPONSE_CACHE_TTL_S", 60))
+WALLET_CHANGES_POLL_S = float(os.getenv("WALLET_CHANGES_POLL_S", 1))
+WALLET_CHANGES_MAX_BYTES = int(os.getenv("WALLET_CHANGES_MAX_BYTES", 16 * 1024 * 1024))
+
+# Wallet lookups are counted by the API and flushed to MongoDB, to rank the background refreshes
+WALLET_QUERY_COUNTING_ENABLED = (
+    os.getenv("WALLET_QUERY_COUNTING_ENABLED", "True") == "True"
+)
+WALLET_QUERY_FLUSH_S = float(os.getenv("WALLET_QUERY_FLUSH_S", 10))
+API_METRICS_ROUTE_PREFIX = "/metrics"
+
+# Limits of the batch wallet lookups
+WALLET_BATCH_MAX_ADDRESSES = int(os.getenv("WALLET_BATCH_MAX_ADDRESSES", 50000))
+WALLET_BATCH_DB_CHUNK_SIZE = int(os.getenv("WALLET_BATCH_DB_CHUNK_SIZE", 5000))
+# Number of wallets fetched from the worker at once while streaming a batch
+WALLET_BATCH_MAX_CONCURRENCY = int(os.getenv("WALLET_BATCH_MAX_CONCURRENCY", 8))
+
+# Scoring jobs: the API waits this long for a wallet to be fetched and scored before answering
+# 202 Accepted with the job to poll
+API_JOBS_ROUTE_PREFIX = "/jobs"
+WORKER_JOBS_ROUTE_PREFIX = "/jobs"
+WALLET_SYNC_WAIT_S = float(os.getenv("WALLET_SYNC_WAIT_S", 5))
+SCORING_JOB_MAX_WAIT_S = float(os.getenv("SCORING_JOB_MAX_WAIT_S", 60))
+
+# Server-sent event stream of the scored wallets and the scoring job progress
+API_EVENTS_ROUTE_PREFIX = "/events"
+WORKER_EVENTS_ROUTE_PREFIX = "/events"
+EVENT_STREAM_BUFFER_SIZE = int(os.getenv("EVENT_STREAM_BUFFER_SIZE", 1000))
+EVENT_STREAM_HEARTBEAT_S = float(os.getenv("EVENT_STREAM_HEARTBEAT_S", 15))
+
+# Streaming export of the wallets and TRANSACTED_WITH edges
+API_EXPORT_ROUTE_PREFIX = "/export"
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", 1000))
+EXPORT_ARROW_BATCH_SIZE = int(os.getenv("EXPORT_ARROW_BATCH_SIZE", 10000))
+
+# Opt-in fast path for large JSON responses: models are encoded once by pydantic instead of being
+# dumped, re-validated and encoded again by FastAPI, and compressed when the client accepts it
+FAST_RESPONSES_ENABLED = os.getenv("FAST_RESPONSES_ENABLED", "False") == "True"
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", 1024))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", 5))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", 4))
+
+# Disk cache of the immutable Blockstream API responses: block transaction pages and the hashes of
+# blocks with at least UPSTREAM_CACHE_MIN_CONFIRMATIONS confirmations, so replays and restarts do
+# not refetch them
+UPSTREAM_CACHE_ENABLED = os.getenv("UPSTREAM_CACHE_ENABLED", "True") == "True"
+UPSTREAM_CACHE_DIR = os.getenv("UPSTREAM_CACHE_DIR", "./upstream_cache")
+UPSTREAM_CACHE_MAX_BYTES = int(os.getenv("UPSTREAM_CACHE_MAX_BYTES", 1024**3))
+UPSTREAM_CACHE_MIN_CONFIRMATIONS = int(os.getenv("UPSTREAM_CACHE_MIN_CONFIRMATIONS", 6))
+WORKER_METRICS_ROUTE_PREFIX = "/metrics"
+
+# Local index of the transactions of the blocks ingested by the block worker, used to rebuild the
+# history of the addresses it covers without calling the Blockstream API. By default every block is
+# kept, so the file grows with the chain, by roughly the size of the compressed blocks plus one
+# posting per address of each transaction. With TX_INDEX_RETAIN_BLOCKS set, only the most recent
+# blocks are kept, e.g. 4320 for a month, and addresses with older transactions are not covered
+TX_INDEX_ENABLED = os.getenv("TX_INDEX_ENABLED", "False") == "True"
+TX_INDEX_PATH = os.getenv("TX_INDEX_PATH", "./tx_index.sqlite3")
+TX_INDEX_RETAIN_BLOCKS = int(os.getenv("TX_INDEX_RETAIN_BLOCKS", 0))
+
+# MongoDB cache of the confirmed transaction history of the fetched addresses, compressed and stored
+# in chunks of ADDRESS_HISTORY_CHUNK_SIZE transactions, so a refresh only fetches the transactions
+# newer than the cached ones. The least recently read histories are evicted over the budget
+ADDRESS_HISTORY_CACHE_ENABLED = (
+    os.getenv("ADDRESS_HISTORY_CACHE_ENABLED", "True") == "True"
+)
+ADDRESS_HISTORY_CACHE_MAX_BYTES = int(
+    os.getenv("ADDRESS_HISTORY_CACHE_MAX_BYTES", 1024**3)
+)
+ADDRESS_HISTORY_CHUNK_SIZE = int(os.getenv("ADDRESS_HISTORY_CHUNK_SIZE", 500))
+
+# In-memory Bloom filter of the processed addresses, so the block worker skips the MongoDB lookup of
+# the addresses it has never processed. It is snapshotted to disk for fast restarts and catches up
+# with the addresses processed since the snapshot
+KNOWN_ADDRESS_FILTER_ENABLED = os.getenv("KNOWN_ADDRESS_FILTER_ENABLED", "True") == "True"
+KNOWN_ADDRESS_FILTER_PATH = os.getenv("KNOWN_ADDRESS_FILTER_PATH", "./known_addresses.bloom")
+KNOWN_ADDRESS_FILTER_CAPACITY = int(
+    os.getenv("KNOWN_ADDRESS_FILTER_CAPACITY", 10000000)
+)
+KNOWN_ADDRESS_FILTER_ERROR_RATE = float(
+    os.getenv("KNOWN_ADDRESS_FILTER_ERROR_RATE", 0.01)
+)
+KNOWN_ADDRESS_FILTER_SNAPSHOT_INTERVAL_S = float(
+    os.getenv("KNOWN_ADDRESS_FILTER_SNAPSHOT_INTERVAL_S", 600)
+)
+
+# Addresses seen in a large share of the recent blocks (exchanges, payment processors) are tracked
+# with a Space-Saving sketch. Instead of being refetched for every block they appear in, they are
+# refreshed by a separate task at most every HEAVY_HITTER_REFRESH_BLOCKS blocks. The capacity must
+# exceed the number of addresses per block divided by HEAVY_HITTER_MIN_SHARE
+HEAVY_HITTER_ENABLED = os.getenv("HEAVY_HITTER_ENABLED", "True") == "True"
+HEAVY_HITTER_CAPACITY = int(os.getenv("HEAVY_HITTER_CAPACITY", 50000))
+HEAVY_HITTER_WINDOW_BLOCKS = int(os.getenv("HEAVY_HITTER_WINDOW_BLOCKS", 144))
+HEAVY_HITTER_MIN_SHARE = float(os.getenv("HEAVY_HITTER_MIN_SHARE", 0.25))
+HEAVY_HITTER_MIN_BLOCKS = int(os.getenv("HEAVY_HITTER_MIN_BLOCKS", 12))
+HEAVY_HITTER_REFRESH_BLOCKS = int(os.getenv("HEAVY_HITTER_REFRESH_BLOCKS", 144))
+
+# Addresses with more than MAXIMUM_TRANSACTIONS transactions are scored from a sample of their
+# history: the most recent pages and pages spread across the older history, with the totals taken
+# from the exact address statistics. Their wallet data is flagged as approximate
+SAMPLED_HISTORY_ENABLED = os.getenv("SAMPLED_HISTORY_ENABLED", "False") == "True"
+SAMPLED_HISTORY_RECENT_PAGES = int(os.getenv("SAMPLED_HISTORY_RECENT_PAGES", 20))
+SAMPLED_HISTORY_STRATA = int(os.getenv("SAMPLED_HISTORY_STRATA", 20))
+
+# Addresses already scored that appear in a new block are marked dirty instead of being refetched
+# right away, and refreshed once REFRESH_WINDOW_BLOCKS blocks or REFRESH_WINDOW_S seconds after they
+# first became dirty, so a wallet active in consecutive blocks is rescored once per window. Addresses
+# never processed are still processed immediately
+REFRESH_SCHEDULER_ENABLED = os.getenv("REFRESH_SCHEDULER_ENABLED", "False") == "True"
+REFRESH_WINDOW_BLOCKS = int(os.getenv("REFRESH_WINDOW_BLOCKS", 6))
+REFRESH_WINDOW_S = float(os.getenv("REFRESH_WINDOW_S", 3600))
+REFRESH_SCHEDULER_POLL_S = float(os.getenv("REFRESH_SCHEDULER_POLL_S", 30))
+
+# Background refresh of the stale wallets with the spare upstream request budget. The wallets are
+# scanned by address in pages and ranked by a score adding up the stub status, the number of API
+# lookups, the highest risk of their neighbors and a constant, all but the stub status scaled by the
+# age of the data (saturating at STALENESS_REFRESH_AGE_HORIZON_S). The refreshes spend at most
+# STALENESS_REFRESH_BUDGET_SHARE of the request rate allowed by BLOCKSTREAM_RATE_LIMIT_MS and pause
+# while other requests are waiting
+STALENESS_REFRESH_ENABLED = os.getenv("STALENESS_REFRESH_ENABLED", "False") == "True"
+STALENESS_REFRESH_BUDGET_SHARE = float(os.getenv("STALENESS_REFRESH_BUDGET_SHARE", 0.25))
+STALENESS_REFRESH_PAGE_SIZE = int(os.getenv("STALENESS_REFRESH_PAGE_SIZE", 1000))
+STALENESS_REFRESH_PER_PAGE = int(os.getenv("STALENESS_REFRESH_PER_PAGE", 50))
+STALENESS_REFRESH_MIN_SCORE = float(os.getenv("STALENESS_REFRESH_MIN_SCORE", 1.0))
+STALENESS_REFRESH_MAX_NEIGHBORS = int(os.getenv("STALENESS_REFRESH_MAX_NEIGHBORS", 100))
+STALENESS_REFRESH_STUB_WEIGHT = float(os.getenv("STALENESS_REFRESH_STUB_WEIGHT", 2.0))
+STALENESS_REFRESH_QUERY_WEIGHT = float(os.getenv("STALENESS_REFRESH_QUERY_WEIGHT", 1.0))
+STALENESS_REFRESH_RISK_WEIGHT = float(os.getenv("STALENESS_REFRESH_RISK_WEIGHT", 2.0))
+STALENESS_REFRESH_AGE_WEIGHT = float(os.getenv("STALENESS_REFRESH_AGE_WEIGHT", 1.0))
+STALENESS_REFRESH_AGE_HORIZON_S = float(
+    os.getenv("STALENESS_REFRESH_AGE_HORIZON_S", 30 * 24 * 3600)
+)
+# Time between two passes over the whole graph, and between two checks while paused
+STALENESS_REFRESH_PASS_INTERVAL_S = float(
+    os.getenv("STALENESS_REFRESH_PASS_INTERVAL_S", 3600)
+)
+STALENESS_REFRESH_PAUSE_S = float(os.getenv("STALENESS_REFRESH_PAUSE_S", 5))
+
+# After a wallet is fetched interactively, its PREFETCH_NEIGHBORS stub neighbors with the largest
+# amounts transacted are fetched and scored in the background, while no other upstream traffic is
+# waiting. The prefetches queued for wallets older than the PREFETCH_MAX_ROOTS most recent ones are
+# cancelled. The hit rate counts the prefetched wallets looked up in the last PREFETCH_HIT_WINDOW_S
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "False") == "True"
+PREFETCH_NEIGHBORS = int(os.getenv("PREFETCH_NEIGHBORS", 5))
+PREFETCH_MAX_ROOTS = int(os.getenv("PREFETCH_MAX_ROOTS", 3))
+PREFETCH_HIT_WINDOW_S = float(os.getenv("PREFETCH_HIT_WINDOW_S", 24 * 3600))
+PREFETCH_PAUSE_S = float(os.getenv("PREFETCH_PAUSE_S", 1))
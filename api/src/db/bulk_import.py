@@ -0,0 +1,463 @@
+"""
+Offline bulk import of the wallet graph, for full history backfills.
+
+Wallets and connections are buffered in memory and written to sorted, deduplicated CSV shards on local
+disk. The shards are merged into one wallet file and one connection file, which are loaded either with
+`neo4j-admin database import full` into an empty store, or with LOAD CSV in batched transactions into a
+store that already has data. The files use the neo4j-admin header format, LOAD CSV reads the same files.
+
+BULK_IMPORT_DIR defaults to the bulk directory under the import directory docker-compose.yml mounts into
+the Neo4j container, which the server sees as BULK_IMPORT_NEO4J_URL. neo4j-admin needs the database
+stopped, so with BULK_IMPORT_NEO4J_ADMIN the worker stops once the files are merged into an empty store
+and logs the command to run, e.g. with `docker compose run --rm neo4j <command>` while the neo4j service
+is stopped; the worker loads whatever is left with LOAD CSV once restarted. The module can also be run
+directly, see `python -m src.db.bulk_import --help`, and bench/bulk_import.py checks a round trip against
+a local Neo4j container.
+"""
+
+import argparse
+import csv
+import heapq
+import logging
+import os
+from itertools import groupby
+from time import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from neo4j import Driver, GraphDatabase
+
+from src.config import (
+    BULK_IMPORT_BATCH_SIZE,
+    BULK_IMPORT_DIR,
+    BULK_IMPORT_NEO4J_URL,
+    BULK_IMPORT_SHARD_SIZE,
+    NEO4J_PASSWORD,
+    NEO4J_URI,
+    NEO4J_USERNAME,
+)
+from src.models import ConnectedWallets, ConnectionSummary, WalletData
+
+WALLETS_FILE = "wallets.csv"
+CONNECTIONS_FILE = "transacted_with.csv"
+WALLET_SHARD_PREFIX = "wallets-"
+CONNECTION_SHARD_PREFIX = "transacted_with-"
+ARRAY_DELIMITER = ";"
+
+WALLET_HEADER = [
+    "address:ID(Wallet)",
+    "features:double[]",
+    "class_inference:int",
+    "last_updated:long",
+    "is_populated:boolean",
+    "is_hub:boolean",
+    "inbound_degree:long",
+    "outbound_degree:long",
+    "inbound_volume:double",
+    "outbound_volume:double",
+]
+CONNECTION_HEADER = [
+    ":START_ID(Wallet)",
+    ":END_ID(Wallet)",
+    "num_transactions:int",
+    "amount_transacted:double",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class BulkGraphWriter:
+    """
+    Buffers wallets and connections and writes them to sorted, deduplicated CSV shards.
+
+    A wallet written more than once keeps its populated version over stubs, and its latest version
+    otherwise. A connection written more than once keeps its latest version.
+
+    The buffered rows are lost on a crash, so the progress they represent (the processed addresses
+    and the height of the last completed block) is only handed to on_flush once they are on disk.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        shard_size: int = BULK_IMPORT_SHARD_SIZE,
+        on_flush: Optional[Callable[[Dict[str, int], Optional[int]], None]] = None,
+    ):
+        """
+        Initialize the writer, shards already in the directory are kept and merged with the new ones.
+
+        Parameters:
+        - directory: The directory to write the shards and the merged files to
+        - shard_size: The number of buffered rows that triggers writing a shard
+        - on_flush: Called after a shard is written with the addresses processed since the previous
+          shard, mapped to the height they were processed up to, and the last completed block height
+        """
+        self.directory = directory
+        self.shard_size = shard_size
+        self.on_flush = on_flush
+        os.makedirs(directory, exist_ok=True)
+
+        self.wallet_rows: Dict[str, List[str]] = {}
+        self.connection_rows: Dict[Tuple[str, str], List[str]] = {}
+        self.processed_addresses: Dict[str, int] = {}
+        # Height of the last block whose wallets are all buffered or written
+        self.block_height: Optional[int] = None
+        self.num_shards = len(self._shard_paths(WALLET_SHARD_PREFIX))
+
+    def add_wallet(
+        self, wallet_data: WalletData, summary: Optional[ConnectionSummary] = None
+    ) -> None:
+        """
+        Add a populated wallet.
+
+        Parameters:
+        - wallet_data: The wallet data
+        - summary: The connection summary if the wallet is a hub
+        """
+        self.wallet_rows[wallet_data.address] = [
+            wallet_data.address,
+            ARRAY_DELIMITER.join(
+                repr(value) for value in wallet_data.to_feature_vector().tolist()
+            ),
+            str(wallet_data.class_inference),
+            str(wallet_data.last_updated),
+            "true",
+            "true" if summary is not None else "",
+            str(summary.inbound_degree) if summary is not None else "",
+            str(summary.outbound_degree) if summary is not None else "",
+            repr(summary.inbound_volume) if summary is not None else "",
+            repr(summary.outbound_volume) if summary is not None else "",
+        ]
+        self._flush_if_full()
+
+    def add_connected_wallets(
+        self, wallet_address: str, connected_wallets: ConnectedWallets
+    ) -> None:
+        """
+        Add the connections of a wallet, with stubs for the connected wallets.
+
+        Parameters:
+        - wallet_address: The address of the wallet
+        - connected_wallets: The connections to add
+        """
+        self._add_stub(wallet_address)
+        for direction, connections in (
+            ("inbound", connected_wallets.inbound_connections),
+            ("outbound", connected_wallets.outbound_connections),
+        ):
+            for address, details in connections.items():
+                self._add_stub(address)
+                key = (
+                    (address, wallet_address)
+                    if direction == "inbound"
+                    else (wallet_address, address)
+                )
+                self.connection_rows[key] = [
+                    key[0],
+                    key[1],
+                    str(details.num_transactions),
+                    repr(details.amount_transacted),
+                ]
+        self._flush_if_full()
+
+    def add_processed_address(self, address: str, height: int) -> None:
+        """
+        Record that an address was processed, once its wallet and connections are buffered.
+
+        Parameters:
+        - address: The address
+        - height: The block height the address was processed up to
+        """
+        self.processed_addresses[address] = height
+
+    def complete_block(self, height: int) -> None:
+        """
+        Record that the wallets of a block are all buffered.
+
+        Parameters:
+        - height: The height of the block
+        """
+        self.block_height = height
+
+    def flush(self) -> None:
+        """
+        Write the buffered rows to a new pair of shards, sorted by key, then checkpoint the progress.
+        """
+        if not self.wallet_rows and not self.connection_rows:
+            self._checkpoint()
+            return
+        self.num_shards += 1
+        shard = f"{self.num_shards:06d}.csv"
+        self._write_rows(
+            os.path.join(self.directory, WALLET_SHARD_PREFIX + shard),
+            WALLET_HEADER,
+            (self.wallet_rows[key] for key in sorted(self.wallet_rows)),
+        )
+        self._write_rows(
+            os.path.join(self.directory, CONNECTION_SHARD_PREFIX + shard),
+            CONNECTION_HEADER,
+            (self.connection_rows[key] for key in sorted(self.connection_rows)),
+        )
+        logger.info(
+            f"Wrote bulk import shard {self.num_shards} with {len(self.wallet_rows)} wallets "
+            f"and {len(self.connection_rows)} connections"
+        )
+        self.wallet_rows = {}
+        self.connection_rows = {}
+        self._checkpoint()
+
+    def merge_shards(self) -> Tuple[str, str]:
+        """
+        Flush the buffers and merge all the shards into one wallet file and one connection file,
+        deduplicating rows across shards. Merged files not loaded yet are merged in as the oldest
+        shard. The shards are deleted afterwards.
+
+        Returns:
+        - The paths of the wallet file and of the connection file
+        """
+        self.flush()
+        wallets_path = os.path.join(self.directory, WALLETS_FILE)
+        connections_path = os.path.join(self.directory, CONNECTIONS_FILE)
+
+        wallet_shards = self._shard_paths(WALLET_SHARD_PREFIX)
+        connection_shards = self._shard_paths(CONNECTION_SHARD_PREFIX)
+        # Merged files left by an import still to be loaded are the oldest shards
+        previous_wallets = [wallets_path] if os.path.exists(wallets_path) else []
+        previous_connections = (
+            [connections_path] if os.path.exists(connections_path) else []
+        )
+        self._write_rows(
+            wallets_path,
+            WALLET_HEADER,
+            _merge_sorted_shards(
+                previous_wallets + wallet_shards,
+                key=lambda row: row[0],
+                # Populated wallets win over stubs, then later shards win
+                priority=lambda row, shard: (row[4] == "true", shard),
+            ),
+        )
+        self._write_rows(
+            connections_path,
+            CONNECTION_HEADER,
+            _merge_sorted_shards(
+                previous_connections + connection_shards,
+                key=lambda row: (row[0], row[1]),
+                priority=lambda row, shard: shard,
+            ),
+        )
+        for path in wallet_shards + connection_shards:
+            os.remove(path)
+        self.num_shards = 0
+        return wallets_path, connections_path
+
+    def remove_merged_files(self) -> None:
+        """
+        Delete the merged files once they are loaded, so they are not merged into the next import.
+        """
+        for name in (WALLETS_FILE, CONNECTIONS_FILE):
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _checkpoint(self) -> None:
+        """
+        Hand the progress of the rows written so far to on_flush.
+        """
+        if self.on_flush is not None:
+            self.on_flush(self.processed_addresses, self.block_height)
+        self.processed_addresses = {}
+
+    def _add_stub(self, address: str) -> None:
+        """
+        Add a stub for a wallet not buffered yet, so every connection has both of its wallets.
+
+        Parameters:
+        - address: The address of the wallet
+        """
+        if address not in self.wallet_rows:
+            # In milliseconds, as timestamp() sets it on the stubs merged one by one
+            self.wallet_rows[address] = [
+                address,
+                "",
+                "",
+                str(int(time() * 1000)),
+                "false",
+            ] + [""] * 5
+
+    def _flush_if_full(self) -> None:
+        """
+        Write a shard once enough rows are buffered.
+        """
+        if len(self.wallet_rows) + len(self.connection_rows) >= self.shard_size:
+            self.flush()
+
+    def _shard_paths(self, prefix: str) -> List[str]:
+        """
+        Get the paths of the shards with a prefix, oldest first.
+
+        Parameters:
+        - prefix: The shard file prefix
+        """
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.startswith(prefix)
+        )
+
+    @staticmethod
+    def _write_rows(path: str, header: List[str], rows: Iterator[List[str]]) -> None:
+        """
+        Write CSV rows with a header, through a temporary file so readers never see a partial file.
+
+        Parameters:
+        - path: The path of the file
+        - header: The header row
+        - rows: The rows to write
+        """
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            writer.writerows(rows)
+        os.replace(temporary_path, path)
+
+
+def _merge_sorted_shards(paths: List[str], key, priority) -> Iterator[List[str]]:
+    """
+    Merge CSV shards sorted by key, keeping the row with the highest priority for each key.
+
+    Parameters:
+    - paths: The paths of the shards, oldest first
+    - key: A function of a row returning its sort key
+    - priority: A function of a row and its shard index returning its priority among duplicates
+    """
+    files = [open(path, newline="") for path in paths]
+    try:
+        readers = []
+        for shard, file in enumerate(files):
+            reader = csv.reader(file)
+            next(reader, None)  # Skip the header
+            readers.append(((key(row), shard, row) for row in reader))
+
+        for _, duplicates in groupby(
+            heapq.merge(*readers, key=lambda item: item[0]), key=lambda item: item[0]
+        ):
+            _, _, row = max(duplicates, key=lambda item: priority(item[2], item[1]))
+            yield row
+    finally:
+        for file in files:
+            file.close()
+
+
+def is_graph_empty(neo4j_driver: Driver) -> bool:
+    """
+    Check if the Neo4j database has no wallets yet, in which case neo4j-admin can import the files.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the query
+    """
+    with neo4j_driver.session() as session:
+        return session.run("MATCH (w:Wallet) RETURN w LIMIT 1").single() is None
+
+
+def load_with_cypher(
+    neo4j_driver: Driver,
+    base_url: str = BULK_IMPORT_NEO4J_URL,
+    batch_size: int = BULK_IMPORT_BATCH_SIZE,
+) -> None:
+    """
+    Load the merged files into a Neo4j database that may already have data, with LOAD CSV in batched
+    transactions. Existing populated wallets are only overwritten by populated rows.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the queries
+    - base_url: The URL of the directory of the merged files, as seen by the Neo4j server
+    - batch_size: The number of rows per transaction
+    """
+    base_url = base_url.rstrip("/")
+    wallets_query = f"""
+    LOAD CSV WITH HEADERS FROM $url AS row
+    CALL {{
+        WITH row
+        MERGE (w:Wallet {{address: row.`address:ID(Wallet)`}})
+        ON CREATE SET w.is_populated = false, w.last_updated = toInteger(row.`last_updated:long`)
+        FOREACH (_ IN CASE WHEN row.`is_populated:boolean` = 'true' THEN [1] ELSE [] END |
+            SET w.features = [value IN split(row.`features:double[]`, '{ARRAY_DELIMITER}') | toFloat(value)],
+                w.class_inference = toInteger(row.`class_inference:int`),
+                w.last_updated = toInteger(row.`last_updated:long`),
+                w.is_populated = true
+        )
+        FOREACH (_ IN CASE WHEN row.`is_hub:boolean` = 'true' THEN [1] ELSE [] END |
+            SET w.is_hub = true,
+                w.inbound_degree = toInteger(row.`inbound_degree:long`),
+                w.outbound_degree = toInteger(row.`outbound_degree:long`),
+                w.inbound_volume = toFloat(row.`inbound_volume:double`),
+                w.outbound_volume = toFloat(row.`outbound_volume:double`)
+        )
+    }} IN TRANSACTIONS OF {int(batch_size)} ROWS
+    """
+    connections_query = f"""
+    LOAD CSV WITH HEADERS FROM $url AS row
+    CALL {{
+        WITH row
+        MATCH (a:Wallet {{address: row.`:START_ID(Wallet)`}})
+        MATCH (b:Wallet {{address: row.`:END_ID(Wallet)`}})
+        MERGE (a)-[r:TRANSACTED_WITH]->(b)
+        SET r.num_transactions = toInteger(row.`num_transactions:int`),
+            r.amount_transacted = toFloat(row.`amount_transacted:double`)
+    }} IN TRANSACTIONS OF {int(batch_size)} ROWS
+    """
+    # CALL { } IN TRANSACTIONS must run in an auto-commit transaction
+    with neo4j_driver.session() as session:
+        session.run(wallets_query, url=f"{base_url}/{WALLETS_FILE}").consume()
+        logger.info("Loaded bulk import wallets")
+        session.run(connections_query, url=f"{base_url}/{CONNECTIONS_FILE}").consume()
+        logger.info("Loaded bulk import connections")
+
+
+def neo4j_admin_import_command(
+    directory: str = BULK_IMPORT_DIR, database: str = "neo4j"
+) -> List[str]:
+    """
+    Build the neo4j-admin command importing the merged files into an empty, stopped database.
+
+    Parameters:
+    - directory: The directory of the merged files, as seen by neo4j-admin
+    - database: The name of the database to import into
+
+    Returns:
+    - The command arguments
+    """
+    return [
+        "neo4j-admin",
+        "database",
+        "import",
+        "full",
+        f"--nodes=Wallet={os.path.join(directory, WALLETS_FILE)}",
+        f"--relationships=TRANSACTED_WITH={os.path.join(directory, CONNECTIONS_FILE)}",
+        f"--array-delimiter={ARRAY_DELIMITER}",
+        "--overwrite-destination",
+        database,
+    ]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "action",
+        choices=["merge", "load", "admin-command"],
+        help="merge the shards, load the merged files with LOAD CSV, or print the neo4j-admin command",
+    )
+    parser.add_argument("--directory", default=BULK_IMPORT_DIR)
+    args = parser.parse_args()
+
+    if args.action == "merge":
+        print(*BulkGraphWriter(args.directory).merge_shards(), sep="\n")
+    elif args.action == "load":
+        driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+        try:
+            load_with_cypher(driver)
+        finally:
+            driver.close()
+    else:
+        print(" ".join(neo4j_admin_import_command(args.directory)))
@@ -0,0 +1,266 @@
+import base64
+import json
+from typing import Dict, List, Optional, Tuple
+
+from neo4j import Driver
+from pymongo import MongoClient
+
+from src.config import HUB_CONNECTIONS_CHUNK_SIZE, HUB_DEGREE_THRESHOLD, HUB_TOP_K
+from src.db.mongodb import (
+    delete_hub_connections,
+    get_hub_connections_page,
+    set_hub_connections,
+)
+from src.db.neo4j import (
+    INBOUND,
+    OUTBOUND,
+    get_connections_page_from_db,
+    get_wallet_is_hub_from_db,
+    upsert_connected_wallets_in_db,
+)
+from src.models import (
+    ConnectedWallets,
+    ConnectionSummary,
+    ConnectionsPage,
+    WalletConnection,
+    WalletConnectionDetails,
+)
+
+
+def split_hub_connections(
+    connected_wallets: ConnectedWallets,
+    degree_threshold: int = HUB_DEGREE_THRESHOLD,
+    top_k: int = HUB_TOP_K,
+) -> Tuple[ConnectedWallets, Optional[Dict[str, List[WalletConnection]]]]:
+    """
+    Split the connections of a hub wallet into the top connections stored as edges and the full
+    connection lists, leaving the connections of other wallets untouched.
+
+    Parameters:
+    - connected_wallets: The connected wallets data of the wallet
+    - degree_threshold: The number of connections above which a wallet is a hub
+    - top_k: The number of connections per direction stored as edges for hubs
+
+    Returns:
+    - The connected wallets data to store as edges, with the summary set for hubs
+    - The full connection lists of a hub ordered by amount transacted, indexed by direction, None
+    if the wallet is not a hub
+    """
+    inbound = connected_wallets.inbound_connections
+    outbound = connected_wallets.outbound_connections
+    if len(inbound) + len(outbound) <= degree_threshold:
+        return connected_wallets, None
+
+    full_connections = {
+        INBOUND: _sorted_connections(inbound),
+        OUTBOUND: _sorted_connections(outbound),
+    }
+    top_connections = ConnectedWallets(
+        wallet_address=connected_wallets.wallet_address,
+        inbound_connections=_connection_details(full_connections[INBOUND][:top_k]),
+        outbound_connections=_connection_details(full_connections[OUTBOUND][:top_k]),
+        summary=ConnectionSummary(
+            inbound_degree=len(inbound),
+            outbound_degree=len(outbound),
+            inbound_volume=sum(details.amount_transacted for details in inbound.values()),
+            outbound_volume=sum(
+                details.amount_transacted for details in outbound.values()
+            ),
+        ),
+    )
+    return top_connections, full_connections
+
+
+def store_connected_wallets(
+    neo4j_driver: Driver,
+    mongo_client: MongoClient,
+    wallet_address: str,
+    connected_wallets: ConnectedWallets,
+) -> None:
+    """
+    Store the connected wallets data of a wallet. Hub wallets only get their top connections stored
+    as edges in Neo4j, their full connection lists are stored in MongoDB.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver instance
+    - mongo_client: The MongoDB client instance
+    - wallet_address: The address of the wallet
+    - connected_wallets: The connected wallets data to store
+    """
+    edge_connections, full_connections = split_hub_connections(connected_wallets)
+    store_hub_connections(mongo_client, wallet_address, full_connections)
+    upsert_connected_wallets_in_db(neo4j_driver, wallet_address, edge_connections)
+
+
+def store_hub_connections(
+    mongo_client: MongoClient,
+    wallet_address: str,
+    full_connections: Optional[Dict[str, List[WalletConnection]]],
+) -> None:
+    """
+    Store the full connection lists of a hub wallet in MongoDB, or delete them if the wallet is not
+    a hub (anymore).
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - wallet_address: The address of the wallet
+    - full_connections: The full connection lists returned by split_hub_connections
+    """
+    if full_connections is None:
+        delete_hub_connections(mongo_client, wallet_address)
+        return
+    for direction, connections in full_connections.items():
+        set_hub_connections(
+            mongo_client,
+            wallet_address,
+            direction,
+            connections,
+            HUB_CONNECTIONS_CHUNK_SIZE,
+        )
+
+
+def get_connections_page(
+    neo4j_driver: Driver,
+    mongo_client: MongoClient,
+    wallet_address: str,
+    direction: str,
+    cursor: Optional[str],
+    limit: int,
+) -> Optional[ConnectionsPage]:
+    """
+    Get a page of the full connection list of a wallet, ordered by amount transacted then address.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver instance
+    - mongo_client: The MongoDB client instance
+    - wallet_address: The address of the wallet
+    - direction: INBOUND for the wallets that sent Bitcoin to the wallet, OUTBOUND for the others
+    - cursor: The cursor returned with the previous page, None for the first page
+    - limit: The maximum number of connections in the page
+
+    Returns:
+    - The page of connections, None if the wallet is not in the database
+
+    Raises:
+    - ValueError: If the cursor is invalid or was issued for a different kind of wallet
+    """
+    is_hub = get_wallet_is_hub_from_db(neo4j_driver, wallet_address)
+    if is_hub is None:
+        return None
+
+    position = _decode_cursor(cursor)
+    if is_hub:
+        if position is not None and "i" not in position:
+            raise ValueError("Cursor does not belong to a hub wallet")
+        start_index = int(position["i"]) if position else 0
+        connections = get_hub_connections_page(
+            mongo_client, wallet_address, direction, start_index, limit
+        )
+        next_position = {"i": start_index + len(connections)}
+    else:
+        after = None
+        if position is not None:
+            if "a" not in position or "w" not in position:
+                raise ValueError("Cursor belongs to a hub wallet")
+            after = (float(position["a"]), str(position["w"]))
+        connections = get_connections_page_from_db(
+            neo4j_driver, wallet_address, direction, after, limit
+        )
+        next_position = (
+            {"a": connections[-1].amount_transacted, "w": connections[-1].address}
+            if connections
+            else None
+        )
+
+    return ConnectionsPage(
+        wallet_address=wallet_address,
+        direction=direction,
+        connections=connections,
+        next_cursor=(
+            _encode_cursor(next_position) if len(connections) == limit else None
+        ),
+    )
+
+
+def _sorted_connections(
+    connections: Dict[str, WalletConnectionDetails],
+) -> List[WalletConnection]:
+    """
+    Order connections by amount transacted, largest first, then by address.
+
+    Parameters:
+    - connections: The connection details, indexed by counterparty address
+    """
+    return [
+        WalletConnection(
+            address=address,
+            num_transactions=details.num_transactions,
+            amount_transacted=details.amount_transacted,
+        )
+        for address, details in sorted(
+            connections.items(), key=lambda item: (-item[1].amount_transacted, item[0])
+        )
+    ]
+
+
+def _connection_details(
+    connections: List[WalletConnection],
+) -> Dict[str, WalletConnectionDetails]:
+    """
+    Index connections by counterparty address.
+
+    Parameters:
+    - connections: The connections to index
+    """
+    return {
+        connection.address: WalletConnectionDetails(
+            num_transactions=connection.num_transactions,
+            amount_transacted=connection.amount_transacted,
+        )
+        for connection in connections
+    }
+
+
+def _encode_cursor(position: dict) -> str:
+    """
+    Encode a page position as an opaque cursor.
+
+    Parameters:
+    - position: The position of the next page
+    """
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[dict]:
+    """
+    Decode an opaque cursor into a page position.
+
+    Parameters:
+    - cursor: The cursor to decode, None for the first page
+
+    Raises:
+    - ValueError: If the cursor is invalid
+    """
+    if not cursor:
+        return None
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor")
+    # Hub cursors hold the index of the next connection, other cursors the amount and the address
+    # of the last connection. bool is a subclass of int, so it is excluded explicitly
+    if "i" in position:
+        index = position["i"]
+        if not isinstance(index, int) or isinstance(index, bool) or index < 0:
+            raise ValueError("Invalid cursor")
+    if "a" in position or "w" in position:
+        amount, address = position.get("a"), position.get("w")
+        if (
+            not isinstance(amount, (int, float))
+            or isinstance(amount, bool)
+            or not isinstance(address, str)
+        ):
+            raise ValueError("Invalid cursor")
+    return position
@@ -0,0 +1,322 @@
+"""
+Streaming export of the Wallet nodes and TRANSACTED_WITH edges as newline delimited JSON or Arrow
+IPC streams. Records are pulled from Neo4j through a server-side cursor and written out in
+batches, so memory use does not depend on the size of the graph.
+
+Also runnable from the api directory, e.g. `python -m src.db.export wallets -o wallets.ndjson`.
+"""
+
+import argparse
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+
+from neo4j import Driver, GraphDatabase
+
+from src.config import (
+    EXPORT_ARROW_BATCH_SIZE,
+    EXPORT_FETCH_SIZE,
+    NEO4J_PASSWORD,
+    NEO4J_URI,
+    NEO4J_USERNAME,
+)
+from src.db.neo4j import wallet_data_from_node
+from src.models import WALLET_FEATURE_NAMES, SubgraphEdge, WalletData
+from src.shared.conditional_requests import MILLISECONDS_THRESHOLD
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # Arrow export is optional
+    pyarrow = None
+
+EXPORT_FORMAT_NDJSON = "ndjson"
+EXPORT_FORMAT_ARROW = "arrow"
+EXPORT_MEDIA_TYPES = {
+    EXPORT_FORMAT_NDJSON: "application/x-ndjson",
+    EXPORT_FORMAT_ARROW: "application/vnd.apache.arrow.stream",
+}
+
+# Populated wallets are timestamped in seconds and stubs in milliseconds, the filters compare seconds
+_WALLET_FILTER = """
+    ($updated_since IS NULL OR
+        CASE WHEN {0}.last_updated > $millisecond_threshold THEN {0}.last_updated / 1000
+             ELSE {0}.last_updated END >= $updated_since)
+    AND ($is_populated IS NULL OR coalesce({0}.is_populated, false) = $is_populated)
+"""
+
+
+def iter_wallets(
+    neo4j_driver: Driver,
+    updated_since: Optional[int] = None,
+    is_populated: Optional[bool] = None,
+    fetch_size: int = EXPORT_FETCH_SIZE,
+) -> Iterator[WalletData]:
+    """
+    Iterate over the wallets in the Neo4j database.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the query
+    - updated_since: If set, only the wallets updated at or after this unix timestamp in seconds
+    - is_populated: If set, only the populated wallets (True) or only the stubs (False)
+    - fetch_size: The number of records pulled from the server at a time
+
+    Returns:
+    - An iterator over the wallet data
+    """
+    query = f"""
+    MATCH (w:Wallet)
+    WHERE {_WALLET_FILTER.format("w")}
+    RETURN w
+    """
+    with neo4j_driver.session(fetch_size=fetch_size) as session:
+        result = session.run(
+            query,
+            updated_since=updated_since,
+            is_populated=is_populated,
+            millisecond_threshold=MILLISECONDS_THRESHOLD,
+        )
+        for record in result:
+            yield wallet_data_from_node(record["w"])
+
+
+def iter_edges(
+    neo4j_driver: Driver,
+    updated_since: Optional[int] = None,
+    is_populated: Optional[bool] = None,
+    fetch_size: int = EXPORT_FETCH_SIZE,
+) -> Iterator[SubgraphEdge]:
+    """
+    Iterate over the TRANSACTED_WITH edges in the Neo4j database. A fetched wallet writes both its
+    outbound and its inbound edges, so an edge may have been written by either of its wallets, and
+    the edges kept are the ones with at least one wallet matching all the filters.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the query
+    - updated_since: If set, only the edges of wallets updated at or after this unix timestamp in seconds
+    - is_populated: If set, only the edges of populated (True) or stub (False) wallets
+    - fetch_size: The number of records pulled from the server at a time
+
+    Returns:
+    - An iterator over the edges
+    """
+    query = f"""
+    MATCH (w:Wallet)-[r:TRANSACTED_WITH]->(cw:Wallet)
+    WHERE any(endpoint IN [w, cw] WHERE {_WALLET_FILTER.format("endpoint")})
+    RETURN w.address AS source,
+           cw.address AS target,
+           coalesce(r.num_transactions, 0) AS num_transactions,
+           coalesce(r.amount_transacted, 0.0) AS amount_transacted
+    """
+    with neo4j_driver.session(fetch_size=fetch_size) as session:
+        result = session.run(
+            query,
+            updated_since=updated_since,
+            is_populated=is_populated,
+            millisecond_threshold=MILLISECONDS_THRESHOLD,
+        )
+        for record in result:
+            yield SubgraphEdge(**record.data())
+
+
+def wallets_to_ndjson(wallets: Iterator[WalletData]) -> Iterator[bytes]:
+    """
+    Encode wallets as newline delimited JSON, one line per wallet.
+
+    Parameters:
+    - wallets: The wallets to encode
+    """
+    for wallet_data in wallets:
+        yield wallet_data.model_dump_json().encode() + b"\n"
+
+
+def edges_to_ndjson(edges: Iterator[SubgraphEdge]) -> Iterator[bytes]:
+    """
+    Encode edges as newline delimited JSON, one line per edge.
+
+    Parameters:
+    - edges: The edges to encode
+    """
+    for edge in edges:
+        yield edge.model_dump_json().encode() + b"\n"
+
+
+def wallets_to_arrow(
+    wallets: Iterator[WalletData], batch_size: int = EXPORT_ARROW_BATCH_SIZE
+) -> Iterator[bytes]:
+    """
+    Encode wallets as an Arrow IPC stream with one float64 column per feature.
+
+    Parameters:
+    - wallets: The wallets to encode
+    - batch_size: The number of wallets per record batch
+
+    Raises:
+    - RuntimeError: If pyarrow is not installed
+    """
+    _require_pyarrow()
+    schema = pyarrow.schema(
+        [
+            ("address", pyarrow.string()),
+            ("class_inference", pyarrow.int64()),
+            ("last_updated", pyarrow.int64()),
+            ("is_populated", pyarrow.bool_()),
+            ("risk_score", pyarrow.float64()),
+        ]
+        + [(name, pyarrow.float64()) for name in WALLET_FEATURE_NAMES]
+    )
+    return _to_arrow(
+        schema,
+        (wallet_data.model_dump(include=set(schema.names)) for wallet_data in wallets),
+        batch_size,
+    )
+
+
+def edges_to_arrow(
+    edges: Iterator[SubgraphEdge], batch_size: int = EXPORT_ARROW_BATCH_SIZE
+) -> Iterator[bytes]:
+    """
+    Encode edges as an Arrow IPC stream.
+
+    Parameters:
+    - edges: The edges to encode
+    - batch_size: The number of edges per record batch
+
+    Raises:
+    - RuntimeError: If pyarrow is not installed
+    """
+    _require_pyarrow()
+    schema = pyarrow.schema(
+        [
+            ("source", pyarrow.string()),
+            ("target", pyarrow.string()),
+            ("num_transactions", pyarrow.int64()),
+            ("amount_transacted", pyarrow.float64()),
+        ]
+    )
+    return _to_arrow(schema, (edge.model_dump() for edge in edges), batch_size)
+
+
+def _require_pyarrow() -> None:
+    """
+    Raises:
+    - RuntimeError: If pyarrow is not installed
+    """
+    if pyarrow is None:
+        raise RuntimeError("Arrow export requires pyarrow to be installed")
+
+
+class _ChunkSink:
+    """
+    A write-only file collecting what the Arrow stream writer writes, so it can be yielded.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _to_arrow(
+    schema: "pyarrow.Schema", rows: Iterator[Dict[str, Any]], batch_size: int
+) -> Iterator[bytes]:
+    """
+    Encode rows as an Arrow IPC stream, one record batch per batch_size rows.
+
+    Parameters:
+    - schema: The schema of the stream
+    - rows: The rows to encode, as dictionaries indexed by column name
+    - batch_size: The number of rows per record batch
+    """
+    sink = _ChunkSink()
+    writer = pyarrow.ipc.new_stream(sink, schema)
+    batch: List[Dict[str, Any]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            writer.write_batch(pyarrow.RecordBatch.from_pylist(batch, schema=schema))
+            batch = []
+            yield sink.take()
+    if batch:
+        writer.write_batch(pyarrow.RecordBatch.from_pylist(batch, schema=schema))
+    writer.close()
+    yield sink.take()
+
+
+def export(
+    neo4j_driver: Driver,
+    kind: str,
+    export_format: str = EXPORT_FORMAT_NDJSON,
+    updated_since: Optional[int] = None,
+    is_populated: Optional[bool] = None,
+) -> Iterator[bytes]:
+    """
+    Export the wallets or the edges of the graph.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the query
+    - kind: "wallets" or "edges"
+    - export_format: EXPORT_FORMAT_NDJSON or EXPORT_FORMAT_ARROW
+    - updated_since: If set, only the wallets, or the edges of wallets, updated at or after this unix
+    timestamp in seconds
+    - is_populated: If set, only the populated wallets or the stubs, or their edges
+
+    Returns:
+    - An iterator over the encoded chunks
+
+    Raises:
+    - RuntimeError: If the Arrow format is requested and pyarrow is not installed
+    """
+    if export_format == EXPORT_FORMAT_ARROW:
+        _require_pyarrow()
+    if kind == "wallets":
+        records = iter_wallets(neo4j_driver, updated_since, is_populated)
+        if export_format == EXPORT_FORMAT_ARROW:
+            return wallets_to_arrow(records)
+        return wallets_to_ndjson(records)
+    records = iter_edges(neo4j_driver, updated_since, is_populated)
+    if export_format == EXPORT_FORMAT_ARROW:
+        return edges_to_arrow(records)
+    return edges_to_ndjson(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("kind", choices=["wallets", "edges"])
+    parser.add_argument(
+        "--format",
+        choices=[EXPORT_FORMAT_NDJSON, EXPORT_FORMAT_ARROW],
+        default=EXPORT_FORMAT_NDJSON,
+    )
+    parser.add_argument("--updated-since", type=int, default=None)
+    populated = parser.add_mutually_exclusive_group()
+    populated.add_argument("--populated", dest="is_populated", action="store_true")
+    populated.add_argument("--stubs", dest="is_populated", action="store_false")
+    parser.set_defaults(is_populated=None)
+    parser.add_argument("-o", "--output", default=None, help="defaults to stdout")
+    args = parser.parse_args()
+
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in export(
+            driver, args.kind, args.format, args.updated_since, args.is_populated
+        ):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+        driver.close()
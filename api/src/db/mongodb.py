@@ -1,17 +1,44 @@
-from typing import Optional
-from pydantic import ValidationError
-from pymongo import ASCENDING, DESCENDING, MongoClient
-from pymongo.errors import PyMongoError
+from time import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from bson import Binary, ObjectId
+from pydantic import TypeAdapter, ValidationError
+from pymongo import ASCENDING, DESCENDING, MongoClient, UpdateOne
+from pymongo.errors import CollectionInvalid, PyMongoError
 import logging
+import zlib
 
-from src.models import BitcoinAddressQueryResponse, Transaction
+from src.config import WALLET_CHANGES_MAX_BYTES
+from src.models import (
+    SCORING_JOB_ACTIVE_STATUSES,
+    BitcoinAddressQueryResponse,
+    ScoringJob,
+    Transaction,
+    WalletConnection,
+)
 
 API_CACHE_DB = "api_cache"
 ADDRESS_COLLECTION = "addresses"
 METADATA_COLLECTION = "metadata"
+HUB_CONNECTIONS_COLLECTION = "hub_connections"
+WALLET_CHANGES_COLLECTION = "wallet_changes"
+SCORING_JOBS_COLLECTION = "scoring_jobs"
+ADDRESS_HISTORY_COLLECTION = "address_histories"
+ADDRESS_HISTORY_CHUNKS_COLLECTION = "address_history_chunks"
+WALLET_QUERIES_COLLECTION = "wallet_queries"
 
 ADDRESS_NEVER_PROCESSED = -1
 
+try:
+    import zstandard
+except ImportError:  # zstd compression of the address histories is optional
+    zstandard = None
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+# Chunks are kept well under the 16MB BSON document limit
+MAXIMUM_CHUNK_BYTES = 15 * 1024 * 1024
+TRANSACTIONS_ADAPTER = TypeAdapter(List[Transaction])
+
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +60,65 @@ def set_up_database(mongo_client: MongoClient) -> None:
     if metadata.count_documents({"_id": "last_processed_block_height"}) == 0:
         metadata.insert_one({"_id": "last_processed_block_height", "height": 0})
 
+    # The known address filter catches up with the addresses processed since its snapshot
+    db[ADDRESS_COLLECTION].create_index([("updated_at", ASCENDING)])
+    # The block worker restores the addresses waiting for a deferred refresh on start
+    db[ADDRESS_COLLECTION].create_index(
+        [("dirty_since_height", ASCENDING)], sparse=True
+    )
+
+    # Hub connection chunks are looked up by the range of connections they hold
+    db[HUB_CONNECTIONS_COLLECTION].create_index(
+        [("address", ASCENDING), ("direction", ASCENDING), ("end", ASCENDING)]
+    )
+
+    # Active jobs are looked up by address to share them between requests
+    db[SCORING_JOBS_COLLECTION].create_index(
+        [("address", ASCENDING), ("status", ASCENDING)]
+    )
+
+    # Address history chunks are read by id, the address finds the chunks of unversioned histories,
+    # the least recently read histories are evicted first
+    db[ADDRESS_HISTORY_CHUNKS_COLLECTION].create_index(
+        [("address", ASCENDING), ("seq", ASCENDING)]
+    )
+    db[ADDRESS_HISTORY_COLLECTION].create_index([("last_accessed_at", ASCENDING)])
+
+    # The prefetch hit rate is computed over the recent prefetches
+    db[WALLET_QUERIES_COLLECTION].create_index(
+        [("prefetched_at", ASCENDING)], sparse=True
+    )
+
+    set_up_wallet_changes_collection(mongo_client)
+
+
+def set_up_wallet_changes_collection(mongo_client: MongoClient) -> None:
+    """
+    Make sure the wallet changes collection is capped, creating it if needed. Run on every start,
+    whether or not the rest of the database is set up, as the first insert would otherwise create
+    an uncapped collection growing with every processed wallet.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    """
+    db = mongo_client[API_CACHE_DB]
+    # The change feed only needs to hold the changes the API instances have not read yet
+    try:
+        db.create_collection(
+            WALLET_CHANGES_COLLECTION, capped=True, size=WALLET_CHANGES_MAX_BYTES
+        )
+        return
+    except CollectionInvalid:
+        pass  # Already created, possibly by another instance
+
+    options = db[WALLET_CHANGES_COLLECTION].options()
+    if not options.get("capped"):
+        # Created uncapped by an insert before this was run, converting keeps the latest changes
+        logger.warning("Converting the wallet changes collection to a capped collection")
+        db.command(
+            "convertToCapped", WALLET_CHANGES_COLLECTION, size=WALLET_CHANGES_MAX_BYTES
+        )
+
 
 def set_address_last_processed_block_height(
     mongo_client: MongoClient, address: str, height: int
@@ -49,11 +135,44 @@ def set_address_last_processed_block_height(
     addresses = db[ADDRESS_COLLECTION]
     addresses.update_one(
         {"_id": address},
-        {"$set": {"last_processed_height": height}},
+        {
+            "$set": {"last_processed_height": height, "updated_at": time()},
+            "$unset": {"dirty_since_height": ""},
+        },
         upsert=True,
     )
 
 
+def set_addresses_last_processed_block_height(
+    mongo_client: MongoClient, heights: Dict[str, int]
+) -> None:
+    """
+    Set the last processed block height of many addresses in the database.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - heights: The block height to set for each Bitcoin address
+    """
+    if not heights:
+        return
+    db = mongo_client[API_CACHE_DB]
+    updated_at = time()
+    db[ADDRESS_COLLECTION].bulk_write(
+        [
+            UpdateOne(
+                {"_id": address},
+                {
+                    "$set": {"last_processed_height": height, "updated_at": updated_at},
+                    "$unset": {"dirty_since_height": ""},
+                },
+                upsert=True,
+            )
+            for address, height in heights.items()
+        ],
+        ordered=False,
+    )
+
+
 def get_address_last_processed_block_height(
     mongo_client: MongoClient, address: str
 ) -> int:
@@ -76,6 +195,99 @@ def get_address_last_processed_block_height(
         return ADDRESS_NEVER_PROCESSED
 
 
+def iter_processed_addresses(
+    mongo_client: MongoClient,
+    updated_since: Optional[float] = None,
+    batch_size: int = 10000,
+) -> Iterator[str]:
+    """
+    Iterate over the processed addresses, streamed from the database in batches.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - updated_since: If set, only the addresses processed at or after this unix timestamp
+    - batch_size: The number of addresses fetched from the server at a time
+
+    Returns:
+    - An iterator over the addresses
+    """
+    db = mongo_client[API_CACHE_DB]
+    query = {"updated_at": {"$gte": updated_since}} if updated_since is not None else {}
+    for document in db[ADDRESS_COLLECTION].find(query, {"_id": 1}, batch_size=batch_size):
+        yield document["_id"]
+
+
+def count_processed_addresses(mongo_client: MongoClient) -> int:
+    """
+    Estimate the number of processed addresses from the collection metadata.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    """
+    db = mongo_client[API_CACHE_DB]
+    return db[ADDRESS_COLLECTION].estimated_document_count()
+
+
+def mark_addresses_dirty(
+    mongo_client: MongoClient, addresses: List[str], height: int
+) -> None:
+    """
+    Record that processed addresses appeared in a block and wait for a deferred refresh, so the
+    refreshes survive a restart. An address keeps the height of the first block it is dirty since.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - addresses: The Bitcoin addresses
+    - height: The height of the block
+    """
+    if not addresses:
+        return
+    db = mongo_client[API_CACHE_DB]
+    db[ADDRESS_COLLECTION].bulk_write(
+        [
+            UpdateOne({"_id": address}, {"$min": {"dirty_since_height": height}})
+            for address in addresses
+        ],
+        ordered=False,
+    )
+
+
+def clear_address_dirty(
+    mongo_client: MongoClient, address: str, dirty_since_height: int
+) -> None:
+    """
+    Record that a dirty address no longer waits for a refresh, e.g. as it was refreshed meanwhile
+    by an interactive request.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - address: Bitcoin address
+    - dirty_since_height: The height of the block the address was dirty since
+    """
+    db = mongo_client[API_CACHE_DB]
+    db[ADDRESS_COLLECTION].update_one(
+        {"_id": address, "dirty_since_height": dirty_since_height},
+        {"$unset": {"dirty_since_height": ""}},
+    )
+
+
+def get_dirty_addresses(mongo_client: MongoClient) -> List[Tuple[str, int]]:
+    """
+    Get the addresses waiting for a deferred refresh.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+
+    Returns:
+    - The addresses with the height of the block they are dirty since, oldest first
+    """
+    db = mongo_client[API_CACHE_DB]
+    documents = db[ADDRESS_COLLECTION].find(
+        {"dirty_since_height": {"$exists": True}}, {"dirty_since_height": 1}
+    ).sort("dirty_since_height", ASCENDING)
+    return [(document["_id"], document["dirty_since_height"]) for document in documents]
+
+
 def get_last_processed_block_height(mongo_client: MongoClient) -> int:
     """
     Get the last processed block height from the database.
@@ -110,3 +322,774 @@ def set_last_processed_block_height(mongo_client: MongoClient, height: int) -> N
         {"$set": {"height": height}},
         upsert=True,
     )
+
+
+def get_staleness_refresh_cursor(mongo_client: MongoClient) -> str:
+    """
+    Get the address the staleness refresh scan resumes after.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+
+    Returns:
+    - The address, "" to start from the first wallet
+    """
+    db = mongo_client[API_CACHE_DB]
+    document = db[METADATA_COLLECTION].find_one({"_id": "staleness_refresh_cursor"})
+    return document["after"] if document else ""
+
+
+def set_staleness_refresh_cursor(mongo_client: MongoClient, after: str) -> None:
+    """
+    Set the address the staleness refresh scan resumes after.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - after: The address, "" to start from the first wallet
+    """
+    db = mongo_client[API_CACHE_DB]
+    db[METADATA_COLLECTION].update_one(
+        {"_id": "staleness_refresh_cursor"}, {"$set": {"after": after}}, upsert=True
+    )
+
+
+def add_wallet_query_counts(
+    mongo_client: MongoClient, query_counts: Dict[str, int], queried_at: float
+) -> None:
+    """
+    Add to the number of times wallets were looked up through the API.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - query_counts: The number of lookups of each wallet address since the last flush
+    - queried_at: The unix timestamp of the flush
+    """
+    if not query_counts:
+        return
+    db = mongo_client[API_CACHE_DB]
+    db[WALLET_QUERIES_COLLECTION].bulk_write(
+        [
+            UpdateOne(
+                {"_id": address},
+                {"$inc": {"query_count": count}, "$set": {"last_queried_at": queried_at}},
+                upsert=True,
+            )
+            for address, count in query_counts.items()
+        ],
+        ordered=False,
+    )
+
+
+def get_wallet_query_counts(
+    mongo_client: MongoClient, addresses: List[str]
+) -> Dict[str, int]:
+    """
+    Get the number of times wallets were looked up through the API.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - addresses: The wallet addresses
+
+    Returns:
+    - The number of lookups of the addresses looked up at least once
+    """
+    db = mongo_client[API_CACHE_DB]
+    documents = db[WALLET_QUERIES_COLLECTION].find(
+        {"_id": {"$in": addresses}}, {"query_count": 1}
+    )
+    return {document["_id"]: document["query_count"] for document in documents}
+
+
+def set_wallet_prefetched_at(
+    mongo_client: MongoClient, address: str, prefetched_at: float
+) -> None:
+    """
+    Record that a wallet was prefetched, to tell whether a later lookup was served warm.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - address: The wallet address
+    - prefetched_at: The unix timestamp of the prefetch
+    """
+    db = mongo_client[API_CACHE_DB]
+    db[WALLET_QUERIES_COLLECTION].update_one(
+        {"_id": address}, {"$set": {"prefetched_at": prefetched_at}}, upsert=True
+    )
+
+
+def count_prefetch_hits(mongo_client: MongoClient, since: float) -> Tuple[int, int]:
+    """
+    Count the wallets prefetched since a time, and the ones among them looked up after their
+    prefetch.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - since: The unix timestamp the prefetches are counted from
+
+    Returns:
+    - The number of prefetched wallets and the number of them looked up since
+    """
+    db = mongo_client[API_CACHE_DB]
+    query = {"prefetched_at": {"$gte": since}}
+    prefetched = db[WALLET_QUERIES_COLLECTION].count_documents(query)
+    hits = db[WALLET_QUERIES_COLLECTION].count_documents(
+        {**query, "$expr": {"$gte": ["$last_queried_at", "$prefetched_at"]}}
+    )
+    return prefetched, hits
+
+
+def set_hub_connections(
+    mongo_client: MongoClient,
+    address: str,
+    direction: str,
+    connections: List[WalletConnection],
+    chunk_size: int,
+) -> None:
+    """
+    Replace the full connection list of a hub wallet in one direction, stored in chunks.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - address: Bitcoin address of the hub wallet
+    - direction: The direction of the connections, "inbound" or "outbound"
+    - connections: The connections, ordered by amount transacted then address
+    - chunk_size: The number of connections per document
+    """
+    db = mongo_client[API_CACHE_DB]
+    hub_connections = db[HUB_CONNECTIONS_COLLECTION]
+    hub_connections.delete_many({"address": address, "direction": direction})
+    if not connections:
+        return
+    hub_connections.insert_many(
+        [
+            {
+                "_id": f"{address}:{direction}:{start}",
+                "address": address,
+                "direction": direction,
+                "start": start,
+                "end": min(start + chunk_size, len(connections)),
+                "connections": [
+                    [
+                        connection.address,
+                        connection.num_transactions,
+                        connection.amount_transacted,
+                    ]
+                    for connection in connections[start : start + chunk_size]
+                ],
+            }
+            for start in range(0, len(connections), chunk_size)
+        ]
+    )
+
+
+def delete_hub_connections(mongo_client: MongoClient, address: str) -> None:
+    """
+    Delete the stored connection lists of a wallet that is no longer a hub.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - address: Bitcoin address of the wallet
+    """
+    db = mongo_client[API_CACHE_DB]
+    db[HUB_CONNECTIONS_COLLECTION].delete_many({"address": address})
+
+
+def get_hub_connections_page(
+    mongo_client: MongoClient,
+    address: str,
+    direction: str,
+    start_index: int,
+    limit: int,
+) -> List[WalletConnection]:
+    """
+    Get a page of the stored connection list of a hub wallet.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - address: Bitcoin address of the hub wallet
+    - direction: The direction of the connections, "inbound" or "outbound"
+    - start_index: The index of the first connection of the page in the full list
+    - limit: The maximum number of connections in the page
+
+    Returns:
+    - The connections in the page
+    """
+    db = mongo_client[API_CACHE_DB]
+    documents = db[HUB_CONNECTIONS_COLLECTION].find(
+        {"address": address, "direction": direction, "end": {"$gt": start_index}}
+    ).sort("end", ASCENDING)
+
+    page = []
+    for document in documents:
+        offset = max(start_index - document["start"], 0)
+        for connected_address, num_transactions, amount_transacted in document[
+            "connections"
+        ][offset:]:
+            page.append(
+                WalletConnection(
+                    address=connected_address,
+                    num_transactions=num_transactions,
+                    amount_transacted=amount_transacted,
+                )
+            )
+            if len(page) == limit:
+                return page
+    return page
+
+
+def add_wallet_changes(mongo_client: MongoClient, addresses: List[str]) -> None:
+    """
+    Record that the data of wallets changed, for the API instances to invalidate their caches.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - addresses: Bitcoin addresses of the changed wallets
+    """
+    if not addresses:
+        return
+    db = mongo_client[API_CACHE_DB]
+    changed_at = time()
+    db[WALLET_CHANGES_COLLECTION].insert_many(
+        [{"address": address, "changed_at": changed_at} for address in addresses],
+        ordered=False,
+    )
+
+
+def get_latest_wallet_change_id(mongo_client: MongoClient) -> Optional[ObjectId]:
+    """
+    Get the id of the latest wallet change.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+
+    Returns:
+    - The id of the latest change, None if there are no changes
+    """
+    db = mongo_client[API_CACHE_DB]
+    document = db[WALLET_CHANGES_COLLECTION].find_one(
+        {}, {"_id": 1}, sort=[("_id", DESCENDING)]
+    )
+    return document["_id"] if document else None
+
+
+def has_wallet_change(mongo_client: MongoClient, change_id: ObjectId) -> bool:
+    """
+    Check if a wallet change is still in the change feed, changes are dropped once the feed is full.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - change_id: The id of the change
+    """
+    db = mongo_client[API_CACHE_DB]
+    return db[WALLET_CHANGES_COLLECTION].find_one({"_id": change_id}, {"_id": 1}) is not None
+
+
+def get_wallet_changes_after(
+    mongo_client: MongoClient, after_id: Optional[ObjectId], limit: int
+) -> List[dict]:
+    """
+    Get the wallet changes recorded after a change, oldest first.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - after_id: The id of the last change read, None to read from the start of the feed
+    - limit: The maximum number of changes to return
+
+    Returns:
+    - The change documents, with the address and changed_at fields
+    """
+    db = mongo_client[API_CACHE_DB]
+    query = {"_id": {"$gt": after_id}} if after_id is not None else {}
+    return list(
+        db[WALLET_CHANGES_COLLECTION].find(query).sort("_id", ASCENDING).limit(limit)
+    )
+
+
+def insert_scoring_job(mongo_client: MongoClient, job: ScoringJob) -> None:
+    """
+    Insert a new scoring job.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - job: The scoring job
+    """
+    db = mongo_client[API_CACHE_DB]
+    db[SCORING_JOBS_COLLECTION].insert_one({"_id": job.job_id, **job.model_dump()})
+
+
+def update_scoring_job(mongo_client: MongoClient, job_id: str, **fields) -> None:
+    """
+    Update fields of a scoring job.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - job_id: The identifier of the job
+    - fields: The fields to set
+    """
+    db = mongo_client[API_CACHE_DB]
+    db[SCORING_JOBS_COLLECTION].update_one({"_id": job_id}, {"$set": fields})
+
+
+def get_scoring_job(mongo_client: MongoClient, job_id: str) -> Optional[ScoringJob]:
+    """
+    Get a scoring job.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - job_id: The identifier of the job
+
+    Returns:
+    - The scoring job, None if not found
+    """
+    db = mongo_client[API_CACHE_DB]
+    document = db[SCORING_JOBS_COLLECTION].find_one({"_id": job_id})
+    return ScoringJob.model_validate(document) if document else None
+
+
+def get_active_scoring_job(
+    mongo_client: MongoClient, address: str
+) -> Optional[ScoringJob]:
+    """
+    Get the pending or running scoring job of a wallet.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - address: Bitcoin address of the wallet
+
+    Returns:
+    - The active scoring job, None if there is none
+    """
+    db = mongo_client[API_CACHE_DB]
+    document = db[SCORING_JOBS_COLLECTION].find_one(
+        {"address": address, "status": {"$in": SCORING_JOB_ACTIVE_STATUSES}}
+    )
+    return ScoringJob.model_validate(document) if document else None
+
+
+def get_active_scoring_jobs(mongo_client: MongoClient) -> List[ScoringJob]:
+    """
+    Get every pending or running scoring job, oldest first.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    """
+    db = mongo_client[API_CACHE_DB]
+    documents = (
+        db[SCORING_JOBS_COLLECTION]
+        .find({"status": {"$in": SCORING_JOB_ACTIVE_STATUSES}})
+        .sort("created_at", ASCENDING)
+    )
+    return [ScoringJob.model_validate(document) for document in documents]
+
+
+def _compress_transactions(transactions: List[Transaction]) -> Tuple[str, bytes]:
+    """
+    Encode transactions as JSON and compress them with zstd, or zlib if zstandard is not installed.
+
+    Parameters:
+    - transactions: The transactions to compress
+
+    Returns:
+    - The codec used and the compressed data
+    """
+    data = TRANSACTIONS_ADAPTER.dump_json(transactions)
+    if zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor().compress(data)
+    return CODEC_ZLIB, zlib.compress(data)
+
+
+def _decompress_transactions(codec: str, data: bytes) -> List[Transaction]:
+    """
+    Decompress and decode transactions compressed by _compress_transactions.
+
+    Parameters:
+    - codec: The codec the transactions were compressed with
+    - data: The compressed data
+
+    Raises:
+    - ValueError: If the codec is not available
+    """
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError(
+                "The history was compressed with zstd, zstandard is not installed"
+            )
+        data = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        data = zlib.decompress(data)
+    return TRANSACTIONS_ADAPTER.validate_json(data)
+
+
+def _address_history_chunks(
+    address: str, transactions: List[Transaction], first_seq: int, chunk_size: int
+) -> List[dict]:
+    """
+    Split transactions, oldest first, into compressed chunk documents. Every chunk gets a new id,
+    so a write never touches the chunks a reader may be reading.
+
+    Parameters:
+    - address: Bitcoin address of the history
+    - transactions: The transactions, oldest first
+    - first_seq: The sequence number of the first chunk
+    - chunk_size: The number of transactions per chunk
+
+    Raises:
+    - ValueError: If a compressed chunk is too large for a document
+    """
+    chunks = []
+    for start in range(0, len(transactions), chunk_size):
+        seq = first_seq + start // chunk_size
+        chunk_transactions = transactions[start : start + chunk_size]
+        codec, data = _compress_transactions(chunk_transactions)
+        if len(data) > MAXIMUM_CHUNK_BYTES:
+            raise ValueError(f"Chunk {seq} of the history of {address} is too large")
+        chunks.append(
+            {
+                "_id": ObjectId(),
+                "address": address,
+                "seq": seq,
+                "count": len(chunk_transactions),
+                "codec": codec,
+                "data": Binary(data),
+            }
+        )
+    return chunks
+
+
+def _update_address_history_bytes(mongo_client: MongoClient, delta: int) -> None:
+    """
+    Update the total size of the cached address histories.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - delta: The number of bytes added, negative if bytes were removed
+    """
+    if delta == 0:
+        return
+    db = mongo_client[API_CACHE_DB]
+    try:
+        db[METADATA_COLLECTION].update_one(
+            {"_id": "address_history_bytes"}, {"$inc": {"bytes": delta}}, upsert=True
+        )
+    except PyMongoError as e:
+        logger.error(f"Error updating the size of the cached address histories: {e}")
+
+
+def get_address_history(
+    mongo_client: MongoClient, address: str
+) -> Optional[List[Transaction]]:
+    """
+    Get the cached confirmed transaction history of an address, and mark it as accessed.
+
+    The history document lists the ids of its chunks and carries a version replaced by every write,
+    so a history rewritten while it is read is reported as not cached rather than deleted.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - address: Bitcoin address
+
+    Returns:
+    - The transactions, newest first, None if the history is not cached
+    """
+    db = mongo_client[API_CACHE_DB]
+    try:
+        history = db[ADDRESS_HISTORY_COLLECTION].find_one_and_update(
+            {"_id": address}, {"$set": {"last_accessed_at": time()}}
+        )
+        if history is None:
+            return None
+        if "chunk_ids" not in history:
+            # Written before the histories were versioned
+            _delete_address_history_version(
+                mongo_client, address, history.get("version")
+            )
+            return None
+        chunks = {
+            chunk["_id"]: chunk
+            for chunk in db[ADDRESS_HISTORY_CHUNKS_COLLECTION].find(
+                {"_id": {"$in": history["chunk_ids"]}}
+            )
+        }
+    except PyMongoError as e:
+        logger.error(f"Error reading the cached history of {address}: {e}")
+        return None
+    if len(chunks) != len(history["chunk_ids"]):
+        return None  # Rewritten meanwhile, its old chunks are gone
+
+    transactions = []
+    try:
+        for chunk_id in history["chunk_ids"]:
+            chunk = chunks[chunk_id]
+            transactions.extend(_decompress_transactions(chunk["codec"], chunk["data"]))
+    except Exception as e:
+        logger.error(f"Error reading the cached history of {address}: {e}")
+        _delete_address_history_version(mongo_client, address, history["version"])
+        return None
+    if len(transactions) != history["tx_count"]:
+        _delete_address_history_version(mongo_client, address, history["version"])
+        return None
+    transactions.reverse()
+    return transactions
+
+
+def set_address_history(
+    mongo_client: MongoClient,
+    address: str,
+    transactions: List[Transaction],
+    chunk_size: int,
+) -> bool:
+    """
+    Replace the cached confirmed transaction history of an address. The new chunks are written
+    before the history document is swapped to them, then the chunks it replaced are deleted, so
+    concurrent writers and readers never see a mix of two histories.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - address: Bitcoin address
+    - transactions: The confirmed transactions, newest first
+    - chunk_size: The number of transactions per chunk
+
+    Returns:
+    - Whether the history was cached
+    """
+    if not transactions:
+        delete_address_history(mongo_client, address)
+        return False
+    try:
+        chunks = _address_history_chunks(address, transactions[::-1], 0, chunk_size)
+    except ValueError as e:
+        logger.warning(f"Not caching the history of {address}: {e}")
+        delete_address_history(mongo_client, address)
+        return False
+
+    db = mongo_client[API_CACHE_DB]
+    num_bytes = sum(len(chunk["data"]) for chunk in chunks)
+    now = time()
+    try:
+        db[ADDRESS_HISTORY_CHUNKS_COLLECTION].insert_many(chunks, ordered=False)
+        previous = db[ADDRESS_HISTORY_COLLECTION].find_one_and_replace(
+            {"_id": address},
+            {
+                "_id": address,
+                "version": ObjectId(),
+                "chunk_ids": [chunk["_id"] for chunk in chunks],
+                "last_seen_txid": transactions[0].txid,
+                "tx_count": len(transactions),
+                "num_bytes": num_bytes,
+                "last_accessed_at": now,
+                "updated_at": now,
+            },
+            upsert=True,
+        )
+    except PyMongoError as e:
+        logger.error(f"Error caching the history of {address}: {e}")
+        _delete_address_history_chunks(mongo_client, address, chunks)
+        return False
+
+    _update_address_history_bytes(
+        mongo_client, num_bytes - (previous["num_bytes"] if previous else 0)
+    )
+    if previous is not None:
+        _delete_address_history_chunks(mongo_client, address, previous)
+    return True
+
+
+def extend_address_history(
+    mongo_client: MongoClient,
+    address: str,
+    cached_txid: str,
+    new_transactions: List[Transaction],
+    chunk_size: int,
+) -> bool:
+    """
+    Add the confirmed transactions newer than the cached ones to the history of an address. Only the
+    last chunk is rewritten, as a new chunk, the older chunks are left untouched. The history
+    document is only swapped to the new chunks if no other write happened since it was read.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - address: Bitcoin address
+    - cached_txid: The newest cached transaction the new transactions follow
+    - new_transactions: The new confirmed transactions, newest first
+    - chunk_size: The number of transactions per chunk
+
+    Returns:
+    - Whether the history was extended
+    """
+    if not new_transactions:
+        return True
+    db = mongo_client[API_CACHE_DB]
+    try:
+        history = db[ADDRESS_HISTORY_COLLECTION].find_one(
+            {"_id": address, "last_seen_txid": cached_txid}
+        )
+        if history is None or "chunk_ids" not in history:
+            return False
+        last_chunk = db[ADDRESS_HISTORY_CHUNKS_COLLECTION].find_one(
+            {"_id": history["chunk_ids"][-1]}
+        )
+    except PyMongoError as e:
+        logger.error(f"Error reading the cached history of {address}: {e}")
+        return False
+    if last_chunk is None:
+        return False  # Rewritten meanwhile
+
+    kept_chunk_ids = history["chunk_ids"]
+    transactions = new_transactions[::-1]
+    replaced_chunk = None
+    first_seq = len(kept_chunk_ids)
+    if last_chunk["count"] < chunk_size:
+        # Top up the last chunk rather than adding a small one per extension
+        try:
+            transactions = (
+                _decompress_transactions(last_chunk["codec"], last_chunk["data"])
+                + transactions
+            )
+        except Exception as e:
+            logger.error(f"Error reading the cached history of {address}: {e}")
+            _delete_address_history_version(mongo_client, address, history["version"])
+            return False
+        replaced_chunk = last_chunk
+        kept_chunk_ids = kept_chunk_ids[:-1]
+        first_seq -= 1
+    try:
+        chunks = _address_history_chunks(address, transactions, first_seq, chunk_size)
+    except ValueError as e:
+        logger.warning(f"Not caching the history of {address}: {e}")
+        _delete_address_history_version(mongo_client, address, history["version"])
+        return False
+
+    delta = sum(len(chunk["data"]) for chunk in chunks) - (
+        len(replaced_chunk["data"]) if replaced_chunk is not None else 0
+    )
+    try:
+        db[ADDRESS_HISTORY_CHUNKS_COLLECTION].insert_many(chunks, ordered=False)
+        result = db[ADDRESS_HISTORY_COLLECTION].update_one(
+            {"_id": address, "version": history["version"]},
+            {
+                "$set": {
+                    "version": ObjectId(),
+                    "chunk_ids": kept_chunk_ids + [chunk["_id"] for chunk in chunks],
+                    "last_seen_txid": new_transactions[0].txid,
+                    "updated_at": time(),
+                },
+                "$inc": {"tx_count": len(new_transactions), "num_bytes": delta},
+            },
+        )
+    except PyMongoError as e:
+        logger.error(f"Error extending the cached history of {address}: {e}")
+        _delete_address_history_chunks(mongo_client, address, chunks)
+        return False
+    if result.matched_count == 0:
+        # Another write won, its history is kept and these chunks are dropped
+        _delete_address_history_chunks(mongo_client, address, chunks)
+        return False
+
+    _update_address_history_bytes(mongo_client, delta)
+    if replaced_chunk is not None:
+        _delete_address_history_chunks(mongo_client, address, [replaced_chunk])
+    return True
+
+
+def delete_address_history(mongo_client: MongoClient, address: str) -> int:
+    """
+    Delete the cached history of an address.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - address: Bitcoin address
+
+    Returns:
+    - The number of bytes freed
+    """
+    return _delete_address_history_version(mongo_client, address)
+
+
+def _delete_address_history_version(
+    mongo_client: MongoClient, address: str, version: Optional[ObjectId] = None
+) -> int:
+    """
+    Delete the cached history of an address and its chunks, only if it still has a version if set,
+    so a history rewritten meanwhile is kept. Errors are logged, the history is then left in place.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - address: Bitcoin address
+    - version: The version of the history to delete
+
+    Returns:
+    - The number of bytes freed
+    """
+    db = mongo_client[API_CACHE_DB]
+    query = {"_id": address}
+    if version is not None:
+        query["version"] = version
+    try:
+        history = db[ADDRESS_HISTORY_COLLECTION].find_one_and_delete(query)
+    except PyMongoError as e:
+        logger.error(f"Error deleting the cached history of {address}: {e}")
+        return 0
+    if history is None:
+        return 0
+    _update_address_history_bytes(mongo_client, -history["num_bytes"])
+    _delete_address_history_chunks(mongo_client, address, history)
+    return history["num_bytes"]
+
+
+def _delete_address_history_chunks(
+    mongo_client: MongoClient, address: str, chunks
+) -> None:
+    """
+    Delete the chunks of a history no longer referenced. Histories written before they were
+    versioned have their chunks found by address instead.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - address: Bitcoin address
+    - chunks: The chunk documents, or the history document listing them
+    """
+    db = mongo_client[API_CACHE_DB]
+    if isinstance(chunks, dict):
+        if "chunk_ids" in chunks:
+            query = {"_id": {"$in": chunks["chunk_ids"]}}
+        else:
+            # Unversioned chunks have string ids, versioned ones ObjectIds
+            query = {"address": address, "_id": {"$type": "string"}}
+    else:
+        query = {"_id": {"$in": [chunk["_id"] for chunk in chunks]}}
+    try:
+        db[ADDRESS_HISTORY_CHUNKS_COLLECTION].delete_many(query)
+    except PyMongoError as e:
+        logger.error(f"Error deleting cached history chunks of {address}: {e}")
+
+
+def evict_address_histories(mongo_client: MongoClient, max_bytes: int) -> int:
+    """
+    Evict the least recently read address histories until the cache fits in its size budget.
+
+    Parameters:
+    - mongo_client: The MongoDB client instance
+    - max_bytes: The size budget of the cache
+
+    Returns:
+    - The number of evicted histories
+    """
+    db = mongo_client[API_CACHE_DB]
+    num_evicted = 0
+    try:
+        document = db[METADATA_COLLECTION].find_one({"_id": "address_history_bytes"})
+        num_bytes = document["bytes"] if document else 0
+        while num_bytes > max_bytes:
+            history = db[ADDRESS_HISTORY_COLLECTION].find_one(
+                {}, {"_id": 1}, sort=[("last_accessed_at", ASCENDING)]
+            )
+            if history is None:
+                break
+            freed = delete_address_history(mongo_client, history["_id"])
+            if freed == 0:
+                break  # Deleted by another eviction or failed, left to the next one
+            num_bytes -= freed
+            num_evicted += 1
+    except PyMongoError as e:
+        logger.error(f"Error evicting cached address histories: {e}")
+    return num_evicted
@@ -1,6 +1,78 @@
-from typing import Optional
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
 from neo4j import Driver, ManagedTransaction
-from src.models import WalletConnectionDetails, WalletData, ConnectedWallets
+from src.config import HUB_TOP_K
+from src.models import (
+    WALLET_FEATURE_NAMES,
+    ConnectionSummary,
+    GraphNode,
+    Subgraph,
+    SubgraphEdge,
+    SubgraphNode,
+    WalletConnection,
+    WalletConnectionDetails,
+    WalletData,
+    WalletVersion,
+    ConnectedWallets,
+)
+
+# Value returned for connection properties missing from the database
+MISSING_PROPERTY_PLACEHOLDER = -1
+
+# Directions of the connections of a wallet
+INBOUND = "inbound"
+OUTBOUND = "outbound"
+
+
+def wallet_data_to_node_properties(wallet_data: WalletData) -> Dict[str, Any]:
+    """
+    Convert wallet data to the properties of its Wallet node, with the numeric features packed into
+    a single float array property.
+
+    Parameters:
+    - wallet_data: The wallet data to convert
+
+    Returns:
+    - The Wallet node properties
+    """
+    return {
+        "address": wallet_data.address,
+        "features": wallet_data.to_feature_vector().tolist(),
+        "class_inference": wallet_data.class_inference,
+        "last_updated": wallet_data.last_updated,
+        "is_populated": wallet_data.is_populated,
+        "is_approximate": wallet_data.is_approximate,
+    }
+
+
+def wallet_data_from_node(wallet_node: Mapping[str, Any]) -> WalletData:
+    """
+    Convert a Wallet node to wallet data, decoding its packed features.
+
+    Nodes written before the features were packed store each feature as its own property, those
+    are decoded field by field.
+
+    Parameters:
+    - wallet_node: The Wallet node, or a mapping of its properties
+
+    Returns:
+    - The wallet data stored in the node
+    """
+    if not wallet_node.get("is_populated"):
+        return WalletData.stub(wallet_node["address"], wallet_node["last_updated"])
+
+    features = wallet_node.get("features")
+    if features is None:
+        features = [wallet_node[name] for name in WALLET_FEATURE_NAMES]
+
+    return WalletData.from_feature_vector(
+        wallet_node["address"],
+        features,
+        class_inference=wallet_node["class_inference"],
+        last_updated=wallet_node["last_updated"],
+        is_populated=True,
+        risk_score=wallet_node.get("risk_score"),
+        is_approximate=wallet_node.get("is_approximate", False),
+    )
 
 
 def get_wallet_data_from_db(
@@ -24,160 +96,80 @@ def get_wallet_data_from_db(
         result = session.run(query, base58_address=base58_address)
         wallet_data_record = result.single()
         if wallet_data_record is not None:
-            wallet_data_record = wallet_data_record["w"]
-            if wallet_data_record["is_populated"] == False:
-                return WalletData(
-                    address=wallet_data_record["address"],
-                    num_txs_as_sender=0,
-                    num_txs_as_receiver=0,
-                    first_block_appeared_in=0,
-                    last_block_appeared_in=0,
-                    lifetime_in_blocks=0,
-                    total_txs=0,
-                    first_sent_block=0,
-                    first_received_block=0,
-                    btc_transacted_total=0,
-                    btc_transacted_min=0,
-                    btc_transacted_max=0,
-                    btc_transacted_mean=0,
-                    btc_transacted_median=0,
-                    btc_sent_total=0,
-                    btc_sent_min=0,
-                    btc_sent_max=0,
-                    btc_sent_mean=0,
-                    btc_sent_median=0,
-                    btc_received_total=0,
-                    btc_received_min=0,
-                    btc_received_max=0,
-                    btc_received_mean=0,
-                    btc_received_median=0,
-                    fees_total=0,
-                    fees_min=0,
-                    fees_max=0,
-                    fees_mean=0,
-                    fees_median=0,
-                    fees_as_share_total=0,
-                    fees_as_share_min=0,
-                    fees_as_share_max=0,
-                    fees_as_share_mean=0,
-                    fees_as_share_median=0,
-                    blocks_btwn_txs_total=0,
-                    blocks_btwn_txs_min=0,
-                    blocks_btwn_txs_max=0,
-                    blocks_btwn_txs_mean=0,
-                    blocks_btwn_txs_median=0,
-                    blocks_btwn_input_txs_total=0,
-                    blocks_btwn_input_txs_min=0,
-                    blocks_btwn_input_txs_max=0,
-                    blocks_btwn_input_txs_mean=0,
-                    blocks_btwn_input_txs_median=0,
-                    blocks_btwn_output_txs_total=0,
-                    blocks_btwn_output_txs_min=0,
-                    blocks_btwn_output_txs_max=0,
-                    blocks_btwn_output_txs_mean=0,
-                    blocks_btwn_output_txs_median=0,
-                    num_addr_transacted_multiple=0,
-                    transacted_w_address_total=0,
-                    transacted_w_address_min=0,
-                    transacted_w_address_max=0,
-                    transacted_w_address_mean=0,
-                    transacted_w_address_median=0,
-                    class_inference=-1,
-                    last_updated=wallet_data_record["last_updated"],
-                    is_populated=False,
-                )
-            wallet_data = WalletData(
-                address=wallet_data_record["address"],
-                num_txs_as_sender=wallet_data_record["num_txs_as_sender"],
-                num_txs_as_receiver=wallet_data_record["num_txs_as_receiver"],
-                first_block_appeared_in=wallet_data_record["first_block_appeared_in"],
-                last_block_appeared_in=wallet_data_record["last_block_appeared_in"],
-                lifetime_in_blocks=wallet_data_record["lifetime_in_blocks"],
-                total_txs=wallet_data_record["total_txs"],
-                first_sent_block=wallet_data_record["first_sent_block"],
-                first_received_block=wallet_data_record["first_received_block"],
-                btc_transacted_total=wallet_data_record["btc_transacted_total"],
-                btc_transacted_min=wallet_data_record["btc_transacted_min"],
-                btc_transacted_max=wallet_data_record["btc_transacted_max"],
-                btc_transacted_mean=wallet_data_record["btc_transacted_mean"],
-                btc_transacted_median=wallet_data_record["btc_transacted_median"],
-                btc_sent_total=wallet_data_record["btc_sent_total"],
-                btc_sent_min=wallet_data_record["btc_sent_min"],
-                btc_sent_max=wallet_data_record["btc_sent_max"],
-                btc_sent_mean=wallet_data_record["btc_sent_mean"],
-                btc_sent_median=wallet_data_record["btc_sent_median"],
-                btc_received_total=wallet_data_record["btc_received_total"],
-                btc_received_min=wallet_data_record["btc_received_min"],
-                btc_received_max=wallet_data_record["btc_received_max"],
-                btc_received_mean=wallet_data_record["btc_received_mean"],
-                btc_received_median=wallet_data_record["btc_received_median"],
-                fees_total=wallet_data_record["fees_total"],
-                fees_min=wallet_data_record["fees_min"],
-                fees_max=wallet_data_record["fees_max"],
-                fees_mean=wallet_data_record["fees_mean"],
-                fees_median=wallet_data_record["fees_median"],
-                fees_as_share_total=wallet_data_record["fees_as_share_total"],
-                fees_as_share_min=wallet_data_record["fees_as_share_min"],
-                fees_as_share_max=wallet_data_record["fees_as_share_max"],
-                fees_as_share_mean=wallet_data_record["fees_as_share_mean"],
-                fees_as_share_median=wallet_data_record["fees_as_share_median"],
-                blocks_btwn_txs_total=wallet_data_record["blocks_btwn_txs_total"],
-                blocks_btwn_txs_min=wallet_data_record["blocks_btwn_txs_min"],
-                blocks_btwn_txs_max=wallet_data_record["blocks_btwn_txs_max"],
-                blocks_btwn_txs_mean=wallet_data_record["blocks_btwn_txs_mean"],
-                blocks_btwn_txs_median=wallet_data_record["blocks_btwn_txs_median"],
-                blocks_btwn_input_txs_total=wallet_data_record[
-                    "blocks_btwn_input_txs_total"
-                ],
-                blocks_btwn_input_txs_min=wallet_data_record[
-                    "blocks_btwn_input_txs_min"
-                ],
-                blocks_btwn_input_txs_max=wallet_data_record[
-                    "blocks_btwn_input_txs_max"
-                ],
-                blocks_btwn_input_txs_mean=wallet_data_record[
-                    "blocks_btwn_input_txs_mean"
-                ],
-                blocks_btwn_input_txs_median=wallet_data_record[
-                    "blocks_btwn_input_txs_median"
-                ],
-                blocks_btwn_output_txs_total=wallet_data_record[
-                    "blocks_btwn_output_txs_total"
-                ],
-                blocks_btwn_output_txs_min=wallet_data_record[
-                    "blocks_btwn_output_txs_min"
-                ],
-                blocks_btwn_output_txs_max=wallet_data_record[
-                    "blocks_btwn_output_txs_max"
-                ],
-                blocks_btwn_output_txs_mean=wallet_data_record[
-                    "blocks_btwn_output_txs_mean"
-                ],
-                blocks_btwn_output_txs_median=wallet_data_record[
-                    "blocks_btwn_output_txs_median"
-                ],
-                num_addr_transacted_multiple=wallet_data_record[
-                    "num_addr_transacted_multiple"
-                ],
-                transacted_w_address_total=wallet_data_record[
-                    "transacted_w_address_total"
-                ],
-                transacted_w_address_min=wallet_data_record["transacted_w_address_min"],
-                transacted_w_address_max=wallet_data_record["transacted_w_address_max"],
-                transacted_w_address_mean=wallet_data_record[
-                    "transacted_w_address_mean"
-                ],
-                transacted_w_address_median=wallet_data_record[
-                    "transacted_w_address_median"
-                ],
-                class_inference=wallet_data_record["class_inference"],
-                last_updated=wallet_data_record["last_updated"],
-                is_populated=wallet_data_record["is_populated"],
+            return wallet_data_from_node(wallet_data_record["w"])
+    return None
+
+
+def get_wallet_data_batch_from_db(
+    neo4j_driver: Driver, base58_addresses: List[str], chunk_size: int
+) -> Dict[str, WalletData]:
+    """
+    Get the wallet data for many Bitcoin wallet addresses from the Neo4j database, with one query
+    per chunk of addresses.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the queries
+    - base58_addresses: The base58 encoded Bitcoin wallet addresses
+    - chunk_size: The number of addresses per query
+
+    Returns:
+    - The wallet data of the wallets found in the database, stubs included, indexed by address
+    """
+    query = """
+    UNWIND $base58_addresses AS base58_address
+    MATCH (w:Wallet {address: base58_address})
+    RETURN w
+    """
+    wallets = {}
+    with neo4j_driver.session() as session:
+        for start in range(0, len(base58_addresses), chunk_size):
+            result = session.run(
+                query, base58_addresses=base58_addresses[start : start + chunk_size]
             )
-            return wallet_data
+            for record in result:
+                wallet_data = wallet_data_from_node(record["w"])
+                wallets[wallet_data.address] = wallet_data
+    return wallets
+
+
+def get_wallet_version_from_db(
+    neo4j_driver: Driver, base58_address: str
+) -> Optional[WalletVersion]:
+    """
+    Get the version stamps of a wallet without fetching its features, to answer conditional requests.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the query
+    - base58_address: The base58 encoded Bitcoin wallet address
+
+    Returns:
+    - The version stamps of the wallet, None if it is not in the database
+    """
+    query = """
+    MATCH (w:Wallet {address: $base58_address})
+    RETURN w.address AS address,
+           coalesce(w.is_populated, false) AS is_populated,
+           coalesce(w.last_updated, 0) AS last_updated,
+           w.risk_score AS risk_score,
+           coalesce(w.connections_updated, w.last_updated, 0) AS connections_updated
+    """
+    with neo4j_driver.session() as session:
+        record = session.run(query, base58_address=base58_address).single()
+        if record is not None:
+            return WalletVersion(**record.data())
     return None
 
 
+# Set the packed properties and drop the per-feature properties of nodes written before the
+# features were packed, other properties (e.g. derived scores) are kept
+_UPSERT_WALLET_DATA_QUERY = f"""
+MERGE (w:Wallet {{address: $address}})
+SET w += $wallet_data
+REMOVE {", ".join(f"w.{name}" for name in WALLET_FEATURE_NAMES)}
+RETURN w
+"""
+
+
 def upsert_wallet_data_in_db(neo4j_driver: Driver, wallet_data: WalletData):
     """
     Add or update wallet data for a given Bitcoin wallet address in the Neo4j database.
@@ -190,16 +182,11 @@ def upsert_wallet_data_in_db(neo4j_driver: Driver, wallet_data: WalletData):
     Returns:
     - True if the operation was successful
     """
-    query = """
-    MERGE (w:Wallet {address: $address})
-    SET w = $wallet_data
-    RETURN w
-    """
     with neo4j_driver.session() as session:
         session.run(
-            query,
+            _UPSERT_WALLET_DATA_QUERY,
             address=wallet_data.address,
-            wallet_data=wallet_data.model_dump(),
+            wallet_data=wallet_data_to_node_properties(wallet_data),
         )
     return True
 
@@ -210,6 +197,9 @@ def get_connected_wallets_from_db(
     """
     Get the connected wallets data for a given Bitcoin wallet address from the Neo4j database.
 
+    For hub wallets, only the HUB_TOP_K connections with the largest amount transacted in each
+    direction are returned, with the degree and volume summary of all the connections.
+
     Parameters:
     - neo4j_driver: The Neo4j driver to use for the query
     - wallet_address: The address of the wallet
@@ -227,17 +217,28 @@ def get_connected_wallets_from_db(
         wallet_record = result.single()
         if wallet_record is None:
             return None
+        summary = connection_summary_from_node(wallet_record["w"])
 
-    # Retrieve the inbound connections first
-    query = """
-    MATCH (w:Wallet {address: $wallet_address})
-    MATCH (w)-[r:TRANSACTED_WITH]->(cw:Wallet)
+    # Hubs only return their top connections, there are too many to return them all
+    limit_clause = (
+        ""
+        if summary is None
+        else f"ORDER BY r.amount_transacted DESC LIMIT {HUB_TOP_K}"
+    )
+
+    # Retrieve the inbound connections first, the wallets that sent Bitcoin to the wallet
+    query = f"""
+    MATCH (w:Wallet {{address: $wallet_address}})
+    MATCH (cw:Wallet)-[r:TRANSACTED_WITH]->(w)
     RETURN cw.address AS address, r.num_transactions AS num_transactions, r.amount_transacted AS amount_transacted
+    {limit_clause}
     """
-    MISSING_PROPERTY_PLACEHOLDER = -1
 
     connected_wallets = ConnectedWallets(
-        wallet_address=wallet_address, inbound_connections={}, outbound_connections={}
+        wallet_address=wallet_address,
+        inbound_connections={},
+        outbound_connections={},
+        summary=summary,
     )
     with neo4j_driver.session() as session:
         result = session.run(query, wallet_address=wallet_address)
@@ -258,10 +259,11 @@ def get_connected_wallets_from_db(
             )
 
     # Now retrieve the outbound connections
-    query = """
-    MATCH (w:Wallet {address: $wallet_address})
-    MATCH (cw:Wallet)-[r:TRANSACTED_WITH]->(w)
+    query = f"""
+    MATCH (w:Wallet {{address: $wallet_address}})
+    MATCH (w)-[r:TRANSACTED_WITH]->(cw:Wallet)
     RETURN cw.address AS address, r.num_transactions AS num_transactions, r.amount_transacted AS amount_transacted
+    {limit_clause}
     """
     with neo4j_driver.session() as session:
         result = session.run(query, wallet_address=wallet_address)
@@ -284,12 +286,211 @@ def get_connected_wallets_from_db(
     return connected_wallets
 
 
+def get_graph_node_from_db(
+    neo4j_driver: Driver, wallet_address: str
+) -> Optional[GraphNode]:
+    """
+    Get the wallet data, the connected wallets and the class and populated flag of the neighbours
+    of a wallet from the Neo4j database, in a single query once the wallet is known to be a hub
+    or not.
+
+    For hub wallets, only the HUB_TOP_K connections with the largest amount transacted in each
+    direction are returned, as by get_connected_wallets_from_db.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the query
+    - wallet_address: The address of the wallet
+
+    Returns:
+    - The graph node of the wallet, None if the wallet is not in the database
+    """
+    is_hub = get_wallet_is_hub_from_db(neo4j_driver, wallet_address)
+    if is_hub is None:
+        return None
+
+    # The connections are collected per direction in subqueries, which return one row even for a
+    # wallet without connections. Hubs only read their top connections
+    limit_clause = f"LIMIT {HUB_TOP_K}" if is_hub else ""
+    query = f"""
+    MATCH (w:Wallet {{address: $wallet_address}})
+    CALL {{
+        WITH w
+        MATCH (cw:Wallet)-[r:TRANSACTED_WITH]->(w)
+        WITH r, cw
+        ORDER BY r.amount_transacted DESC
+        {limit_clause}
+        RETURN collect({{
+            address: cw.address,
+            num_transactions: r.num_transactions,
+            amount_transacted: r.amount_transacted,
+            class_inference: coalesce(cw.class_inference, -1),
+            is_populated: coalesce(cw.is_populated, false)
+        }}) AS inbound
+    }}
+    CALL {{
+        WITH w
+        MATCH (w)-[r:TRANSACTED_WITH]->(cw:Wallet)
+        WITH r, cw
+        ORDER BY r.amount_transacted DESC
+        {limit_clause}
+        RETURN collect({{
+            address: cw.address,
+            num_transactions: r.num_transactions,
+            amount_transacted: r.amount_transacted,
+            class_inference: coalesce(cw.class_inference, -1),
+            is_populated: coalesce(cw.is_populated, false)
+        }}) AS outbound
+    }}
+    RETURN w, inbound, outbound
+    """
+    with neo4j_driver.session() as session:
+        record = session.run(query, wallet_address=wallet_address).single()
+    if record is None:
+        return None
+
+    connected_wallets = ConnectedWallets(
+        wallet_address=wallet_address,
+        inbound_connections={},
+        outbound_connections={},
+        summary=connection_summary_from_node(record["w"]),
+    )
+    neighbours: Dict[str, SubgraphNode] = {}
+    for key, connections in (
+        (INBOUND, connected_wallets.inbound_connections),
+        (OUTBOUND, connected_wallets.outbound_connections),
+    ):
+        for connection in record[key]:
+            connections[connection["address"]] = WalletConnectionDetails(
+                num_transactions=(
+                    MISSING_PROPERTY_PLACEHOLDER
+                    if connection["num_transactions"] is None
+                    else connection["num_transactions"]
+                ),
+                amount_transacted=(
+                    MISSING_PROPERTY_PLACEHOLDER
+                    if connection["amount_transacted"] is None
+                    else connection["amount_transacted"]
+                ),
+            )
+            neighbours[connection["address"]] = SubgraphNode(
+                address=connection["address"],
+                class_inference=connection["class_inference"],
+                is_populated=connection["is_populated"],
+            )
+
+    return GraphNode(
+        wallet_data=wallet_data_from_node(record["w"]),
+        connected_wallets=connected_wallets,
+        neighbours=list(neighbours.values()),
+    )
+
+
+def connection_summary_from_node(
+    wallet_node: Mapping[str, Any],
+) -> Optional[ConnectionSummary]:
+    """
+    Get the connection summary stored on a hub Wallet node.
+
+    Parameters:
+    - wallet_node: The Wallet node, or a mapping of its properties
+
+    Returns:
+    - The connection summary, None if the wallet is not a hub
+    """
+    if not wallet_node.get("is_hub"):
+        return None
+    return ConnectionSummary(
+        inbound_degree=wallet_node["inbound_degree"],
+        outbound_degree=wallet_node["outbound_degree"],
+        inbound_volume=wallet_node["inbound_volume"],
+        outbound_volume=wallet_node["outbound_volume"],
+    )
+
+
+def get_wallet_is_hub_from_db(neo4j_driver: Driver, wallet_address: str) -> Optional[bool]:
+    """
+    Check if a wallet is stored as a hub in the Neo4j database.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the query
+    - wallet_address: The address of the wallet
+
+    Returns:
+    - True if the wallet is a hub, False if it is not, None if the wallet is not in the database
+    """
+    query = """
+    MATCH (w:Wallet {address: $wallet_address})
+    RETURN coalesce(w.is_hub, false) AS is_hub
+    """
+    with neo4j_driver.session() as session:
+        record = session.run(query, wallet_address=wallet_address).single()
+        return None if record is None else record["is_hub"]
+
+
+def get_connections_page_from_db(
+    neo4j_driver: Driver,
+    wallet_address: str,
+    direction: str,
+    after: Optional[Tuple[float, str]],
+    limit: int,
+) -> List[WalletConnection]:
+    """
+    Get a page of the connections of a wallet from the Neo4j database, ordered by amount transacted
+    then counterparty address.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the query
+    - wallet_address: The address of the wallet
+    - direction: INBOUND for the wallets that sent Bitcoin to the wallet, OUTBOUND for the others
+    - after: The (amount transacted, address) of the last connection of the previous page, None for the
+    first page
+    - limit: The maximum number of connections in the page
+
+    Returns:
+    - The connections in the page
+    """
+    pattern = (
+        "(cw:Wallet)-[r:TRANSACTED_WITH]->(w)"
+        if direction == INBOUND
+        else "(w)-[r:TRANSACTED_WITH]->(cw:Wallet)"
+    )
+    query = f"""
+    MATCH (w:Wallet {{address: $wallet_address}})
+    MATCH {pattern}
+    WITH cw.address AS address,
+         coalesce(r.num_transactions, $missing) AS num_transactions,
+         coalesce(r.amount_transacted, $missing) AS amount_transacted
+    WHERE $after_amount IS NULL
+       OR amount_transacted < $after_amount
+       OR (amount_transacted = $after_amount AND address > $after_address)
+    RETURN address, num_transactions, amount_transacted
+    ORDER BY amount_transacted DESC, address ASC
+    LIMIT $limit
+    """
+    after_amount, after_address = after if after is not None else (None, None)
+    with neo4j_driver.session() as session:
+        result = session.run(
+            query,
+            wallet_address=wallet_address,
+            missing=MISSING_PROPERTY_PLACEHOLDER,
+            after_amount=after_amount,
+            after_address=after_address,
+            limit=limit,
+        )
+        return [WalletConnection(**record.data()) for record in result]
+
+
 def upsert_connected_wallets_in_db(
     neo4j_driver: Driver, wallet_address: str, connected_wallets: ConnectedWallets
 ):
     """
     Add or update the connected wallets data for a given Bitcoin wallet address to the Neo4j database.
 
+    If the connected wallets carry a summary, the wallet is marked as a hub and the summary is stored
+    on its node, otherwise any previous hub summary is removed. Edges are marked with the end whose
+    fetch wrote them (written_by_source, written_by_target), so a hub only drops the edges outside
+    its top connections that no other wallet wrote.
+
     Parameters:
     - neo4j_driver: The Neo4j driver to use for the query
     - connected_wallets: The connected wallets data to add to the database
@@ -311,39 +512,336 @@ def _upsert_connected_wallets_in_db(
     - wallet_address: The address of the wallet
     - connected_wallets: The connected wallets data to add to the database
     """
-    # Create or update the main wallet node
-    tx.run("MERGE (w:Wallet {address: $address})", address=wallet_address)
-
-    # Create or update inbound connections
-    for address, details in connected_wallets.inbound_connections.items():
+    # Create or update the main wallet node and its hub summary, connections_updated (in
+    # milliseconds) versions the connected wallets of both ends of every written edge
+    if connected_wallets.summary is None:
         tx.run(
             """
-            MERGE (w:Wallet {address: $wallet_address})
-            MERGE (cw:Wallet {address: $connected_address})
-            ON CREATE SET cw.is_populated = False, cw.last_updated = timestamp()
-            MERGE (cw)-[r:TRANSACTED_WITH]->(w)
-            ON CREATE SET r.num_transactions = $num_transactions, r.amount_transacted = $amount_transacted
-            ON MATCH SET r.num_transactions = $num_transactions, r.amount_transacted = $amount_transacted
+            MERGE (w:Wallet {address: $address})
+            SET w.connections_updated = timestamp()
+            REMOVE w.is_hub, w.inbound_degree, w.outbound_degree, w.inbound_volume, w.outbound_volume
             """,
-            wallet_address=wallet_address,
-            connected_address=address,
-            num_transactions=details.num_transactions,
-            amount_transacted=details.amount_transacted,
+            address=wallet_address,
+        )
+    else:
+        tx.run(
+            """
+            MERGE (w:Wallet {address: $address})
+            SET w.is_hub = true, w += $summary, w.connections_updated = timestamp()
+            """,
+            address=wallet_address,
+            summary=connected_wallets.summary.model_dump(),
         )
+        # Only the current top connections of a hub are kept among the edges its own fetches wrote.
+        # An edge its counterparty wrote too is kept for the counterparty, only the hub's mark is
+        # removed, and edges written before the marks existed are left alone
+        tx.run(
+            """
+            MATCH (w:Wallet {address: $address})
+            CALL {
+                WITH w
+                MATCH (cw:Wallet)-[r:TRANSACTED_WITH]->(w)
+                WHERE r.written_by_target AND NOT cw.address IN $inbound
+                REMOVE r.written_by_target
+                WITH r WHERE NOT coalesce(r.written_by_source, false)
+                DELETE r
+            }
+            CALL {
+                WITH w
+                MATCH (w)-[r:TRANSACTED_WITH]->(cw:Wallet)
+                WHERE r.written_by_source AND NOT cw.address IN $outbound
+                REMOVE r.written_by_source
+                WITH r WHERE NOT coalesce(r.written_by_target, false)
+                DELETE r
+            }
+            """,
+            address=wallet_address,
+            inbound=list(connected_wallets.inbound_connections),
+            outbound=list(connected_wallets.outbound_connections),
+        )
+
+    # Create or update inbound connections
+    tx.run(
+        """
+        UNWIND $connections AS connection
+        MATCH (w:Wallet {address: $wallet_address})
+        MERGE (cw:Wallet {address: connection.address})
+        ON CREATE SET cw.is_populated = False, cw.last_updated = timestamp()
+        MERGE (cw)-[r:TRANSACTED_WITH]->(w)
+        SET r.num_transactions = connection.num_transactions, r.amount_transacted = connection.amount_transacted,
+            r.written_by_target = true, cw.connections_updated = timestamp()
+        """,
+        wallet_address=wallet_address,
+        connections=_connection_parameters(connected_wallets.inbound_connections),
+    )
 
     # Create or update outbound connections
-    for address, details in connected_wallets.outbound_connections.items():
-        tx.run(
+    tx.run(
+        """
+        UNWIND $connections AS connection
+        MATCH (w:Wallet {address: $wallet_address})
+        MERGE (cw:Wallet {address: connection.address})
+        ON CREATE SET cw.is_populated = False, cw.last_updated = timestamp()
+        MERGE (w)-[r:TRANSACTED_WITH]->(cw)
+        SET r.num_transactions = connection.num_transactions, r.amount_transacted = connection.amount_transacted,
+            r.written_by_source = true, cw.connections_updated = timestamp()
+        """,
+        wallet_address=wallet_address,
+        connections=_connection_parameters(connected_wallets.outbound_connections),
+    )
+
+
+def _connection_parameters(
+    connections: Dict[str, WalletConnectionDetails],
+) -> List[Dict[str, Any]]:
+    """
+    Convert connections to query parameters for UNWIND.
+
+    Parameters:
+    - connections: The connection details, indexed by counterparty address
+    """
+    return [
+        {
+            "address": address,
+            "num_transactions": details.num_transactions,
+            "amount_transacted": details.amount_transacted,
+        }
+        for address, details in connections.items()
+    ]
+
+
+def get_subgraph_from_db(
+    neo4j_driver: Driver,
+    root_address: str,
+    depth: int,
+    fan_out: int,
+    max_nodes: int,
+) -> Optional[Subgraph]:
+    """
+    Get the k-hop neighbourhood of a wallet from the Neo4j database, in a single read transaction.
+
+    The neighbourhood is expanded breadth first, following at most fan_out connections per wallet,
+    the ones with the largest amount transacted first.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the query
+    - root_address: The address of the wallet at the center of the subgraph
+    - depth: The maximum number of hops from the root wallet
+    - fan_out: The maximum number of connections to follow from each wallet
+    - max_nodes: The maximum number of wallets in the subgraph
+
+    Returns:
+    - The subgraph, None if the root wallet is not in the database
+    """
+    with neo4j_driver.session() as session:
+        return session.execute_read(
+            _get_subgraph_from_db, root_address, depth, fan_out, max_nodes
+        )
+
+
+def _get_subgraph_from_db(
+    tx: ManagedTransaction,
+    root_address: str,
+    depth: int,
+    fan_out: int,
+    max_nodes: int,
+) -> Optional[Subgraph]:
+    """
+    Expand the k-hop neighbourhood of a wallet with one query per hop.
+
+    Parameters:
+    - tx: The Neo4j transaction to use for the queries
+    - root_address: The address of the wallet at the center of the subgraph
+    - depth: The maximum number of hops from the root wallet
+    - fan_out: The maximum number of connections to follow from each wallet
+    - max_nodes: The maximum number of wallets in the subgraph
+
+    Returns:
+    - The subgraph, None if the root wallet is not in the database
+    """
+    root_record = tx.run(
+        """
+        MATCH (w:Wallet {address: $address})
+        RETURN w.address AS address,
+               coalesce(w.class_inference, -1) AS class_inference,
+               coalesce(w.is_populated, false) AS is_populated
+        """,
+        address=root_address,
+    ).single()
+    if root_record is None:
+        return None
+
+    nodes = {root_address: SubgraphNode(**root_record.data())}
+    edges = {}
+    truncated = False
+    frontier = [root_address]
+
+    for _ in range(depth):
+        if not frontier or truncated:
+            break
+        result = tx.run(
             """
-            MERGE (w:Wallet {address: $wallet_address})
-            MERGE (cw:Wallet {address: $connected_address})
-            ON CREATE SET cw.is_populated = False, cw.last_updated = timestamp()
-            MERGE (w)-[r:TRANSACTED_WITH]->(cw)
-            ON CREATE SET r.num_transactions = $num_transactions, r.amount_transacted = $amount_transacted
-            ON MATCH SET r.num_transactions = $num_transactions, r.amount_transacted = $amount_transacted
+            UNWIND $frontier AS address
+            MATCH (w:Wallet {address: address})
+            CALL {
+                WITH w
+                MATCH (w)-[r:TRANSACTED_WITH]-(cw:Wallet)
+                RETURN r, cw
+                ORDER BY r.amount_transacted DESC
+                LIMIT $fan_out
+            }
+            RETURN startNode(r).address AS source,
+                   endNode(r).address AS target,
+                   coalesce(r.num_transactions, $missing) AS num_transactions,
+                   coalesce(r.amount_transacted, $missing) AS amount_transacted,
+                   cw.address AS address,
+                   coalesce(cw.class_inference, -1) AS class_inference,
+                   coalesce(cw.is_populated, false) AS is_populated
             """,
-            wallet_address=wallet_address,
-            connected_address=address,
-            num_transactions=details.num_transactions,
-            amount_transacted=details.amount_transacted,
+            frontier=frontier,
+            fan_out=fan_out,
+            missing=MISSING_PROPERTY_PLACEHOLDER,
+        )
+
+        next_frontier = []
+        for record in result:
+            address = record["address"]
+            if address not in nodes:
+                if len(nodes) >= max_nodes:
+                    truncated = True
+                    continue
+                nodes[address] = SubgraphNode(
+                    address=address,
+                    class_inference=record["class_inference"],
+                    is_populated=record["is_populated"],
+                )
+                next_frontier.append(address)
+
+            edge_key = (record["source"], record["target"])
+            if edge_key not in edges:
+                edges[edge_key] = SubgraphEdge(
+                    source=record["source"],
+                    target=record["target"],
+                    num_transactions=record["num_transactions"],
+                    amount_transacted=record["amount_transacted"],
+                )
+        frontier = next_frontier
+
+    return Subgraph(
+        root_address=root_address,
+        depth=depth,
+        nodes=list(nodes.values()),
+        edges=list(edges.values()),
+        truncated=truncated,
+    )
+
+
+def iter_wallet_adjacency_chunks(
+    neo4j_driver: Driver, chunk_size: int, updated_since: Optional[int] = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Export the wallets and their TRANSACTED_WITH connections from the Neo4j database in chunks,
+    paging through the wallets by address.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the queries
+    - chunk_size: The number of wallets in each chunk
+    - updated_since: If set, only export the populated wallets updated at or after this unix timestamp,
+    with their inbound connections as well as their outbound connections
+
+    Returns:
+    - An iterator over the chunks, each a list of wallet records with the `address`, `class_inference`,
+    `outbound` and `inbound` keys, where the connections are [address, amount_transacted] pairs
+    """
+    query = """
+    MATCH (w:Wallet)
+    WHERE w.address > $after
+      AND ($updated_since IS NULL OR (w.is_populated AND w.last_updated >= $updated_since))
+    WITH w
+    ORDER BY w.address
+    LIMIT $chunk_size
+    RETURN w.address AS address,
+           coalesce(w.class_inference, -1) AS class_inference,
+           [(w)-[r:TRANSACTED_WITH]->(cw:Wallet) | [cw.address, coalesce(r.amount_transacted, 0.0)]] AS outbound,
+           CASE WHEN $updated_since IS NULL THEN []
+                ELSE [(cw:Wallet)-[r:TRANSACTED_WITH]->(w) | [cw.address, coalesce(r.amount_transacted, 0.0)]]
+           END AS inbound
+    """
+    after = ""
+    while True:
+        with neo4j_driver.session() as session:
+            chunk = session.execute_read(
+                lambda tx: tx.run(
+                    query,
+                    after=after,
+                    updated_since=updated_since,
+                    chunk_size=chunk_size,
+                ).data()
+            )
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        after = chunk[-1]["address"]
+
+
+def get_wallet_staleness_page_from_db(
+    neo4j_driver: Driver, after: str, page_size: int, max_neighbors: int
+) -> List[Dict[str, Any]]:
+    """
+    Get a page of wallets with the properties the staleness refresh ranks them by, paging through
+    the wallets by address.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the query
+    - after: The address the page starts after, "" for the first page
+    - page_size: The number of wallets in the page
+    - max_neighbors: The number of connections of each wallet whose risk is considered
+
+    Returns:
+    - The wallet records with the `address`, `is_populated`, `last_updated` and `neighbor_risk` keys,
+    where the neighbor risk is the highest risk score of the connected wallets
+    """
+    query = """
+    MATCH (w:Wallet)
+    WHERE w.address > $after
+    WITH w
+    ORDER BY w.address
+    LIMIT $page_size
+    RETURN w.address AS address,
+           coalesce(w.is_populated, false) AS is_populated,
+           coalesce(w.last_updated, 0) AS last_updated,
+           reduce(
+               highest = 0.0,
+               risk IN [(w)-[:TRANSACTED_WITH]-(cw:Wallet) | coalesce(cw.risk_score, 0.0)][..$max_neighbors]
+               | CASE WHEN risk > highest THEN risk ELSE highest END
+           ) AS neighbor_risk
+    """
+    with neo4j_driver.session() as session:
+        return session.execute_read(
+            lambda tx: tx.run(
+                query, after=after, page_size=page_size, max_neighbors=max_neighbors
+            ).data()
+        )
+
+
+def set_wallet_risk_scores_in_db(
+    neo4j_driver: Driver, risk_scores: List[Tuple[str, float]]
+) -> None:
+    """
+    Write a batch of propagated risk scores to the Neo4j database.
+
+    Parameters:
+    - neo4j_driver: The Neo4j driver to use for the query
+    - risk_scores: The (address, risk score) pairs to write
+    """
+    query = """
+    UNWIND $risk_scores AS risk_score
+    MATCH (w:Wallet {address: risk_score[0]})
+    SET w.risk_score = risk_score[1]
+    """
+    with neo4j_driver.session() as session:
+        session.execute_write(
+            lambda tx: tx.run(query, risk_scores=risk_scores).consume()
         )
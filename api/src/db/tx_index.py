@@ -0,0 +1,432 @@
+"""
+Local index of the transactions ingested by the block worker, stored in SQLite.
+
+Transactions are stored once, compressed and stripped of the fields the wallet features do not use,
+with one posting per (address, transaction, role) pointing at them. An address is covered when the
+index holds its whole history: its history up to some height was ingested from the Blockstream API,
+and every block since was ingested by the block worker without gaps.
+
+With TX_INDEX_RETAIN_BLOCKS set, the blocks older than the most recent ones are pruned as new blocks
+are ingested, and the addresses that had transactions in them are no longer covered.
+"""
+
+import json
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.config import TX_INDEX_PATH, TX_INDEX_RETAIN_BLOCKS
+from src.models import (
+    BitcoinAddressQueryResponse,
+    ChainStats,
+    TransactionIndexStats,
+    MempoolStats,
+    Transaction,
+    TransactionInput,
+    TransactionOutput,
+    TransactionStatus,
+)
+
+# Roles of an address in a transaction
+ROLE_SENDER = 0  # The address funds an input
+ROLE_RECEIVER = 1  # The address receives an output
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    txid TEXT PRIMARY KEY,
+    block_height INTEGER NOT NULL,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS postings (
+    address TEXT NOT NULL,
+    txid TEXT NOT NULL,
+    role INTEGER NOT NULL,
+    block_height INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    num_txos INTEGER NOT NULL,
+    PRIMARY KEY (address, txid, role)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS transactions_block_height ON transactions (block_height);
+CREATE INDEX IF NOT EXISTS postings_block_height ON postings (block_height);
+CREATE TABLE IF NOT EXISTS coverage (
+    address TEXT PRIMARY KEY,
+    covered_to INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ingested_blocks (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    first_height INTEGER NOT NULL,
+    last_height INTEGER NOT NULL
+);
+"""
+
+
+class TransactionIndex:
+    """
+    The transactions of the ingested blocks, indexed by address.
+
+    Calls are serialized with a lock, so the index can be used from worker threads.
+    """
+
+    def __init__(
+        self, path: str = TX_INDEX_PATH, retain_blocks: int = TX_INDEX_RETAIN_BLOCKS
+    ) -> None:
+        """
+        Open the index, creating it if needed.
+
+        Parameters:
+        - path: The path of the SQLite database file
+        - retain_blocks: The number of most recent blocks kept, 0 to keep them all
+        """
+        self.retain_blocks = retain_blocks
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def close(self) -> None:
+        """
+        Close the index.
+        """
+        with self._lock:
+            self._connection.close()
+
+    def ingested_range(self) -> Optional[Tuple[int, int]]:
+        """
+        Get the range of blocks ingested without gaps.
+
+        Returns:
+        - The first and last block heights of the range, None if no block was ingested
+        """
+        with self._lock:
+            return self._ingested_range()
+
+    def ingest_block(self, block_height: int, transactions: List[Transaction]) -> None:
+        """
+        Ingest all the transactions of a block and extend the ingested range. A gap since the last
+        ingested block restarts the range, the addresses covered before the gap are no longer
+        covered.
+
+        Parameters:
+        - block_height: The height of the block
+        - transactions: All the transactions of the block
+        """
+        with self._lock, self._connection:
+            self._insert_transactions(transactions)
+            ingested_range = self._ingested_range()
+            if ingested_range is None or block_height > ingested_range[1] + 1:
+                # First block, or a gap since the last ingested block
+                first_height, last_height = block_height, block_height
+            elif block_height >= ingested_range[0] - 1:
+                first_height = min(ingested_range[0], block_height)
+                last_height = max(ingested_range[1], block_height)
+            else:
+                # Older block not adjacent to the range, its transactions are kept
+                first_height, last_height = ingested_range
+            self._connection.execute(
+                "INSERT OR REPLACE INTO ingested_blocks VALUES (0, ?, ?)",
+                (first_height, last_height),
+            )
+            if self.retain_blocks > 0:
+                self._prune(last_height - self.retain_blocks + 1)
+
+    def ingest_address_history(
+        self, address: str, transactions: List[Transaction], covered_to: int
+    ) -> None:
+        """
+        Ingest the history of an address fetched from the Blockstream API.
+
+        Parameters:
+        - address: The address
+        - transactions: All the confirmed transactions of the address up to covered_to
+        - covered_to: The block height up to which the history is complete
+        """
+        with self._lock, self._connection:
+            ingested_range = self._ingested_range()
+            if (
+                self.retain_blocks > 0
+                and ingested_range is not None
+                and any(
+                    tx.status.confirmed
+                    and tx.status.block_height
+                    <= ingested_range[1] - self.retain_blocks
+                    for tx in transactions
+                )
+            ):
+                return  # Older than the retained blocks, it would be pruned with the next block
+            self._insert_transactions(transactions)
+            self._connection.execute(
+                """
+                INSERT INTO coverage VALUES (?, ?)
+                ON CONFLICT (address) DO UPDATE SET covered_to = max(covered_to, excluded.covered_to)
+                """,
+                (address, covered_to),
+            )
+
+    def is_covered(self, address: str) -> bool:
+        """
+        Check if the index holds the whole history of an address, up to the last ingested block.
+
+        Parameters:
+        - address: The address
+        """
+        with self._lock:
+            return self._is_covered(address)
+
+    def get_address_data(
+        self, address: str, maximum_transactions: Optional[int] = None
+    ) -> Optional[BitcoinAddressQueryResponse]:
+        """
+        Rebuild the response of the Blockstream API for an address from the index, with all its
+        transactions, the most recent first.
+
+        The fields of the transactions not used by the wallet features (scripts, sizes, versions)
+        are left empty. The funded and spent output counts of the chain stats count the outputs
+        received and the inputs spent, as the Blockstream API does.
+
+        Parameters:
+        - address: The address
+        - maximum_transactions: If set, None is returned for addresses with more transactions
+
+        Returns:
+        - The address data, None if the address is not covered or has too many transactions
+        """
+        with self._lock:
+            if not self._is_covered(address):
+                self.misses += 1
+                return None
+            postings = self._connection.execute(
+                """
+                SELECT txid, role, value, num_txos FROM postings WHERE address = ?
+                """,
+                (address,),
+            ).fetchall()
+            txids = {txid for txid, _, _, _ in postings}
+            if maximum_transactions is not None and len(txids) > maximum_transactions:
+                self.misses += 1
+                return None
+            rows = self._connection.execute(
+                """
+                SELECT t.data FROM transactions t
+                WHERE t.txid IN (SELECT DISTINCT txid FROM postings WHERE address = ?)
+                ORDER BY t.block_height DESC, t.txid
+                """,
+                (address,),
+            ).fetchall()
+
+        stats = {
+            "funded_txo_count": 0,
+            "funded_txo_sum": 0,
+            "spent_txo_count": 0,
+            "spent_txo_sum": 0,
+        }
+        for _, role, value, num_txos in postings:
+            prefix = "funded" if role == ROLE_RECEIVER else "spent"
+            stats[f"{prefix}_txo_count"] += num_txos
+            stats[f"{prefix}_txo_sum"] += value
+        self.hits += 1
+        transactions = [_decode_transaction(data) for (data,) in rows]
+        return BitcoinAddressQueryResponse(
+            address=address,
+            chain_stats=ChainStats(tx_count=len(txids), **stats),
+            mempool_stats=MempoolStats(
+                funded_txo_count=0,
+                funded_txo_sum=0,
+                spent_txo_count=0,
+                spent_txo_sum=0,
+                tx_count=0,
+            ),
+            transactions=transactions,
+            last_seen_txid=transactions[0].txid if transactions else None,
+        )
+
+    def stats(self) -> TransactionIndexStats:
+        """
+        Get the index counters.
+        """
+        with self._lock:
+            ingested_range = self._ingested_range()
+            covered_addresses = self._connection.execute(
+                "SELECT count(*) FROM coverage"
+            ).fetchone()[0]
+        return TransactionIndexStats(
+            first_height=None if ingested_range is None else ingested_range[0],
+            last_height=None if ingested_range is None else ingested_range[1],
+            covered_addresses=covered_addresses,
+            hits=self.hits,
+            misses=self.misses,
+        )
+
+    def _ingested_range(self) -> Optional[Tuple[int, int]]:
+        row = self._connection.execute(
+            "SELECT first_height, last_height FROM ingested_blocks WHERE id = 0"
+        ).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def _prune(self, first_height: int) -> None:
+        """
+        Delete the transactions below a height. The addresses with postings below it no longer have
+        their whole history, the other covered addresses stay covered from the new first height.
+        The file does not shrink, the freed pages are reused by the next blocks.
+        """
+        ingested_range = self._ingested_range()
+        if ingested_range is None or ingested_range[0] >= first_height:
+            return
+        self._connection.execute(
+            """
+            DELETE FROM coverage WHERE address IN (
+                SELECT DISTINCT address FROM postings WHERE block_height < ?
+            )
+            """,
+            (first_height,),
+        )
+        self._connection.execute(
+            """
+            UPDATE coverage SET covered_to = ?
+            WHERE covered_to >= ? AND covered_to < ?
+            """,
+            (first_height - 1, ingested_range[0] - 1, first_height - 1),
+        )
+        self._connection.execute(
+            "DELETE FROM postings WHERE block_height < ?", (first_height,)
+        )
+        self._connection.execute(
+            "DELETE FROM transactions WHERE block_height < ?", (first_height,)
+        )
+        self._connection.execute(
+            "UPDATE ingested_blocks SET first_height = ? WHERE id = 0", (first_height,)
+        )
+
+    def _is_covered(self, address: str) -> bool:
+        ingested_range = self._ingested_range()
+        if ingested_range is None:
+            return False
+        row = self._connection.execute(
+            "SELECT covered_to FROM coverage WHERE address = ?", (address,)
+        ).fetchone()
+        # The API history must reach the ingested range, which continues it without gaps
+        return row is not None and row[0] >= ingested_range[0] - 1
+
+    def _insert_transactions(self, transactions: Iterable[Transaction]) -> None:
+        """
+        Insert confirmed transactions and their postings, skipping the ones already indexed.
+        """
+        transaction_rows = []
+        posting_rows = []
+        for tx in transactions:
+            if not tx.status.confirmed:
+                continue
+            transaction_rows.append(
+                (tx.txid, tx.status.block_height, _encode_transaction(tx))
+            )
+            for (address, role), (value, num_txos) in _postings(tx).items():
+                posting_rows.append(
+                    (address, tx.txid, role, tx.status.block_height, value, num_txos)
+                )
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO transactions VALUES (?, ?, ?)", transaction_rows
+        )
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO postings VALUES (?, ?, ?, ?, ?, ?)", posting_rows
+        )
+
+
+def _postings(tx: Transaction) -> Dict[Tuple[str, int], Tuple[int, int]]:
+    """
+    Get the postings of a transaction.
+
+    Returns:
+    - The total value and number of outputs, indexed by address and role
+    """
+    postings: Dict[Tuple[str, int], Tuple[int, int]] = {}
+    for tx_input in tx.vin:
+        if tx_input.prevout is None or tx_input.prevout.scriptpubkey_address is None:
+            continue
+        key = (tx_input.prevout.scriptpubkey_address, ROLE_SENDER)
+        value, num_txos = postings.get(key, (0, 0))
+        postings[key] = (value + tx_input.prevout.value, num_txos + 1)
+    for tx_output in tx.vout:
+        if tx_output.scriptpubkey_address is None:
+            continue
+        key = (tx_output.scriptpubkey_address, ROLE_RECEIVER)
+        value, num_txos = postings.get(key, (0, 0))
+        postings[key] = (value + tx_output.value, num_txos + 1)
+    return postings
+
+
+def _encode_transaction(tx: Transaction) -> bytes:
+    """
+    Encode the fields of a transaction used by the wallet features, compressed.
+    """
+    return zlib.compress(
+        json.dumps(
+            [
+                tx.fee,
+                tx.status.block_height,
+                tx.status.block_hash,
+                tx.status.block_time,
+                [
+                    [tx_input.prevout.scriptpubkey_address, tx_input.prevout.value]
+                    if tx_input.prevout is not None
+                    else None
+                    for tx_input in tx.vin
+                ],
+                [
+                    [tx_output.scriptpubkey_address, tx_output.value]
+                    for tx_output in tx.vout
+                ],
+                tx.txid,
+            ],
+            separators=(",", ":"),
+        ).encode()
+    )
+
+
+def _decode_transaction(data: bytes) -> Transaction:
+    """
+    Decode a transaction encoded by _encode_transaction, the fields left out are empty.
+    """
+    fee, block_height, block_hash, block_time, vin, vout, txid = json.loads(
+        zlib.decompress(data)
+    )
+    return Transaction.model_construct(
+        txid=txid,
+        version=0,
+        locktime=0,
+        vin=[
+            TransactionInput.model_construct(
+                txid="",
+                vout=0,
+                prevout=None if prevout is None else _decode_output(*prevout),
+                scriptsig="",
+                scriptsig_asm="",
+                is_coinbase=prevout is None,
+                sequence=0,
+            )
+            for prevout in vin
+        ],
+        vout=[_decode_output(address, value) for address, value in vout],
+        size=0,
+        weight=0,
+        fee=fee,
+        status=TransactionStatus.model_construct(
+            confirmed=True,
+            block_height=block_height,
+            block_hash=block_hash,
+            block_time=block_time,
+        ),
+    )
+
+
+def _decode_output(address: Optional[str], value: int) -> TransactionOutput:
+    return TransactionOutput.model_construct(
+        scriptpubkey="",
+        scriptpubkey_asm="",
+        scriptpubkey_type="",
+        scriptpubkey_address=address,
+        value=value,
+    )
@@ -2,17 +2,27 @@ import aiohttp
 import asyncio
 import logging
 import json
-from typing import List, Optional
+from typing import Callable, List, Optional
 from pydantic import ValidationError
 from fastapi import status
 
-from src.config import BLOCKSTREAM_API_URL, BLOCKSTREAM_RATE_LIMIT_MS
+from src.config import (
+    BLOCKSTREAM_API_URL,
+    BLOCKSTREAM_RATE_LIMIT_MS,
+    UPSTREAM_CACHE_ENABLED,
+    UPSTREAM_CACHE_MIN_CONFIRMATIONS,
+)
+from src.extern.http_cache import DiskResponseCache
 from src.models import (
     BitcoinAddressQueryResponse,
     Block,
     Transaction,
+    Utxo,
 )
 
+# Called with the number of transactions of an address and the number of pages fetched so far
+ProgressCallback = Callable[[int, int], None]
+
 logger = logging.getLogger(__name__)
 
 
@@ -40,6 +50,12 @@ class BlockstreamAPIWorker:
         )
         self.rate_limit = BLOCKSTREAM_RATE_LIMIT_MS / 1000.0
 
+        # Only the immutable responses are cached, the tip height and address queries always go
+        # to the API
+        self.response_cache = DiskResponseCache() if UPSTREAM_CACHE_ENABLED else None
+        # Latest block height seen, to tell deep blocks whose hash can no longer change
+        self.latest_block_height: Optional[int] = None
+
     async def close(self):
         """
         Close the worker and cleanup resources.
@@ -118,6 +134,33 @@ class BlockstreamAPIWorker:
                 )
                 return
 
+    async def fetch_address_utxos(self, base58_address: str) -> Optional[List[Utxo]]:
+        """
+        Fetch the unspent transaction outputs of a given Bitcoin address.
+
+        Parameters:
+        - base58_address: The base58 encoded Bitcoin address to query
+
+        Returns:
+        - The unspent transaction outputs, None if the API does not list them, e.g. when there are
+        too many
+        """
+        url = f"{self.base_url}address/{base58_address}/utxo"
+        async with self.session.get(url) as response:
+            if response.status != status.HTTP_200_OK:
+                logger.error(
+                    f"Error fetching unspent outputs for {base58_address}: {response.status}"
+                )
+                return None
+            try:
+                data = await response.json()
+                return [Utxo.model_validate(utxo) for utxo in data]
+            except ValidationError as e:
+                logger.error(
+                    f"Error parsing unspent outputs JSON response for BTC address: {base58_address}: {e}"
+                )
+                return None
+
     async def fetch_blocks(self) -> Optional[List[Block]]:
         """
         Fetch the list of the 10 latest blocks.
@@ -151,7 +194,8 @@ class BlockstreamAPIWorker:
                 return None
             try:
                 data = await response.text()
-                return int(data)
+                self.latest_block_height = int(data)
+                return self.latest_block_height
             except ValueError as e:
                 logger.error(f"Error parsing block height: {e}")
                 return None
@@ -174,7 +218,42 @@ class BlockstreamAPIWorker:
                 )
                 return None
             block_hash = await response.text()
-            return block_hash
+        if self.response_cache is not None and self._is_deep_block(block_height):
+            # The cache does blocking file I/O and compression, keep it off the event loop
+            await asyncio.to_thread(
+                self.response_cache.set, url, response.status, block_hash
+            )
+        return block_hash
+
+    async def get_cached_block_hash(self, block_height: int) -> Optional[str]:
+        """
+        Get the hash for a block at a given height from the response cache, without calling the API.
+
+        Parameters:
+        - block_height: The block height to query
+
+        Returns:
+        - The hash of the block at the specified height, None if it is not cached
+        """
+        if self.response_cache is None or not self._is_deep_block(block_height):
+            return None
+        cached = await asyncio.to_thread(
+            self.response_cache.get, f"{self.base_url}block-height/{block_height}"
+        )
+        return None if cached is None else cached[1]
+
+    def _is_deep_block(self, block_height: int) -> bool:
+        """
+        Check if a block is buried deep enough that a reorganization can no longer replace it.
+
+        Parameters:
+        - block_height: The block height to check
+        """
+        return (
+            self.latest_block_height is not None
+            and self.latest_block_height - block_height
+            >= UPSTREAM_CACHE_MIN_CONFIRMATIONS
+        )
 
     async def fetch_block_transactions(
         self, block_hash: str, start_tx_idx: int = 0
@@ -192,14 +271,61 @@ class BlockstreamAPIWorker:
         url = f"{self.base_url}block/{block_hash}/txs/{start_tx_idx}"
         async with self.session.get(url) as response:
             response_text = await response.text()
+        transactions = self._parse_block_transactions(
+            block_hash, response.status, response_text
+        )
+        # The transactions of a block never change, the end of the pages included
+        if transactions is not None and self.response_cache is not None:
+            await asyncio.to_thread(
+                self.response_cache.set, url, response.status, response_text
+            )
+        return transactions
+
+    async def get_cached_block_transactions(
+        self, block_hash: str, start_tx_idx: int = 0
+    ) -> Optional[List[Transaction]]:
+        """
+        Get the transactions for a given block hash from the response cache, without calling the API.
+
+        Parameters:
+        - block_hash: The hash of the block to query
+        - start_tx_idx: The transaction index to start fetching transactions from, must be a multiple of 25
+
+        Returns:
+        - The list of transactions in the block, None if they are not cached
+        """
+        if self.response_cache is None:
+            return None
+        cached = await asyncio.to_thread(
+            self.response_cache.get,
+            f"{self.base_url}block/{block_hash}/txs/{start_tx_idx}",
+        )
+        if cached is None:
+            return None
+        return self._parse_block_transactions(block_hash, *cached)
+
+    def _parse_block_transactions(
+        self, block_hash: str, status_code: int, response_text: str
+    ) -> Optional[List[Transaction]]:
+        """
+        Parse a response of the block transactions endpoint.
+
+        Parameters:
+        - block_hash: The hash of the queried block
+        - status_code: The status code of the response
+        - response_text: The body of the response
+
+        Returns:
+        - The list of transactions in the page, empty past the last page, None on error
+        """
         if (
-            response.status == status.HTTP_404_NOT_FOUND
+            status_code == status.HTTP_404_NOT_FOUND
             and response_text == "start index out of range"
         ):
             return []  # No more transactions to fetch
-        if response.status != status.HTTP_200_OK:
+        if status_code != status.HTTP_200_OK:
             logger.error(
-                f"Failed to fetch transactions for block hash {block_hash}: {response.status}"
+                f"Failed to fetch transactions for block hash {block_hash}: {status_code}"
             )
             return None
         try:
@@ -301,17 +427,30 @@ class TransactionRangeJob(Job):
     The transactions are fetched in pages of up to 25 transactions.
     """
 
-    def __init__(self, base58_address: str, last_seen_txid: Optional[str]):
+    def __init__(
+        self,
+        base58_address: str,
+        last_seen_txid: Optional[str],
+        on_page: Optional[Callable[[int], None]] = None,
+        stop_txid: Optional[str] = None,
+        max_pages: Optional[int] = None,
+    ):
         """
         Initialize the job with the address and last_seen_txid.
 
         Parameters:
         - base58_address: The base58 encoded Bitcoin address to query
         - last_seen_txid: The latest transaction ID to fetch transactions after
+        - on_page: Called with the number of pages fetched so far after each page
+        - stop_txid: If set, stop at this transaction, it and the older ones are not fetched
+        - max_pages: If set, stop after fetching this many pages
         """
         super().__init__()
         self.base58_address = base58_address
         self.last_seen_txid = last_seen_txid
+        self.on_page = on_page
+        self.stop_txid = stop_txid
+        self.max_pages = max_pages
 
     async def run(self, worker: BlockstreamAPIWorker):
         """
@@ -325,15 +464,26 @@ class TransactionRangeJob(Job):
         """
         transactions = []
         last_seen_txid = self.last_seen_txid
+        num_pages = 0
         while True:
             page_transactions = await worker.fetch_address_transactions(
                 self.base58_address, last_seen_txid
             )
             if not page_transactions:
                 break
+            is_last_page = len(page_transactions) < 25
+            if self.stop_txid is not None:
+                for i, tx in enumerate(page_transactions):
+                    if tx.txid == self.stop_txid:
+                        page_transactions = page_transactions[:i]
+                        is_last_page = True
+                        break
             # Prepend page_transactions to preserve order
             transactions = page_transactions + transactions
-            if len(page_transactions) < 25:
+            num_pages += 1
+            if self.on_page is not None:
+                self.on_page(num_pages)
+            if is_last_page or num_pages == self.max_pages:
                 break
             last_seen_txid = page_transactions[-1].txid
             await asyncio.sleep(
@@ -342,6 +492,36 @@ class TransactionRangeJob(Job):
         self.future.set_result(transactions)
 
 
+class AddressUtxosJob(Job):
+    """
+    Job to get the unspent transaction outputs of a given Bitcoin address.
+    """
+
+    def __init__(self, base58_address: str):
+        """
+        Initialize the job with the address.
+
+        Parameters:
+        - base58_address: The base58 encoded Bitcoin address to query
+        """
+        super().__init__()
+        self.base58_address = base58_address
+
+    async def run(self, worker: BlockstreamAPIWorker):
+        """
+        Run the job to fetch the unspent transaction outputs.
+
+        Parameters:
+        - worker: The BlockstreamAPIWorker instance
+
+        Returns:
+        - The unspent transaction outputs, None on error
+        """
+        utxos = await worker.fetch_address_utxos(self.base58_address)
+        await asyncio.sleep(BLOCKSTREAM_RATE_LIMIT_MS / 1000.0)  # Respect rate limit
+        self.future.set_result(utxos)
+
+
 class BlocksJob(Job):
     """
     Job to get the list of blocks from the API.
@@ -465,6 +645,9 @@ async def get_transaction_range(
     worker: BlockstreamAPIWorker,
     base58_address: str,
     last_seen_txid: Optional[str] = None,
+    on_page: Optional[Callable[[int], None]] = None,
+    stop_txid: Optional[str] = None,
+    max_pages: Optional[int] = None,
 ) -> List[Transaction]:
     """
     Get transactions up to last_seen_txid for a given Bitcoin address.
@@ -473,11 +656,35 @@ async def get_transaction_range(
     - worker: The BlockchainAPIWorker instance
     - base58_address: The base58 encoded Bitcoin address to query
     - last_seen_txid: The latest transaction ID to fetch transactions after
+    - on_page: Called with the number of pages fetched so far after each page
+    - stop_txid: If set, stop at this transaction, it and the older ones are not fetched
+    - max_pages: If set, stop after fetching this many pages
 
     Returns:
     - The list of transactions in the specified range
     """
-    job = TransactionRangeJob(base58_address, last_seen_txid)
+    job = TransactionRangeJob(
+        base58_address, last_seen_txid, on_page, stop_txid, max_pages
+    )
+    await worker.add_to_queue(job)
+    await job.future  # Wait for the specific job to complete
+    return job.future.result()
+
+
+async def get_address_utxos(
+    worker: BlockstreamAPIWorker, base58_address: str
+) -> Optional[List[Utxo]]:
+    """
+    Get the unspent transaction outputs of a given Bitcoin address.
+
+    Parameters:
+    - worker: The BlockchainAPIWorker instance
+    - base58_address: The base58 encoded Bitcoin address to query
+
+    Returns:
+    - The unspent transaction outputs, None on error
+    """
+    job = AddressUtxosJob(base58_address)
     await worker.add_to_queue(job)
     await job.future  # Wait for the specific job to complete
     return job.future.result()
@@ -525,6 +732,11 @@ async def get_block_hash(
     Returns:
     - The hash of the block at the specified height
     """
+    # Cached hashes skip the rate limited queue
+    block_hash = await worker.get_cached_block_hash(block_height)
+    if block_hash is not None:
+        return block_hash
+
     job = BlockHeightToHashJob(block_height)
     await worker.add_to_queue(job)
     await job.future  # Wait for the specific job to complete
@@ -545,6 +757,13 @@ async def get_block_transactions(
     Returns:
     - The list of transactions in the block
     """
+    # Cached pages skip the rate limited queue
+    transactions = await worker.get_cached_block_transactions(
+        block_hash, start_tx_idx
+    )
+    if transactions is not None:
+        return transactions
+
     job = BlockTransactionsJob(block_hash, start_tx_idx)
     await worker.add_to_queue(job)
     await job.future  # Wait for the specific job to complete
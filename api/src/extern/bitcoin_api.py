@@ -1,14 +1,32 @@
+import asyncio
+import bisect
 import logging
 from pydantic import ValidationError
 from pymongo import MongoClient
 from collections import defaultdict
 from datetime import datetime
-from typing import Optional, Tuple
-
-from src.db.mongodb import set_address_last_processed_block_height
+from typing import Callable, List, Optional, Tuple
+
+from src.config import (
+    ADDRESS_HISTORY_CACHE_ENABLED,
+    ADDRESS_HISTORY_CACHE_MAX_BYTES,
+    ADDRESS_HISTORY_CHUNK_SIZE,
+    SAMPLED_HISTORY_ENABLED,
+    SAMPLED_HISTORY_RECENT_PAGES,
+    SAMPLED_HISTORY_STRATA,
+)
+from src.db.mongodb import (
+    evict_address_histories,
+    extend_address_history,
+    get_address_history,
+    set_address_history,
+    set_address_last_processed_block_height,
+)
 from src.extern.api_worker import (
     BlockstreamAPIWorker,
+    ProgressCallback,
     get_address_information,
+    get_address_utxos,
     get_transaction_range,
 )
 from src.models import (
@@ -21,6 +39,8 @@ from src.models import (
 
 # Conversion factor from satoshis to BTC
 SATOSHIS_TO_BTC = 1e-8
+# The full history of addresses with more transactions is not fetched, they are sampled instead
+MAXIMUM_TRANSACTIONS = 20000  # TODO: Fiddle with this number
 logger = logging.getLogger(__name__)
 
 
@@ -28,6 +48,7 @@ async def get_wallet_data_from_api(
     api_worker: BlockstreamAPIWorker,
     mongo_client: MongoClient,
     base58_address: str,
+    on_progress: Optional[ProgressCallback] = None,
 ) -> Tuple[WalletData, ConnectedWallets]:
     """
     Convert the wallet data from the blockstream.info to a WalletData object.
@@ -35,10 +56,13 @@ async def get_wallet_data_from_api(
     @param api_worker: The blockstream.com API worker instance.
     @param mongo_client: The MongoDB client instance.
     @param base58_address: The base58 encoded Bitcoin address to query.
+    @param on_progress: Called as the transaction pages of the address are fetched.
     @return: The WalletData object populated with the data from the API.
     @return: The ConnectedWallets object populated with the connected wallets from the API.
     """
-    address_data = await get_address_data(api_worker, base58_address)
+    address_data = await get_address_data(
+        api_worker, base58_address, on_progress=on_progress, mongo_client=mongo_client
+    )
     if address_data is None:
         return None, None
 
@@ -54,12 +78,17 @@ async def get_wallet_data_from_api(
 async def get_address_data(
     api_worker: BlockstreamAPIWorker,
     base58_address: str,
-    maximum_transactions: int = 20000,  # TODO: Fiddle with this number
+    maximum_transactions: int = MAXIMUM_TRANSACTIONS,
+    on_progress: Optional[ProgressCallback] = None,
+    mongo_client: Optional[MongoClient] = None,
 ) -> Optional[BitcoinAddressQueryResponse]:
     """
     Get the address data from the blockstream.com API
 
     @param base58_address: The base58 encoded Bitcoin address to query.
+    @param on_progress: Called with the number of transactions and of pages fetched so far.
+    @param mongo_client: If set, the confirmed history of the address is cached in MongoDB and only
+    the transactions newer than the cached ones are fetched.
     @return: The BitcoinAddressQueryResponse object populated with the data from the API.
     """
     # Retrieve the address data from the cache if it exists
@@ -71,6 +100,9 @@ async def get_address_data(
         logger.error(f"Failed to retrieve data for address {base58_address}")
         return None
     else:
+        if on_progress is not None:
+            on_progress(latest_address_data.chain_stats.tx_count, 1)
+
         # If the number of transactions is greater than 25, the API response is paginated
         # and the data is incomplete, so make new API calls until all transactions are retrieved
         if latest_address_data.chain_stats.tx_count > 25:
@@ -78,17 +110,83 @@ async def get_address_data(
                 f"Address {base58_address} has more than 25 transactions: {latest_address_data.chain_stats.tx_count}"
             )
             if latest_address_data.chain_stats.tx_count > maximum_transactions:
+                if SAMPLED_HISTORY_ENABLED:
+                    logger.info(
+                        f"Address {base58_address} has {latest_address_data.chain_stats.tx_count} transactions, which exceeds the maximum of {maximum_transactions}, sampling its history."
+                    )
+                    return await get_sampled_address_data(
+                        api_worker, latest_address_data, on_progress
+                    )
                 logger.error(
                     f"Address {base58_address} has {latest_address_data.chain_stats.tx_count} transactions, which exceeds the maximum of {maximum_transactions}."
                 )
                 return None  # ? Should we return the cached data here?
-        address_transactions = await get_transaction_range(
-            api_worker,
-            base58_address,
-            last_seen_txid=latest_address_data.transactions[-1].txid,
+        tx_count = latest_address_data.chain_stats.tx_count
+        on_page = (
+            (lambda num_pages: on_progress(tx_count, 1 + num_pages))
+            if on_progress is not None
+            else None
         )
-        # Append the rest pf the transactions to preserve order
-        latest_address_data.transactions.extend(address_transactions)
+
+        use_history_cache = mongo_client is not None and ADDRESS_HISTORY_CACHE_ENABLED
+        cached_transactions = None
+        if use_history_cache:
+            cached_transactions = await asyncio.to_thread(
+                get_address_history, mongo_client, base58_address
+            )
+
+        transactions = None
+        new_confirmed_transactions = None
+        if cached_transactions:
+            new_transactions = await get_new_transactions(
+                api_worker, latest_address_data, cached_transactions[0].txid, on_page
+            )
+            new_confirmed_transactions = [
+                tx for tx in new_transactions if tx.status.confirmed
+            ]
+            if len(new_confirmed_transactions) + len(cached_transactions) == tx_count:
+                transactions = new_transactions + cached_transactions
+            elif len(new_confirmed_transactions) == tx_count:
+                # The cached transaction was not found, e.g. after a reorg, so the whole history
+                # was fetched
+                transactions = new_transactions
+                new_confirmed_transactions = None
+            else:
+                logger.info(f"Cached history of {base58_address} is stale, refetching")
+                new_confirmed_transactions = None
+
+        if transactions is None:
+            address_transactions = await get_transaction_range(
+                api_worker,
+                base58_address,
+                last_seen_txid=latest_address_data.transactions[-1].txid,
+                on_page=on_page,
+            )
+            # Append the rest pf the transactions to preserve order
+            transactions = latest_address_data.transactions + address_transactions
+        latest_address_data.transactions = transactions
+
+        if use_history_cache:
+            if new_confirmed_transactions is not None:
+                await asyncio.to_thread(
+                    extend_address_history,
+                    mongo_client,
+                    base58_address,
+                    cached_transactions[0].txid,
+                    new_confirmed_transactions,
+                    ADDRESS_HISTORY_CHUNK_SIZE,
+                )
+            else:
+                await asyncio.to_thread(
+                    set_address_history,
+                    mongo_client,
+                    base58_address,
+                    [tx for tx in transactions if tx.status.confirmed],
+                    ADDRESS_HISTORY_CHUNK_SIZE,
+                )
+            await asyncio.to_thread(
+                evict_address_histories, mongo_client, ADDRESS_HISTORY_CACHE_MAX_BYTES
+            )
 
         # Store the last seen transaction ID in the cache for future updates
         latest_address_data.last_seen_txid = latest_address_data.transactions[0].txid
@@ -96,6 +194,289 @@ async def get_address_data(
         return latest_address_data
 
 
+async def get_new_transactions(
+    api_worker: BlockstreamAPIWorker,
+    latest_address_data: BitcoinAddressQueryResponse,
+    cached_txid: str,
+    on_page: Optional[Callable[[int], None]] = None,
+) -> List[Transaction]:
+    """
+    Get the transactions of an address newer than a cached transaction, paging from the first page
+    of transactions until the cached transaction is reached.
+
+    @param api_worker: The blockstream.com API worker instance.
+    @param latest_address_data: The address information with the first page of transactions.
+    @param cached_txid: The ID of the newest cached confirmed transaction.
+    @param on_page: Called with the number of pages fetched so far after each page.
+    @return: The transactions newer than the cached transaction, including the mempool ones.
+    """
+    first_page = latest_address_data.transactions
+    for i, tx in enumerate(first_page):
+        if tx.txid == cached_txid:
+            return first_page[:i]
+    if not first_page:
+        return []
+    return first_page + await get_transaction_range(
+        api_worker,
+        latest_address_data.address,
+        last_seen_txid=first_page[-1].txid,
+        on_page=on_page,
+        stop_txid=cached_txid,
+    )
+
+
+async def get_sampled_address_data(
+    api_worker: BlockstreamAPIWorker,
+    latest_address_data: BitcoinAddressQueryResponse,
+    on_progress: Optional[ProgressCallback] = None,
+) -> BitcoinAddressQueryResponse:
+    """
+    Sample the history of an address with a fixed budget of pages: the SAMPLED_HISTORY_RECENT_PAGES
+    most recent pages, and up to SAMPLED_HISTORY_STRATA pages spread across the older history. Pages
+    can only be fetched from a known transaction, so the older pages start at unspent outputs of the
+    address picked at evenly spaced heights.
+
+    @param api_worker: The blockstream.com API worker instance.
+    @param latest_address_data: The address information with the first page of transactions.
+    @param on_progress: Called with the number of transactions and of pages fetched so far.
+    @return: The address data with the sampled transactions, one contiguous run per segment.
+    """
+    address = latest_address_data.address
+    tx_count = latest_address_data.chain_stats.tx_count
+    num_pages = 1
+
+    def on_page(_):
+        nonlocal num_pages
+        num_pages += 1
+        if on_progress is not None:
+            on_progress(tx_count, num_pages)
+
+    first_page = latest_address_data.transactions
+    recent_transactions = first_page + await get_transaction_range(
+        api_worker,
+        address,
+        last_seen_txid=first_page[-1].txid,
+        on_page=on_page,
+        max_pages=SAMPLED_HISTORY_RECENT_PAGES - 1,
+    )
+    segments = [recent_transactions]
+    seen_txids = {tx.txid for tx in recent_transactions}
+    recent_heights = [
+        tx.status.block_height for tx in recent_transactions if tx.status.confirmed
+    ]
+
+    utxos = await get_address_utxos(api_worker, address)
+    on_page(None)
+    if utxos and recent_heights:
+        # Unspent outputs older than the recent pages, one per target height
+        anchors = sorted(
+            (utxo.status.block_height, utxo.txid)
+            for utxo in utxos
+            if utxo.status.confirmed and utxo.status.block_height < min(recent_heights)
+        )
+        anchor_txids = []
+        if anchors:
+            anchor_heights = [height for height, _ in anchors]
+            first_height, last_height = anchor_heights[0], anchor_heights[-1]
+            for i in range(SAMPLED_HISTORY_STRATA):
+                target_height = first_height + (last_height - first_height) * i / max(
+                    SAMPLED_HISTORY_STRATA - 1, 1
+                )
+                index = min(
+                    bisect.bisect_left(anchor_heights, target_height), len(anchors) - 1
+                )
+                if anchors[index][1] not in anchor_txids:
+                    anchor_txids.append(anchors[index][1])
+
+        for anchor_txid in anchor_txids:
+            page = await get_transaction_range(
+                api_worker,
+                address,
+                last_seen_txid=anchor_txid,
+                on_page=on_page,
+                max_pages=1,
+            )
+            page = [tx for tx in page if tx.txid not in seen_txids]
+            seen_txids.update(tx.txid for tx in page)
+            if page:
+                segments.append(page)
+
+    # Most recent first within each segment, so the gaps between transactions are consecutive
+    segments = [
+        sorted(segment, key=lambda tx: tx.status.block_height or 0, reverse=True)
+        for segment in segments
+    ]
+    logger.info(
+        f"Sampled {len(seen_txids)} of the {tx_count} transactions of {address} in {len(segments)} segments"
+    )
+    latest_address_data.transactions = [tx for segment in segments for tx in segment]
+    latest_address_data.sample_segments = [len(segment) for segment in segments]
+    latest_address_data.last_seen_txid = first_page[0].txid
+    return latest_address_data
+
+
+def _block_gaps(
+    segments: List[List[Transaction]],
+    address: str,
+    role: Optional[str],
+    include_mempool: bool,
+) -> List[int]:
+    """
+    Get the numbers of blocks between consecutive transactions within each segment of a sample.
+
+    @param segments: The segments of consecutive transactions, most recent first.
+    @param address: The address the transactions were sampled for.
+    @param role: "sender" or "receiver" to only count the transactions where the address has this
+    role, None to count every transaction.
+    @param include_mempool: Whether the unconfirmed transactions are counted.
+    @return: The gaps between consecutive transactions.
+    """
+    gaps = []
+    for segment in segments:
+        previous_height = None
+        for tx in segment:
+            if not tx.status.confirmed and not include_mempool:
+                continue
+            if role == "sender" and not any(
+                tx_input.prevout is not None
+                and tx_input.prevout.scriptpubkey_address == address
+                for tx_input in tx.vin
+            ):
+                continue
+            if role == "receiver" and not any(
+                tx_output.scriptpubkey_address == address for tx_output in tx.vout
+            ):
+                continue
+            if previous_height is not None:
+                gaps.append(abs(tx.status.block_height - previous_height))
+            previous_height = tx.status.block_height
+    return gaps
+
+
+def _gap_statistics(gaps: List[int], num_gaps: int, prefix: str) -> dict:
+    """
+    Estimate the statistics of the gaps between the transactions of a whole history from the gaps
+    within the segments of a sample.
+
+    @param gaps: The gaps within the segments of the sample.
+    @param num_gaps: The number of gaps in the whole history.
+    @param prefix: The prefix of the WalletData fields, e.g. "blocks_btwn_txs".
+    @return: The WalletData fields.
+    """
+    if not gaps or num_gaps <= 0:
+        return {}
+    mean = sum(gaps) / len(gaps)
+    return {
+        f"{prefix}_total": mean * num_gaps,
+        f"{prefix}_min": min(gaps),
+        f"{prefix}_max": max(gaps),
+        f"{prefix}_mean": mean,
+        f"{prefix}_median": sorted(gaps)[len(gaps) // 2],
+    }
+
+
+def convert_sampled_to_wallet_data(
+    address_query_response: BitcoinAddressQueryResponse,
+    include_mempool: bool = False,
+) -> Tuple[WalletData, ConnectedWallets]:
+    """
+    Converts a BitcoinAddressQueryResponse with a sampled history to an approximate WalletData
+    object. The statistics are computed from the sample, then the totals the address statistics
+    give exactly replace the sampled ones and the counts are scaled up to the whole history. The
+    connected wallets are the ones of the sampled transactions only.
+
+    @param address_query_response: The address data with the sampled transactions.
+    @param include_mempool: Whether the unconfirmed transactions are counted.
+    @return: The approximate WalletData object.
+    @return: The ConnectedWallets object of the sampled transactions.
+    """
+    sample = address_query_response.model_copy(update={"sample_segments": None})
+    wallet_data, connected_wallets = convert_to_wallet_data(sample, include_mempool)
+
+    segments = []
+    start = 0
+    for length in address_query_response.sample_segments:
+        segments.append(address_query_response.transactions[start : start + length])
+        start += length
+    num_sampled = sum(
+        1
+        for tx in address_query_response.transactions
+        if tx.status.confirmed or include_mempool
+    )
+    if num_sampled == 0:
+        return wallet_data.model_copy(update={"is_approximate": True}), connected_wallets
+
+    stats = [address_query_response.chain_stats]
+    if include_mempool:
+        stats.append(address_query_response.mempool_stats)
+    funded_txo_count = sum(stat.funded_txo_count for stat in stats)
+    funded_txo_sum = sum(stat.funded_txo_sum for stat in stats)
+    spent_txo_count = sum(stat.spent_txo_count for stat in stats)
+    spent_txo_sum = sum(stat.spent_txo_sum for stat in stats)
+
+    # Each sending transaction spends, and each receiving one funds, at least one output of the address
+    scale = wallet_data.total_txs / num_sampled
+    num_txs_as_sender = min(
+        round(wallet_data.num_txs_as_sender * scale), spent_txo_count
+    )
+    num_txs_as_receiver = min(
+        round(wallet_data.num_txs_as_receiver * scale), funded_txo_count
+    )
+
+    # Exact totals from the address statistics
+    btc_sent_total = spent_txo_sum * SATOSHIS_TO_BTC
+    btc_received_total = funded_txo_sum * SATOSHIS_TO_BTC
+    btc_transacted_total = btc_sent_total + btc_received_total
+    fees_total = (
+        wallet_data.fees_total * num_txs_as_sender / wallet_data.num_txs_as_sender
+        if wallet_data.num_txs_as_sender
+        else 0.0
+    )
+    btc_sent_mean = btc_sent_total / num_txs_as_sender if num_txs_as_sender else 0.0
+    fees_mean = fees_total / num_txs_as_sender if num_txs_as_sender else 0.0
+
+    address = address_query_response.address
+    updates = {
+        "num_txs_as_sender": num_txs_as_sender,
+        "num_txs_as_receiver": num_txs_as_receiver,
+        "btc_transacted_total": btc_transacted_total,
+        "btc_transacted_mean": btc_transacted_total / wallet_data.total_txs,
+        "btc_sent_total": btc_sent_total,
+        "btc_sent_mean": btc_sent_mean,
+        "btc_received_total": btc_received_total,
+        "btc_received_mean": (
+            btc_received_total / num_txs_as_receiver if num_txs_as_receiver else 0.0
+        ),
+        "fees_total": fees_total,
+        "fees_mean": fees_mean,
+        "fees_as_share_total": fees_total / btc_sent_total if btc_sent_total else 0.0,
+        "fees_as_share_mean": fees_mean / btc_sent_mean if btc_sent_mean else 0.0,
+        "is_approximate": True,
+    }
+    updates.update(
+        _gap_statistics(
+            _block_gaps(segments, address, None, include_mempool),
+            int(wallet_data.total_txs) - 1,
+            "blocks_btwn_txs",
+        )
+    )
+    updates.update(
+        _gap_statistics(
+            _block_gaps(segments, address, "sender", include_mempool),
+            num_txs_as_sender - 1,
+            "blocks_btwn_input_txs",
+        )
+    )
+    updates.update(
+        _gap_statistics(
+            _block_gaps(segments, address, "receiver", include_mempool),
+            num_txs_as_receiver - 1,
+            "blocks_btwn_output_txs",
+        )
+    )
+    return wallet_data.model_copy(update=updates), connected_wallets
+
+
 def convert_to_wallet_data(
     address_query_response: BitcoinAddressQueryResponse,
     include_mempool: bool = False,
@@ -109,6 +490,9 @@ def convert_to_wallet_data(
     Returns:
         WalletData: The populated WalletData object.
     """
+    if address_query_response.sample_segments is not None:
+        return convert_sampled_to_wallet_data(address_query_response, include_mempool)
+
     # Extract transactions
     transactions = address_query_response.transactions
 
@@ -0,0 +1,166 @@
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Optional, Tuple
+
+from src.config import UPSTREAM_CACHE_DIR, UPSTREAM_CACHE_MAX_BYTES
+from src.models import UpstreamCacheStats
+
+CACHE_FILE_SUFFIX = ".z"
+
+logger = logging.getLogger(__name__)
+
+
+class DiskResponseCache:
+    """
+    A size bounded disk cache of upstream HTTP responses that never change, keyed by the SHA-256 of
+    their URL. Responses are stored zlib compressed, one file per response, and the least recently
+    used ones are evicted when the cache outgrows its size cap. The access order is kept in the
+    file modification times, so it survives restarts.
+
+    The methods do blocking file I/O and compression and are called from worker threads, the index is
+    guarded by a lock held only around its updates.
+    """
+
+    def __init__(
+        self, directory: str = UPSTREAM_CACHE_DIR, max_bytes: int = UPSTREAM_CACHE_MAX_BYTES
+    ) -> None:
+        """
+        Initialize the cache, indexing the responses already on disk.
+
+        Parameters:
+        - directory: The directory of the cache files
+        - max_bytes: The maximum total size of the cache files
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        # Least recently used first, values are file sizes
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        files = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith(CACHE_FILE_SUFFIX):
+                stat = entry.stat()
+                key = entry.name[: -len(CACHE_FILE_SUFFIX)]
+                files.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self.size_bytes += size
+        logger.info(
+            f"Indexed {len(self._entries)} cached upstream responses in {directory}"
+        )
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def get(self, url: str) -> Optional[Tuple[int, str]]:
+        """
+        Get a cached response.
+
+        Parameters:
+        - url: The URL of the request
+
+        Returns:
+        - The status code and the body of the response, None if it is not cached
+        """
+        key = self._key(url)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                data = zlib.decompress(file.read()).decode()
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another thread meanwhile
+            with self._lock:
+                self.misses += 1
+            return None
+        except (OSError, zlib.error, UnicodeDecodeError) as e:
+            logger.error(f"Dropping unreadable cached response for {url}: {e}")
+            with self._lock:
+                self._remove(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        status_code, _, body = data.partition("\n")
+        return int(status_code), body
+
+    def set(self, url: str, status_code: int, body: str) -> None:
+        """
+        Cache a response, evicting the least recently used responses if the cache is full.
+
+        Parameters:
+        - url: The URL of the request
+        - status_code: The status code of the response
+        - body: The body of the response
+        """
+        key = self._key(url)
+        data = zlib.compress(f"{status_code}\n{body}".encode())
+        path = self._path(key)
+        # A temporary file per thread, a crash never leaves a truncated response behind and
+        # concurrent stores of the same response never write to the same file
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary_path, "wb") as file:
+                file.write(data)
+            os.replace(temporary_path, path)
+        except OSError as e:
+            logger.error(f"Error caching response for {url}: {e}")
+            return
+
+        with self._lock:
+            self.size_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self.stores += 1
+            while self.size_bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> UpstreamCacheStats:
+        """
+        Get the cache counters.
+        """
+        return UpstreamCacheStats(
+            entries=len(self._entries),
+            size_bytes=self.size_bytes,
+            max_bytes=self.max_bytes,
+            hits=self.hits,
+            misses=self.misses,
+            stores=self.stores,
+            evictions=self.evictions,
+        )
+
+    def _remove(self, key: str) -> None:
+        """
+        Remove a cached response from the index and the disk, with the lock held.
+
+        Parameters:
+        - key: The key of the response
+        """
+        self.size_bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _key(self, url: str) -> str:
+        return sha256(url.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + CACHE_FILE_SUFFIX)
@@ -6,16 +6,36 @@ import uvicorn
 
 from src.config import (
     API_CONNECTED_WALLETS_ROUTE_PREFIX,
+    API_EVENTS_ROUTE_PREFIX,
+    API_EXPORT_ROUTE_PREFIX,
+    API_GRAPH_NODE_ROUTE_PREFIX,
+    API_JOBS_ROUTE_PREFIX,
+    API_METRICS_ROUTE_PREFIX,
+    API_SUBGRAPH_ROUTE_PREFIX,
+    ALL_WORKER_ROUTE_PREFIX,
+    APPLICATION_TYPE_ALL,
     APPLICATION_TYPE_API,
     APPLICATION_TYPE_WORKER,
     LOG_LEVEL,
     APPLICATION_TYPE,
+    WORKER_EVENTS_ROUTE_PREFIX,
+    WORKER_JOBS_ROUTE_PREFIX,
+    WORKER_METRICS_ROUTE_PREFIX,
     WORKER_WALLET_ROUTE_PREFIX,
 )
 from src.routes.api import wallet_data
 from src.routes.api import connected_wallets
+from src.routes.api import subgraph
+from src.routes.api import graph_node
+from src.routes.api import metrics
+from src.routes.api import scoring_jobs
+from src.routes.api import events
+from src.routes.api import export
 from src.routes.worker import new_wallet_data
-from src.shared.state import api_lifespan, worker_lifespan
+from src.routes.worker import scoring_jobs as worker_scoring_jobs
+from src.routes.worker import events as worker_events
+from src.routes.worker import metrics as worker_metrics
+from src.shared.state import all_lifespan, api_lifespan, worker_lifespan
 
 # Configure logging
 logging.basicConfig(level=LOG_LEVEL.upper())
@@ -25,6 +45,8 @@ if APPLICATION_TYPE == APPLICATION_TYPE_API:
     fastapi_lifespan = api_lifespan
 elif APPLICATION_TYPE == APPLICATION_TYPE_WORKER:
     fastapi_lifespan = worker_lifespan
+elif APPLICATION_TYPE == APPLICATION_TYPE_ALL:
+    fastapi_lifespan = all_lifespan
 else:
     logger.fatal(f"Unknown application type: {APPLICATION_TYPE}")
     exit(1)
@@ -42,18 +64,41 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
-    allow_methods=["GET", "OPTIONS"],
+    allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
 )
 
-if APPLICATION_TYPE == APPLICATION_TYPE_API:
+# The worker routes are mounted under a prefix when they share the process with the API routes
+worker_route_prefix = (
+    ALL_WORKER_ROUTE_PREFIX if APPLICATION_TYPE == APPLICATION_TYPE_ALL else ""
+)
+
+if APPLICATION_TYPE in (APPLICATION_TYPE_API, APPLICATION_TYPE_ALL):
     app.include_router(wallet_data.router, prefix="/wallet")
     app.include_router(
         connected_wallets.router, prefix=API_CONNECTED_WALLETS_ROUTE_PREFIX
     )
+    app.include_router(subgraph.router, prefix=API_SUBGRAPH_ROUTE_PREFIX)
+    app.include_router(graph_node.router, prefix=API_GRAPH_NODE_ROUTE_PREFIX)
+    app.include_router(metrics.router, prefix=API_METRICS_ROUTE_PREFIX)
+    app.include_router(scoring_jobs.router, prefix=API_JOBS_ROUTE_PREFIX)
+    app.include_router(events.router, prefix=API_EVENTS_ROUTE_PREFIX)
+    app.include_router(export.router, prefix=API_EXPORT_ROUTE_PREFIX)
 
-elif APPLICATION_TYPE == APPLICATION_TYPE_WORKER:
-    app.include_router(new_wallet_data.router, prefix=WORKER_WALLET_ROUTE_PREFIX)
+if APPLICATION_TYPE in (APPLICATION_TYPE_WORKER, APPLICATION_TYPE_ALL):
+    app.include_router(
+        new_wallet_data.router, prefix=worker_route_prefix + WORKER_WALLET_ROUTE_PREFIX
+    )
+    app.include_router(
+        worker_scoring_jobs.router,
+        prefix=worker_route_prefix + WORKER_JOBS_ROUTE_PREFIX,
+    )
+    app.include_router(
+        worker_events.router, prefix=worker_route_prefix + WORKER_EVENTS_ROUTE_PREFIX
+    )
+    app.include_router(
+        worker_metrics.router, prefix=worker_route_prefix + WORKER_METRICS_ROUTE_PREFIX
+    )
 
 if __name__ == "__main__":
     uvicorn.run(app)
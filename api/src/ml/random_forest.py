@@ -3,7 +3,7 @@ from onnxruntime import InferenceSession
 import numpy as np
 
 from src.shared.ml_session import MLSession
-from src.models import WalletData
+from src.models import WalletData, feature_vector_to_ml_model_input
 
 
 def classify_wallet(ort_session: InferenceSession, wallet_data: np.ndarray) -> int:
@@ -26,6 +26,23 @@ def classify_wallet(ort_session: InferenceSession, wallet_data: np.ndarray) -> i
     return int(outputs[0][0])
 
 
+def infer_feature_vector_class(ml_session: MLSession, features: np.ndarray) -> int:
+    """
+    Classify a wallet from its packed feature vector, as stored in the database.
+
+    Parameters:
+    - ml_session: The min max scalers and the ONNX runtime session for the random forest model
+    - features: The wallet features, in the order given by WALLET_FEATURE_NAMES
+
+    Returns:
+    - The classification result (licit: 0 or illicit: 1)
+    """
+    model_input = feature_vector_to_ml_model_input(
+        features, ml_session.min_max_scalers
+    )
+    return classify_wallet(ml_session.ort_session, model_input)
+
+
 def infer_wallet_data_class(
     ml_session: MLSession, wallet_data: WalletData
 ) -> WalletData:
@@ -41,9 +58,8 @@ def infer_wallet_data_class(
     """
 
     new_wallet_data = wallet_data.model_copy()
-    wallet_data_values = wallet_data.to_ml_model_input(ml_session.min_max_scalers)
-    new_wallet_data.class_inference = classify_wallet(
-        ml_session.ort_session, wallet_data_values
+    new_wallet_data.class_inference = infer_feature_vector_class(
+        ml_session, wallet_data.to_feature_vector()
     )
 
     return new_wallet_data
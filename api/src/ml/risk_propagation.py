@@ -0,0 +1,339 @@
+import asyncio
+import logging
+from time import perf_counter, time
+from typing import Dict, List, Optional, Set, Tuple
+
+from neo4j import Driver
+import numpy as np
+from scipy import sparse
+
+from src.config import (
+    RISK_PROPAGATION_CHUNK_SIZE,
+    RISK_PROPAGATION_DAMPING,
+    RISK_PROPAGATION_FULL_RUN_EVERY,
+    RISK_PROPAGATION_INTERVAL_S,
+    RISK_PROPAGATION_MAX_ITERATIONS,
+    RISK_PROPAGATION_TOLERANCE,
+    RISK_PROPAGATION_WRITE_BATCH_SIZE,
+)
+from src.db.neo4j import iter_wallet_adjacency_chunks, set_wallet_risk_scores_in_db
+from src.models import RiskPropagationStats
+
+ILLICIT_CLASS = 1
+
+logger = logging.getLogger(__name__)
+
+
+class RiskPropagationEngine:
+    """
+    Propagates the risk of illicit wallets to their counterparties over the TRANSACTED_WITH graph.
+
+    The graph is exported from Neo4j into a sparse adjacency matrix weighted by the amount transacted,
+    connections count in both directions. The risk scores are the fixed point of
+
+        r = (1 - damping) * s + damping * P r
+
+    where s is 1 for the wallets classified as illicit and 0 otherwise and P is the row normalized
+    adjacency matrix, a personalized PageRank seeded from the illicit wallets. Scores are in [0, 1].
+
+    The adjacency matrix and the scores are kept between runs, so later runs only export the wallets
+    updated since the previous run, warm start from the previous scores and only write back the
+    scores that changed.
+    """
+
+    def __init__(
+        self,
+        neo4j_driver: Driver,
+        damping: float = RISK_PROPAGATION_DAMPING,
+        tolerance: float = RISK_PROPAGATION_TOLERANCE,
+        max_iterations: int = RISK_PROPAGATION_MAX_ITERATIONS,
+        chunk_size: int = RISK_PROPAGATION_CHUNK_SIZE,
+        write_batch_size: int = RISK_PROPAGATION_WRITE_BATCH_SIZE,
+    ) -> None:
+        """
+        Initialize the risk propagation engine.
+
+        Parameters:
+        - neo4j_driver: The Neo4j driver instance
+        - damping: The share of a wallet's risk coming from its counterparties
+        - tolerance: The maximum change of any score between iterations to stop iterating
+        - max_iterations: The maximum number of iterations per run
+        - chunk_size: The number of wallets exported from Neo4j per query
+        - write_batch_size: The number of scores written to Neo4j per query
+        """
+        self.neo4j_driver = neo4j_driver
+        self.damping = damping
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.chunk_size = chunk_size
+        self.write_batch_size = write_batch_size
+
+        self.address_index: Dict[str, int] = {}
+        self.addresses: List[str] = []
+        self.seeds = np.zeros(0)
+        self.adjacency = sparse.csr_matrix((0, 0))
+        self.scores = np.zeros(0)
+        self.written_scores = np.zeros(0)
+        self.last_run_timestamp: Optional[int] = None
+        self._running = False
+
+    async def start(self) -> None:
+        """
+        Periodically run the propagation, a full run first and every RISK_PROPAGATION_FULL_RUN_EVERY
+        runs, incremental runs otherwise.
+        """
+        logger.info("Starting risk propagation")
+        self._running = True
+        num_runs = 0
+        while self._running:
+            try:
+                full = num_runs % RISK_PROPAGATION_FULL_RUN_EVERY == 0
+                # The Neo4j driver and the iteration are blocking, keep them off the event loop
+                await asyncio.to_thread(self.run, full)
+                num_runs += 1
+            except Exception as e:
+                logger.error(f"Error in risk propagation: {e}")
+                logger.exception(e)
+            await asyncio.sleep(RISK_PROPAGATION_INTERVAL_S)
+
+    def stop(self) -> None:
+        """
+        Stop the periodic propagation.
+        """
+        logger.info("Stopping risk propagation")
+        self._running = False
+
+    def run(self, full: bool = False) -> RiskPropagationStats:
+        """
+        Export the graph, propagate the risk and write the changed scores back to the database.
+
+        Parameters:
+        - full: Re-export the whole graph instead of the wallets updated since the last run
+
+        Returns:
+        - The statistics of the run
+        """
+        incremental = not full and self.last_run_timestamp is not None
+        # Taken before the export, the next run exports the wallets updated from this second on, so
+        # the ones updated in this second are exported twice rather than missed
+        run_timestamp = int(time())
+
+        start = perf_counter()
+        if incremental:
+            num_exported_wallets = self._export_updated_wallets(self.last_run_timestamp)
+        else:
+            num_exported_wallets = self._export_graph()
+        export_seconds = perf_counter() - start
+
+        start = perf_counter()
+        iterations, converged = self._propagate()
+        propagation_seconds = perf_counter() - start
+
+        start = perf_counter()
+        num_written_scores = self._write_changed_scores()
+        write_seconds = perf_counter() - start
+
+        self.last_run_timestamp = run_timestamp
+
+        stats = RiskPropagationStats(
+            incremental=incremental,
+            num_wallets=len(self.addresses),
+            num_edges=self.adjacency.nnz,
+            num_seeds=int(self.seeds.sum()),
+            num_exported_wallets=num_exported_wallets,
+            iterations=iterations,
+            converged=converged,
+            export_seconds=export_seconds,
+            propagation_seconds=propagation_seconds,
+            iterations_per_second=(
+                iterations / propagation_seconds if propagation_seconds > 0 else 0.0
+            ),
+            num_written_scores=num_written_scores,
+            write_seconds=write_seconds,
+        )
+        logger.info(
+            f"Risk propagation ({'incremental' if incremental else 'full'}): "
+            f"{stats.num_wallets} wallets, {stats.num_edges} edges, {stats.num_seeds} seeds, "
+            f"{stats.iterations} iterations at {stats.iterations_per_second:.1f} it/s, "
+            f"export {stats.export_seconds:.1f}s, wrote {stats.num_written_scores} scores "
+            f"in {stats.write_seconds:.1f}s"
+        )
+        return stats
+
+    def _get_or_add_index(self, address: str) -> int:
+        """
+        Get the matrix index of a wallet, assigning the next index to wallets not seen before.
+
+        Parameters:
+        - address: The address of the wallet
+        """
+        index = self.address_index.get(address)
+        if index is None:
+            index = len(self.addresses)
+            self.address_index[address] = index
+            self.addresses.append(address)
+        return index
+
+    def _resize(self) -> None:
+        """
+        Grow the seed, score and adjacency arrays to the number of known wallets.
+        """
+        num_wallets = len(self.addresses)
+        num_new = num_wallets - len(self.seeds)
+        if num_new <= 0:
+            return
+        self.seeds = np.concatenate([self.seeds, np.zeros(num_new)])
+        self.scores = np.concatenate([self.scores, np.zeros(num_new)])
+        self.written_scores = np.concatenate(
+            [self.written_scores, np.full(num_new, np.nan)]
+        )
+        self.adjacency.resize((num_wallets, num_wallets))
+
+    def _export_graph(self) -> int:
+        """
+        Export the whole graph from the database, replacing the adjacency matrix.
+
+        Returns:
+        - The number of exported wallets
+        """
+        rows: List[np.ndarray] = []
+        cols: List[np.ndarray] = []
+        weights: List[np.ndarray] = []
+        seed_indices: List[int] = []
+        num_exported_wallets = 0
+
+        for chunk in iter_wallet_adjacency_chunks(self.neo4j_driver, self.chunk_size):
+            chunk_rows, chunk_cols, chunk_weights = [], [], []
+            for wallet in chunk:
+                index = self._get_or_add_index(wallet["address"])
+                if wallet["class_inference"] == ILLICIT_CLASS:
+                    seed_indices.append(index)
+                for address, amount_transacted in wallet["outbound"]:
+                    chunk_rows.append(index)
+                    chunk_cols.append(self._get_or_add_index(address))
+                    chunk_weights.append(amount_transacted)
+            rows.append(np.array(chunk_rows, dtype=np.int64))
+            cols.append(np.array(chunk_cols, dtype=np.int64))
+            weights.append(np.array(chunk_weights, dtype=np.float64))
+            num_exported_wallets += len(chunk)
+
+        num_wallets = len(self.addresses)
+        self._resize()
+        self.seeds[:] = 0.0
+        self.seeds[seed_indices] = 1.0
+        self.adjacency = sparse.csr_matrix(
+            (
+                np.concatenate(weights) if weights else np.zeros(0),
+                (
+                    np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64),
+                    np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64),
+                ),
+            ),
+            shape=(num_wallets, num_wallets),
+        )
+        return num_exported_wallets
+
+    def _export_updated_wallets(self, updated_since: int) -> int:
+        """
+        Export the wallets updated since the last run and replace their connections in the
+        adjacency matrix, connections between other wallets are kept.
+
+        Parameters:
+        - updated_since: The unix timestamp of the start of the last run
+
+        Returns:
+        - The number of exported wallets
+        """
+        updated_wallets = [
+            wallet
+            for chunk in iter_wallet_adjacency_chunks(
+                self.neo4j_driver, self.chunk_size, updated_since
+            )
+            for wallet in chunk
+        ]
+        if not updated_wallets:
+            return 0
+
+        updated_indices: Set[int] = set()
+        for wallet in updated_wallets:
+            index = self._get_or_add_index(wallet["address"])
+            updated_indices.add(index)
+
+        edges: List[Tuple[int, int, float]] = []
+        for wallet in updated_wallets:
+            index = self.address_index[wallet["address"]]
+            for address, amount_transacted in wallet["outbound"]:
+                edges.append((index, self._get_or_add_index(address), amount_transacted))
+            for address, amount_transacted in wallet["inbound"]:
+                source = self._get_or_add_index(address)
+                if source in updated_indices:
+                    continue  # Already exported as an outbound connection of the source
+                edges.append((source, index, amount_transacted))
+
+        self._resize()
+        num_wallets = len(self.addresses)
+        for wallet in updated_wallets:
+            index = self.address_index[wallet["address"]]
+            self.seeds[index] = (
+                1.0 if wallet["class_inference"] == ILLICIT_CLASS else 0.0
+            )
+
+        # Drop every connection of the updated wallets and add back the exported ones
+        keep = np.ones(num_wallets)
+        keep[list(updated_indices)] = 0.0
+        keep_matrix = sparse.diags(keep)
+        rows, cols, weights = zip(*edges) if edges else ((), (), ())
+        delta = sparse.csr_matrix(
+            (weights, (rows, cols)), shape=(num_wallets, num_wallets)
+        )
+        self.adjacency = (keep_matrix @ self.adjacency @ keep_matrix + delta).tocsr()
+        self.adjacency.eliminate_zeros()
+        return len(updated_wallets)
+
+    def _propagate(self) -> Tuple[int, bool]:
+        """
+        Iterate the propagation until convergence, warm started from the previous scores.
+
+        Returns:
+        - The number of iterations and whether the iteration converged
+        """
+        # Risk spreads both ways over a connection, weighted by the amount transacted
+        symmetric = (self.adjacency + self.adjacency.T).tocsr()
+        degrees = np.asarray(symmetric.sum(axis=1)).ravel()
+        inverse_degrees = np.divide(
+            1.0, degrees, out=np.zeros_like(degrees), where=degrees > 0
+        )
+        transition = (sparse.diags(inverse_degrees) @ symmetric).tocsr()
+
+        teleport = (1.0 - self.damping) * self.seeds
+        scores = self.scores
+        for iteration in range(1, self.max_iterations + 1):
+            new_scores = teleport + self.damping * (transition @ scores)
+            delta = np.abs(new_scores - scores).max() if len(scores) else 0.0
+            scores = new_scores
+            if delta < self.tolerance:
+                self.scores = scores
+                return iteration, True
+
+        self.scores = scores
+        return self.max_iterations, False
+
+    def _write_changed_scores(self) -> int:
+        """
+        Write the scores that changed since they were last written back to the database, in batches.
+
+        Returns:
+        - The number of written scores
+        """
+        changed = np.flatnonzero(
+            np.isnan(self.written_scores)
+            | (np.abs(self.scores - self.written_scores) >= self.tolerance)
+        )
+        for start in range(0, len(changed), self.write_batch_size):
+            batch = changed[start : start + self.write_batch_size]
+            set_wallet_risk_scores_in_db(
+                self.neo4j_driver,
+                [(self.addresses[i], float(self.scores[i])) for i in batch],
+            )
+            self.written_scores[batch] = self.scores[batch]
+        return len(changed)
@@ -1,6 +1,6 @@
 from datetime import datetime
 from pydantic import BaseModel, Field
-from typing import Dict, List, Optional
+from typing import Dict, List, Literal, Optional, Sequence
 import numpy as np
 from sklearn.preprocessing import MinMaxScaler
 
@@ -122,6 +122,71 @@ class WalletData(BaseModel):
     )
     last_updated: int  # The unix timestamp of the last update to the wallet data
     is_populated: bool  # Indicates if the wallet data is fully populated or just a stub created by connected wallets
+    risk_score: Optional[float] = (
+        None  # Exposure to illicit wallets propagated through the connections, None until computed
+    )
+    is_approximate: bool = (
+        False  # Whether the features were estimated from a sample of the transaction history
+    )
+
+    def to_feature_vector(self) -> np.ndarray:
+        """
+        Pack the numeric features of the wallet data into a vector, in the order given by
+        WALLET_FEATURE_NAMES.
+        """
+        return np.array(
+            [getattr(self, name) for name in WALLET_FEATURE_NAMES], dtype=np.float64
+        )
+
+    @classmethod
+    def from_feature_vector(
+        cls,
+        address: str,
+        features: Sequence[float],
+        class_inference: int,
+        last_updated: int,
+        is_populated: bool,
+        risk_score: Optional[float] = None,
+        is_approximate: bool = False,
+    ) -> "WalletData":
+        """
+        Build a wallet data object from a packed feature vector.
+
+        Parameters:
+        - address: The Bitcoin wallet address
+        - features: The feature values, in the order given by WALLET_FEATURE_NAMES
+        - class_inference: The class of the wallet as inferred by the model
+        - last_updated: The unix timestamp of the last update to the wallet data
+        - is_populated: Whether the wallet data is fully populated
+        - risk_score: The propagated risk score of the wallet, if computed
+        - is_approximate: Whether the features were estimated from a sampled history
+        """
+        return cls(
+            address=address,
+            **dict(zip(WALLET_FEATURE_NAMES, features)),
+            class_inference=class_inference,
+            last_updated=last_updated,
+            is_populated=is_populated,
+            risk_score=risk_score,
+            is_approximate=is_approximate,
+        )
+
+    @classmethod
+    def stub(cls, address: str, last_updated: int) -> "WalletData":
+        """
+        Build the zero-filled wallet data of a stub wallet, created by connected wallets but not yet populated.
+
+        Parameters:
+        - address: The Bitcoin wallet address
+        - last_updated: The unix timestamp of the creation of the stub
+        """
+        return cls.from_feature_vector(
+            address,
+            [0.0] * len(WALLET_FEATURE_NAMES),
+            class_inference=-1,
+            last_updated=last_updated,
+            is_populated=False,
+        )
 
     def to_ml_model_input(self, min_max_scalers: Dict[str, MinMaxScaler]) -> np.ndarray:
         """
@@ -130,103 +195,216 @@ class WalletData(BaseModel):
         Parameters:
         - min_max_scalers: The MinMax scalers used to preprocess the input data, indexed by feature name
         """
+        return feature_vector_to_ml_model_input(
+            self.to_feature_vector(), min_max_scalers
+        )
+
 
-        # Selected Features for the model (in order):
-        # ['btc_transacted_max', 'blocks_btwn_txs_min', 'fees_min', 'first_block_appeared_in', 'btc_transacted_mean', 'btc_transacted_median', 'fees_median', 'blocks_btwn_input_txs_total', 'blocks_btwn_txs_max', 'transacted_w_address_total', 'fees_total', 'fees_as_share_median', 'btc_transacted_min', 'fees_as_share_min', 'fees_as_share_mean', 'transacted_w_address_max', 'first_sent_block', 'lifetime_in_blocks', 'num_txs_as_sender', 'fees_as_share_max', 'transacted_w_address_mean', 'first_received_block', 'num_txs_as_receiver', 'fees_max', 'blocks_btwn_txs_total', 'transacted_w_address_median', 'fees_as_share_total', 'blocks_btwn_txs_mean', 'last_block_appeared_in', 'fees_mean']
-        values = [
-            min_max_scalers["btc_transacted_max"].transform(
-                np.array([[self.btc_transacted_max]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["blocks_btwn_txs_min"].transform(
-                np.array([[self.blocks_btwn_txs_min]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["fees_min"].transform(
-                np.array([[self.fees_min]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["first_block_appeared_in"].transform(
-                np.array([[self.first_block_appeared_in]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["btc_transacted_mean"].transform(
-                np.array([[self.btc_transacted_mean]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["btc_transacted_median"].transform(
-                np.array([[self.btc_transacted_median]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["fees_median"].transform(
-                np.array([[self.fees_median]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["blocks_btwn_input_txs_total"].transform(
-                np.array([[self.blocks_btwn_input_txs_total]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["blocks_btwn_txs_max"].transform(
-                np.array([[self.blocks_btwn_txs_max]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["transacted_w_address_total"].transform(
-                np.array([[self.transacted_w_address_total]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["fees_total"].transform(
-                np.array([[self.fees_total]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["fees_as_share_median"].transform(
-                np.array([[self.fees_as_share_median]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["btc_transacted_min"].transform(
-                np.array([[self.btc_transacted_min]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["fees_as_share_min"].transform(
-                np.array([[self.fees_as_share_min]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["fees_as_share_mean"].transform(
-                np.array([[self.fees_as_share_mean]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["transacted_w_address_max"].transform(
-                np.array([[self.transacted_w_address_max]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["first_sent_block"].transform(
-                np.array([[self.first_sent_block]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["lifetime_in_blocks"].transform(
-                np.array([[self.lifetime_in_blocks]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["num_txs_as_sender"].transform(
-                np.array([[self.num_txs_as_sender]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["fees_as_share_max"].transform(
-                np.array([[self.fees_as_share_max]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["transacted_w_address_mean"].transform(
-                np.array([[self.transacted_w_address_mean]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["first_received_block"].transform(
-                np.array([[self.first_received_block]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["num_txs_as_receiver"].transform(
-                np.array([[self.num_txs_as_receiver]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["fees_max"].transform(
-                np.array([[self.fees_max]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["blocks_btwn_txs_total"].transform(
-                np.array([[self.blocks_btwn_txs_total]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["transacted_w_address_median"].transform(
-                np.array([[self.transacted_w_address_median]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["fees_as_share_total"].transform(
-                np.array([[self.fees_as_share_total]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["blocks_btwn_txs_mean"].transform(
-                np.array([[self.blocks_btwn_txs_mean]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["last_block_appeared_in"].transform(
-                np.array([[self.last_block_appeared_in]]).reshape(-1, 1)
-            )[0][0],
-            min_max_scalers["fees_mean"].transform(
-                np.array([[self.fees_mean]]).reshape(-1, 1)
-            )[0][0],
-        ]
-
-        return np.array(values)
+# The numeric features of WalletData, in the order they are packed into feature vectors and into the
+# `features` property of Wallet nodes. Only ever append to this list, vectors already stored in the
+# database are decoded by position.
+WALLET_FEATURE_NAMES = [
+    "num_txs_as_sender",
+    "num_txs_as_receiver",
+    "first_block_appeared_in",
+    "last_block_appeared_in",
+    "lifetime_in_blocks",
+    "total_txs",
+    "first_sent_block",
+    "first_received_block",
+    "btc_transacted_total",
+    "btc_transacted_min",
+    "btc_transacted_max",
+    "btc_transacted_mean",
+    "btc_transacted_median",
+    "btc_sent_total",
+    "btc_sent_min",
+    "btc_sent_max",
+    "btc_sent_mean",
+    "btc_sent_median",
+    "btc_received_total",
+    "btc_received_min",
+    "btc_received_max",
+    "btc_received_mean",
+    "btc_received_median",
+    "fees_total",
+    "fees_min",
+    "fees_max",
+    "fees_mean",
+    "fees_median",
+    "fees_as_share_total",
+    "fees_as_share_min",
+    "fees_as_share_max",
+    "fees_as_share_mean",
+    "fees_as_share_median",
+    "blocks_btwn_txs_total",
+    "blocks_btwn_txs_min",
+    "blocks_btwn_txs_max",
+    "blocks_btwn_txs_mean",
+    "blocks_btwn_txs_median",
+    "blocks_btwn_input_txs_total",
+    "blocks_btwn_input_txs_min",
+    "blocks_btwn_input_txs_max",
+    "blocks_btwn_input_txs_mean",
+    "blocks_btwn_input_txs_median",
+    "blocks_btwn_output_txs_total",
+    "blocks_btwn_output_txs_min",
+    "blocks_btwn_output_txs_max",
+    "blocks_btwn_output_txs_mean",
+    "blocks_btwn_output_txs_median",
+    "num_addr_transacted_multiple",
+    "transacted_w_address_total",
+    "transacted_w_address_min",
+    "transacted_w_address_max",
+    "transacted_w_address_mean",
+    "transacted_w_address_median",
+]
+WALLET_FEATURE_INDEX = {name: i for i, name in enumerate(WALLET_FEATURE_NAMES)}
+
+# Selected features for the model (in order)
+MODEL_FEATURE_NAMES = [
+    "btc_transacted_max",
+    "blocks_btwn_txs_min",
+    "fees_min",
+    "first_block_appeared_in",
+    "btc_transacted_mean",
+    "btc_transacted_median",
+    "fees_median",
+    "blocks_btwn_input_txs_total",
+    "blocks_btwn_txs_max",
+    "transacted_w_address_total",
+    "fees_total",
+    "fees_as_share_median",
+    "btc_transacted_min",
+    "fees_as_share_min",
+    "fees_as_share_mean",
+    "transacted_w_address_max",
+    "first_sent_block",
+    "lifetime_in_blocks",
+    "num_txs_as_sender",
+    "fees_as_share_max",
+    "transacted_w_address_mean",
+    "first_received_block",
+    "num_txs_as_receiver",
+    "fees_max",
+    "blocks_btwn_txs_total",
+    "transacted_w_address_median",
+    "fees_as_share_total",
+    "blocks_btwn_txs_mean",
+    "last_block_appeared_in",
+    "fees_mean",
+]
+
+
+def feature_vector_to_ml_model_input(
+    features: np.ndarray, min_max_scalers: Dict[str, MinMaxScaler]
+) -> np.ndarray:
+    """
+    Select and scale the model features from a packed wallet feature vector.
+
+    Parameters:
+    - features: The wallet features, in the order given by WALLET_FEATURE_NAMES
+    - min_max_scalers: The MinMax scalers used to preprocess the input data, indexed by feature name
+
+    Returns:
+    - The scaled model input, in the order given by MODEL_FEATURE_NAMES
+    """
+    values = [
+        min_max_scalers[name].transform(
+            np.array([[features[WALLET_FEATURE_INDEX[name]]]]).reshape(-1, 1)
+        )[0][0]
+        for name in MODEL_FEATURE_NAMES
+    ]
+
+    return np.array(values)
+
+
+class WalletVersion(BaseModel):
+    """
+    A model representing the version stamps of a wallet, used to answer conditional requests.
+    """
+
+    address: str  # The Bitcoin wallet address
+    is_populated: bool  # Whether the wallet data was fetched, False for stubs
+    last_updated: int  # When the wallet data was last updated, seconds (milliseconds for stubs)
+    risk_score: Optional[float] = None  # The propagated risk score, updated separately
+    connections_updated: int  # When an edge of the wallet was last written
+
+
+class WalletBatchRequest(BaseModel):
+    """
+    A model representing a request for the wallet data of many wallets.
+    """
+
+    addresses: List[str]  # The Bitcoin wallet addresses to look up
+
+
+class WalletBatchResponse(BaseModel):
+    """
+    A model representing the wallet data of many wallets.
+    """
+
+    wallets: List[WalletData]  # The wallet data of the populated wallets in the database
+    pending: List[
+        str
+    ]  # The addresses unknown to the database or stubs, queued to the worker
+
+
+class WalletBatchItem(BaseModel):
+    """
+    A model representing the result for one wallet of a streamed batch lookup.
+    """
+
+    address: str  # The Bitcoin wallet address
+    status: Literal["found", "not_found", "error"]  # The outcome of the lookup
+    wallet_data: Optional[WalletData] = None  # The wallet data if found
+
+
+# Statuses of a scoring job, a job is active until it is done, not found or failed
+SCORING_JOB_PENDING = "pending"
+SCORING_JOB_RUNNING = "running"
+SCORING_JOB_DONE = "done"
+SCORING_JOB_NOT_FOUND = "not_found"
+SCORING_JOB_FAILED = "failed"
+SCORING_JOB_ACTIVE_STATUSES = [SCORING_JOB_PENDING, SCORING_JOB_RUNNING]
+
+
+class ScoringJob(BaseModel):
+    """
+    A model representing a job fetching, scoring and storing a wallet in the background.
+    """
+
+    job_id: str  # The unique identifier of the job
+    address: str  # The Bitcoin wallet address being scored
+    force_update: bool = False  # Whether the wallet is refetched even if already populated
+    status: Literal[
+        "pending", "running", "done", "not_found", "failed"
+    ]  # The status of the job
+    tx_count: Optional[int] = None  # Number of transactions of the wallet, once known
+    estimated_pages: Optional[int] = (
+        None  # Estimated number of Blockstream API pages to fetch, once known
+    )
+    estimated_seconds: Optional[float] = (
+        None  # Estimated duration of the fetch at the rate limit, once known
+    )
+    pages_fetched: int = 0  # Number of Blockstream API pages fetched so far
+    created_at: float  # Unix timestamp of the job creation
+    updated_at: float  # Unix timestamp of the last status or progress update
+    error: Optional[str] = None  # The error message if the job failed
+
+
+class ScoringEvent(BaseModel):
+    """
+    A model representing an event published by the worker as wallets are scored.
+    """
+
+    event: Literal[
+        "wallet_scored", "job_progress", "job_finished"
+    ]  # The type of the event
+    address: str  # The Bitcoin wallet address the event is about
+    timestamp: float  # Unix timestamp of the event
+    class_inference: Optional[int] = None  # The inferred class, for wallet_scored events
+    job: Optional[ScoringJob] = None  # The state of the job, for job events
 
 
 class WalletConnectionDetails(BaseModel):
@@ -238,6 +416,17 @@ class WalletConnectionDetails(BaseModel):
     amount_transacted: float  # Total amount transacted between the wallets
 
 
+class ConnectionSummary(BaseModel):
+    """
+    A model representing the degree and volume of the connections of a hub wallet.
+    """
+
+    inbound_degree: int  # Number of wallets that have sent Bitcoin to the wallet
+    outbound_degree: int  # Number of wallets that have received Bitcoin from the wallet
+    inbound_volume: float  # Total amount received from the inbound connections
+    outbound_volume: float  # Total amount sent to the outbound connections
+
+
 class ConnectedWallets(BaseModel):
     """
     A model representing information about wallets that have transacted with a given wallet.
@@ -251,6 +440,9 @@ class ConnectedWallets(BaseModel):
     outbound_connections: Dict[
         str, WalletConnectionDetails
     ]  # Wallets that have received Bitcoin from the given wallet
+    summary: Optional[ConnectionSummary] = (
+        None  # Set for hub wallets, whose connections are limited to the top counterparties
+    )
 
     def is_empty(self):
         """
@@ -261,6 +453,259 @@ class ConnectedWallets(BaseModel):
         )
 
 
+class WalletConnection(BaseModel):
+    """
+    A model representing a connection of a wallet, with the address of the counterparty.
+    """
+
+    address: str  # The address of the counterparty
+    num_transactions: int  # Number of transactions between the wallets
+    amount_transacted: float  # Total amount transacted between the wallets
+
+
+class ConnectionsPage(BaseModel):
+    """
+    A model representing a page of the connections of a wallet, ordered by amount transacted.
+    """
+
+    wallet_address: str  # The address of the wallet
+    direction: str  # "inbound" for the wallets that sent Bitcoin to it, "outbound" for the others
+    connections: List[WalletConnection]  # The connections in the page
+    next_cursor: Optional[str] = None  # The cursor of the next page, None on the last page
+
+
+class SubgraphNode(BaseModel):
+    """
+    A model representing a wallet in a subgraph, without its wallet data.
+    """
+
+    address: str  # The address of the wallet
+    class_inference: int  # The class of the wallet as inferred by the model, -1 if unknown
+    is_populated: bool  # Indicates if the wallet data is fully populated or just a stub
+
+
+class SubgraphEdge(BaseModel):
+    """
+    A model representing a connection between two wallets in a subgraph.
+    """
+
+    source: str  # The address of the wallet that sent Bitcoin
+    target: str  # The address of the wallet that received Bitcoin
+    num_transactions: int  # Number of transactions between the wallets
+    amount_transacted: float  # Total amount transacted between the wallets
+
+
+class Subgraph(BaseModel):
+    """
+    A model representing the k-hop neighbourhood of a wallet.
+    """
+
+    root_address: str  # The address of the wallet at the center of the subgraph
+    depth: int  # The maximum number of hops from the root wallet
+    nodes: List[SubgraphNode]  # The wallets in the subgraph, the root wallet first
+    edges: List[SubgraphEdge]  # The connections between the wallets in the subgraph
+    truncated: bool  # Indicates if wallets were left out because of the node limit
+
+
+class GraphNode(BaseModel):
+    """
+    A model representing a wallet as expanded in the graph explorer, with everything needed to draw
+    it and its neighbours.
+    """
+
+    wallet_data: WalletData  # The data of the wallet, a stub if it has not been fetched yet
+    connected_wallets: ConnectedWallets  # The connections of the wallet
+    neighbours: List[SubgraphNode]  # The connected wallets, with their class and populated flag
+
+
+class RiskPropagationStats(BaseModel):
+    """
+    A model representing the statistics of a risk propagation run.
+    """
+
+    incremental: bool  # Whether only the wallets updated since the last run were exported
+    num_wallets: int  # Number of wallets in the propagation graph
+    num_edges: int  # Number of non-zero entries in the adjacency matrix
+    num_seeds: int  # Number of illicit wallets the risk is propagated from
+    num_exported_wallets: int  # Number of wallets exported from the database in this run
+    iterations: int  # Number of propagation iterations until convergence
+    converged: bool  # Whether the iteration converged within the tolerance
+    export_seconds: float  # Time spent exporting the graph from the database
+    propagation_seconds: float  # Time spent iterating
+    iterations_per_second: float  # Propagation throughput
+    num_written_scores: int  # Number of risk scores written back to the database
+    write_seconds: float  # Time spent writing the risk scores back
+
+
+class ResponseCacheStats(BaseModel):
+    """
+    A model representing the counters of the API response cache.
+    """
+
+    size: int  # Number of cached responses
+    max_entries: int  # Maximum number of cached responses
+    ttl_s: float  # Time to live of a cached response in seconds
+    hits: int  # Number of lookups answered from the cache
+    misses: int  # Number of lookups not answered from the cache, expirations included
+    evictions: int  # Number of responses evicted to make room, least recently used first
+    expirations: int  # Number of responses dropped because they outlived the time to live
+    invalidations: int  # Number of responses dropped because the worker updated the wallet
+
+
+class UpstreamCacheStats(BaseModel):
+    """
+    A model representing the counters of the disk cache of the immutable Blockstream API responses.
+    """
+
+    entries: int  # Number of cached responses
+    size_bytes: int  # Total size of the compressed cached responses
+    max_bytes: int  # Maximum total size of the cached responses
+    hits: int  # Number of requests answered from the cache
+    misses: int  # Number of cacheable requests sent to the Blockstream API
+    stores: int  # Number of responses written to the cache
+    evictions: int  # Number of responses evicted to make room, least recently used first
+
+
+class ApiMetrics(BaseModel):
+    """
+    A model representing the metrics exposed by the API.
+    """
+
+    response_cache: Optional[ResponseCacheStats] = (
+        None  # Response cache counters, None if the cache is disabled
+    )
+
+
+class TransactionIndexStats(BaseModel):
+    """
+    A model representing the counters of the local transaction index.
+    """
+
+    first_height: Optional[int] = None  # First block of the range ingested without gaps
+    last_height: Optional[int] = None  # Last block of the range ingested without gaps
+    covered_addresses: int  # Number of addresses with a history ingested from the API
+    hits: int  # Number of address histories rebuilt from the index
+    misses: int  # Number of address histories the index could not rebuild
+
+
+class KnownAddressFilterStats(BaseModel):
+    """
+    A model representing the counters of the Bloom filter of the processed addresses.
+    """
+
+    items: int  # Number of addresses added to the filter
+    capacity: int  # Number of addresses the filter is sized for
+    memory_bytes: int  # Size of the bit array of the filter
+    estimated_false_positive_rate: float  # False positive probability given the items added
+    lookups: int  # Number of addresses looked up
+    definite_misses: int  # Number of lookups answered by the filter without a database query
+    false_positives: int  # Number of lookups the filter let through for never processed addresses
+    observed_false_positive_rate: Optional[float] = (
+        None  # Share of the never processed addresses the filter let through, once known
+    )
+
+
+class HeavyHitter(BaseModel):
+    """
+    A model representing an address seen in a large share of the recent blocks.
+    """
+
+    address: str  # The Bitcoin address
+    share: float  # Lower bound of the decayed share of the recent blocks the address was seen in
+
+
+class HeavyHitterStats(BaseModel):
+    """
+    A model representing the counters of the heavy hitter refresh policy of the block worker.
+    """
+
+    blocks_observed: int  # Number of blocks counted by the tracker
+    tracked: int  # Number of addresses monitored by the tracker
+    heavy_hitters: List[HeavyHitter]  # The current heavy hitters, largest share first
+    refreshes: int  # Number of heavy hitter refreshes run by the separate task
+    failed_refreshes: int  # Number of refreshes that could not fetch the address
+    deferred: int  # Number of heavy hitter occurrences skipped because a refresh was not due
+    queued: int  # Number of heavy hitters waiting to be refreshed
+
+
+class RefreshSchedulerStats(BaseModel):
+    """
+    A model representing the counters of the deferred refresh scheduler of the block worker.
+    """
+
+    dirty: int  # Number of addresses waiting for a refresh
+    oldest_dirty_age_s: Optional[float] = (
+        None  # Seconds the oldest dirty address has been waiting, None if there is none
+    )
+    marked: int  # Number of occurrences of processed addresses in new blocks
+    coalesced: int  # Number of occurrences covered by a refresh already scheduled
+    refreshed: int  # Number of deferred refreshes run
+    failed_refreshes: int  # Number of deferred refreshes that could not fetch the address
+    already_fresh: int  # Number of deferred refreshes skipped because the address was refreshed meanwhile
+    immediate: int  # Number of never processed addresses processed without waiting
+
+
+class StalenessRefreshStats(BaseModel):
+    """
+    A model representing the counters of the background refresh of the stale wallets.
+    """
+
+    passes: int  # Number of completed scans of the whole graph
+    scanned: int  # Number of wallets scored
+    candidates: int  # Number of wallets waiting to be refreshed from the current page
+    refreshed: int  # Number of wallets refreshed
+    failed_refreshes: int  # Number of refreshes that raised an error
+    estimated_requests: float  # Estimated number of upstream requests spent on the refreshes
+    paused: int  # Number of times the refreshes paused for other upstream traffic
+    budget_tokens: float  # Upstream requests available to the refreshes right now
+
+
+class PrefetchStats(BaseModel):
+    """
+    A model representing the counters of the neighbor prefetch of the worker.
+    """
+
+    scheduled: int  # Number of neighbors queued for a prefetch
+    prefetched: int  # Number of neighbors fetched and scored
+    already_populated: int  # Number of queued neighbors populated meanwhile, not fetched again
+    cancelled: int  # Number of queued neighbors dropped before their prefetch
+    failed: int  # Number of prefetches that could not fetch the wallet
+    queued: int  # Number of neighbors waiting to be prefetched
+    recent_prefetches: int  # Number of wallets prefetched within the hit window
+    recent_hits: int  # Number of them looked up through the API after their prefetch
+    hit_rate: Optional[float] = (
+        None  # Share of the recent prefetches looked up afterwards, None without prefetches
+    )
+
+
+class WorkerMetrics(BaseModel):
+    """
+    A model representing the metrics exposed by the worker.
+    """
+
+    upstream_cache: Optional[UpstreamCacheStats] = (
+        None  # Upstream response cache counters, None if the cache is disabled
+    )
+    tx_index: Optional[TransactionIndexStats] = (
+        None  # Transaction index counters, None if the index is disabled
+    )
+    known_addresses: Optional[KnownAddressFilterStats] = (
+        None  # Known address filter counters, None if the filter is disabled or not loaded
+    )
+    heavy_hitters: Optional[HeavyHitterStats] = (
+        None  # Heavy hitter refresh counters, None if the policy is disabled
+    )
+    refresh_scheduler: Optional[RefreshSchedulerStats] = (
+        None  # Deferred refresh counters, None if the scheduler is disabled
+    )
+    staleness_refresh: Optional[StalenessRefreshStats] = (
+        None  # Background refresh counters, None if the background refresh is disabled
+    )
+    prefetch: Optional[PrefetchStats] = (
+        None  # Neighbor prefetch counters, None if the prefetch is disabled
+    )
+
+
 class TransactionOutput(BaseModel):
     """
     Represents an output in a Bitcoin transaction.
@@ -305,6 +750,17 @@ class TransactionStatus(BaseModel):
     )
 
 
+class Utxo(BaseModel):
+    """
+    Represents an unspent transaction output of a Bitcoin address.
+    """
+
+    txid: str  # ID of the transaction that created the output
+    vout: int  # Index of the output in the transaction
+    value: int  # Value of the output in satoshis
+    status: TransactionStatus  # Confirmation status of the transaction
+
+
 class Transaction(BaseModel):
     """
     Represents a Bitcoin transaction.
@@ -377,6 +833,9 @@ class BitcoinAddressQueryResponse(BaseModel):
     last_seen_txid: Optional[str] = (
         None  # The last transaction ID seen in the request, used for pagination
     )
+    sample_segments: Optional[List[int]] = (
+        None  # Lengths of the contiguous runs of transactions if only a sample of the history was fetched
+    )
     # We store the last seen txid to fetch the next page of transactions and
     # because we don't know the tie breaking rule when a wallet sends multiple
     # transactions in the same block
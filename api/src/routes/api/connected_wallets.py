@@ -1,19 +1,91 @@
-from fastapi import APIRouter, Request, HTTPException, status
-from src.db.neo4j import get_connected_wallets_from_db
-from src.models import ConnectedWallets
+from typing import Literal, Optional
+from fastapi import APIRouter, Query, Request, Response, HTTPException, status
+from src.config import CONNECTIONS_PAGE_MAX_LIMIT
+from src.db.connections import get_connections_page
+from src.db.neo4j import get_connected_wallets_from_db, get_wallet_version_from_db
+from src.models import ConnectedWallets, ConnectionsPage
+from src.shared.conditional_requests import (
+    connections_validators,
+    is_not_modified,
+    not_modified_response,
+    set_validators,
+)
+from src.shared.responses import model_response
+
+CONNECTED_WALLETS_CACHE_ENDPOINT = "connected-wallets"
 
 router = APIRouter()
 
 
 @router.get("/{base58_address}", response_model=ConnectedWallets)
-async def get_connected_wallets(request: Request, base58_address: str):
-    neo4j_driver = request.app.state.neo4j_driver
-    connected_wallets = get_connected_wallets_from_db(neo4j_driver, base58_address)
+async def get_connected_wallets(
+    request: Request, response: Response, base58_address: str
+):
+    response_cache = request.app.state.response_cache
+    # Cached as (etag, last modified, connected wallets)
+    cached = None
+    if response_cache is not None:
+        cached = response_cache.get(CONNECTED_WALLETS_CACHE_ENDPOINT, base58_address)
+
+    if cached is None:
+        neo4j_driver = request.app.state.neo4j_driver
+        # Check the version first, a client revalidating its copy then skips the full query
+        wallet_version = get_wallet_version_from_db(neo4j_driver, base58_address)
+        if wallet_version is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Connected wallets not found in database",
+            )
+        etag, last_modified = connections_validators(
+            base58_address, wallet_version.connections_updated
+        )
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
+        connected_wallets = get_connected_wallets_from_db(neo4j_driver, base58_address)
+        if connected_wallets is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Connected wallets not found in database",
+            )
+        if response_cache is not None:
+            response_cache.set(
+                CONNECTED_WALLETS_CACHE_ENDPOINT,
+                base58_address,
+                (etag, last_modified, connected_wallets),
+            )
+    else:
+        etag, last_modified, connected_wallets = cached
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
 
-    if connected_wallets is None:
+    set_validators(response, etag, last_modified)
+    return await model_response(request, response, connected_wallets)
+
+
+@router.get("/{base58_address}/page", response_model=ConnectionsPage)
+async def get_connected_wallets_page(
+    request: Request,
+    base58_address: str,
+    direction: Literal["inbound", "outbound"] = "inbound",
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=CONNECTIONS_PAGE_MAX_LIMIT),
+):
+    try:
+        connections_page = get_connections_page(
+            request.app.state.neo4j_driver,
+            request.app.state.mongo_client,
+            base58_address,
+            direction,
+            cursor,
+            limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    if connections_page is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Connected wallets not found in database",
         )
-    else:
-        return connected_wallets
+    return connections_page
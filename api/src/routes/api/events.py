@@ -0,0 +1,68 @@
+import aiohttp
+import logging
+from typing import AsyncIterator, List, Optional
+from fastapi import APIRouter, Query, Request, HTTPException, status
+from fastapi.responses import StreamingResponse
+from src.config import WORKER_API_URL, WORKER_EVENTS_ROUTE_PREFIX
+from src.routes.worker.events import stream_events as stream_local_events
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.get("")
+async def stream_events(
+    request: Request,
+    class_inference: Optional[List[int]] = Query(None),
+    address: Optional[List[str]] = Query(None),
+):
+    if getattr(request.app.state, "event_bus", None) is not None:
+        # The worker runs in this process, subscribe to its event bus directly
+        return await stream_local_events(request, class_inference, address)
+
+    params = [("class_inference", str(value)) for value in class_inference or []]
+    params += [("address", value) for value in address or []]
+    # The stream stays open indefinitely, so it uses its own session rather than the worker pool
+    session: aiohttp.ClientSession = request.app.state.worker_events_session
+    try:
+        response = await session.get(
+            f"{WORKER_API_URL}{WORKER_EVENTS_ROUTE_PREFIX}", params=params
+        )
+    except aiohttp.ClientError as e:
+        logger.error(f"Error connecting to worker event stream: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error connecting to worker event stream",
+        )
+    if response.status != 200:
+        response.release()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error connecting to worker event stream",
+        )
+
+    return StreamingResponse(
+        proxy_event_stream(response),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def proxy_event_stream(response: aiohttp.ClientResponse) -> AsyncIterator[bytes]:
+    """
+    Forward the worker event stream to the client as it arrives.
+
+    Parameters:
+    - response: The open response of the worker event stream
+
+    Returns:
+    - An iterator over the chunks of the stream
+    """
+    try:
+        async for chunk in response.content.iter_any():
+            yield chunk
+    except aiohttp.ClientError as e:
+        logger.error(f"Worker event stream interrupted: {e}")
+    finally:
+        # Closes the connection to the worker when the client disconnects
+        response.close()
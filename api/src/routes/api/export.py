@@ -0,0 +1,35 @@
+from typing import Literal, Optional
+from fastapi import APIRouter, Request, HTTPException, status
+from fastapi.responses import StreamingResponse
+from src.db.export import (
+    EXPORT_FORMAT_ARROW,
+    EXPORT_FORMAT_NDJSON,
+    EXPORT_MEDIA_TYPES,
+    export,
+)
+
+router = APIRouter()
+
+
+@router.get("/{kind}")
+async def export_graph(
+    request: Request,
+    kind: Literal["wallets", "edges"],
+    format: Literal["ndjson", "arrow"] = EXPORT_FORMAT_NDJSON,
+    updated_since: Optional[int] = None,
+    is_populated: Optional[bool] = None,
+):
+    try:
+        chunks = export(
+            request.app.state.neo4j_driver, kind, format, updated_since, is_populated
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+
+    # The generator is blocking, Starlette iterates it in a thread pool
+    extension = "arrows" if format == EXPORT_FORMAT_ARROW else format
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{extension}"'},
+    )
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Request, Response, HTTPException, status
+from src.db.neo4j import get_graph_node_from_db
+from src.models import GraphNode
+from src.shared.responses import model_response
+
+router = APIRouter()
+
+
+@router.get("/{base58_address}", response_model=GraphNode)
+async def get_graph_node(request: Request, response: Response, base58_address: str):
+    # Everything the explorer needs to expand a wallet, in one query and one response
+    graph_node = get_graph_node_from_db(request.app.state.neo4j_driver, base58_address)
+
+    if graph_node is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Wallet not found in database",
+        )
+    return await model_response(request, response, graph_node)
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Request
+from src.models import ApiMetrics
+
+router = APIRouter()
+
+
+@router.get("", response_model=ApiMetrics)
+async def get_metrics(request: Request):
+    response_cache = request.app.state.response_cache
+    return ApiMetrics(
+        response_cache=response_cache.stats() if response_cache is not None else None
+    )
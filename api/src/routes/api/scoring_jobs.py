@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Request, HTTPException, status
+from src.db.mongodb import get_scoring_job
+from src.models import ScoringJob
+
+router = APIRouter()
+
+
+@router.get("/{job_id}", response_model=ScoringJob)
+async def get_scoring_job_status(request: Request, job_id: str):
+    # Jobs are persisted by the worker, no need to forward the request
+    job = get_scoring_job(request.app.state.mongo_client, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Query, Request, Response, HTTPException, status
+from src.config import SUBGRAPH_MAX_DEPTH, SUBGRAPH_MAX_FAN_OUT, SUBGRAPH_MAX_NODES
+from src.db.neo4j import get_subgraph_from_db
+from src.models import Subgraph
+from src.shared.responses import model_response
+
+router = APIRouter()
+
+
+@router.get("/{base58_address}", response_model=Subgraph)
+async def get_subgraph(
+    request: Request,
+    response: Response,
+    base58_address: str,
+    depth: int = Query(2, ge=1, le=SUBGRAPH_MAX_DEPTH),
+    fan_out: int = Query(25, ge=1, le=SUBGRAPH_MAX_FAN_OUT),
+    max_nodes: int = Query(500, ge=1, le=SUBGRAPH_MAX_NODES),
+):
+    subgraph = get_subgraph_from_db(
+        request.app.state.neo4j_driver, base58_address, depth, fan_out, max_nodes
+    )
+
+    if subgraph is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Wallet not found in database",
+        )
+    return await model_response(request, response, subgraph)
@@ -1,20 +1,164 @@
-from typing import Tuple
-from fastapi import APIRouter, Request, HTTPException, status
-from pydantic import ValidationError
-from src.config import WORKER_API_URL, WORKER_WALLET_ROUTE_PREFIX
-from src.db.neo4j import get_wallet_data_from_db
-from src.models import ConnectedWallets, WalletData
+import asyncio
+from typing import AsyncIterator, List
+from fastapi import APIRouter, Request, Response, HTTPException, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from src.config import (
+    API_JOBS_ROUTE_PREFIX,
+    WALLET_BATCH_DB_CHUNK_SIZE,
+    WALLET_BATCH_MAX_ADDRESSES,
+    WALLET_BATCH_MAX_CONCURRENCY,
+    WALLET_SYNC_WAIT_S,
+)
+from src.db.neo4j import (
+    get_wallet_data_batch_from_db,
+    get_wallet_data_from_db,
+    get_wallet_version_from_db,
+)
+from src.models import (
+    SCORING_JOB_ACTIVE_STATUSES,
+    SCORING_JOB_FAILED,
+    SCORING_JOB_NOT_FOUND,
+    ScoringJob,
+    WalletBatchItem,
+    WalletBatchRequest,
+    WalletBatchResponse,
+    WalletData,
+)
+from src.shared.conditional_requests import (
+    is_conditional,
+    is_not_modified,
+    not_modified_response,
+    set_validators,
+    wallet_validators,
+)
+from src.shared.responses import model_response
 import logging
-import aiohttp
+
+WALLET_DATA_CACHE_ENDPOINT = "wallet"
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-@router.get("/{base58_address}", response_model=WalletData)
+@router.post("/batch", response_model=WalletBatchResponse)
+async def get_wallet_data_batch(
+    request: Request,
+    response: Response,
+    batch_request: WalletBatchRequest,
+    stream: bool = False,
+):
+    # Deduplicate, keeping the order of the request
+    addresses = list(dict.fromkeys(batch_request.addresses))
+    if len(addresses) > WALLET_BATCH_MAX_ADDRESSES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {WALLET_BATCH_MAX_ADDRESSES} addresses per batch",
+        )
+
+    known_wallets = get_wallet_data_batch_from_db(
+        request.app.state.neo4j_driver, addresses, WALLET_BATCH_DB_CHUNK_SIZE
+    )
+    wallets = [
+        known_wallets[address]
+        for address in addresses
+        if address in known_wallets and known_wallets[address].is_populated
+    ]
+    pending = [
+        address
+        for address in addresses
+        if address not in known_wallets or not known_wallets[address].is_populated
+    ]
+
+    if stream:
+        # Newline delimited JSON, the known wallets first then the others as the worker fetches them
+        return StreamingResponse(
+            stream_wallet_batch(request, wallets, pending),
+            media_type="application/x-ndjson",
+        )
+
+    if pending:
+        await request.app.state.worker_client.queue_wallets(pending)
+    return await model_response(
+        request, response, WalletBatchResponse(wallets=wallets, pending=pending)
+    )
+
+
+async def stream_wallet_batch(
+    request: Request, wallets: List[WalletData], pending: List[str]
+) -> AsyncIterator[str]:
+    """
+    Stream the results of a batch lookup as newline delimited JSON.
+
+    Parameters:
+    - request: The request of the batch lookup
+    - wallets: The wallet data found in the database
+    - pending: The addresses to fetch from the worker
+
+    Returns:
+    - An iterator over the lines of the response
+    """
+    for wallet_data in wallets:
+        item = WalletBatchItem(
+            address=wallet_data.address, status="found", wallet_data=wallet_data
+        )
+        yield item.model_dump_json() + "\n"
+
+    semaphore = asyncio.Semaphore(WALLET_BATCH_MAX_CONCURRENCY)
+
+    async def fetch(address: str) -> WalletBatchItem:
+        async with semaphore:
+            try:
+                wallet_data = await request.app.state.worker_client.get_wallet_data(
+                    address
+                )
+            except HTTPException as e:
+                logger.error(f"Error getting data for {address} from worker: {e.detail}")
+                return WalletBatchItem(address=address, status="error")
+        if wallet_data is None:
+            return WalletBatchItem(address=address, status="not_found")
+        return WalletBatchItem(address=address, status="found", wallet_data=wallet_data)
+
+    tasks = [asyncio.ensure_future(fetch(address)) for address in pending]
+    try:
+        for next_item in asyncio.as_completed(tasks):
+            item = await next_item
+            yield item.model_dump_json() + "\n"
+    finally:
+        # The client may disconnect before the end of the stream
+        for task in tasks:
+            task.cancel()
+
+
+@router.get(
+    "/{base58_address}",
+    response_model=WalletData,
+    responses={status.HTTP_202_ACCEPTED: {"model": ScoringJob}},
+)
 async def get_wallet_data(
-    request: Request, base58_address: str, force_update: bool = False
+    request: Request, response: Response, base58_address: str, force_update: bool = False
 ):
+    wallet_query_counter = request.app.state.wallet_query_counter
+    if wallet_query_counter is not None:
+        wallet_query_counter.record(base58_address)
+
+    response_cache = request.app.state.response_cache
+    if response_cache is not None and not force_update:
+        wallet_data = response_cache.get(WALLET_DATA_CACHE_ENDPOINT, base58_address)
+        if wallet_data is not None:
+            return await conditional_wallet_response(request, response, wallet_data)
+
+    # Revalidation only needs the version of the wallet, not its data
+    if is_conditional(request) and not force_update:
+        wallet_version = get_wallet_version_from_db(
+            request.app.state.neo4j_driver, base58_address
+        )
+        if wallet_version is not None and wallet_version.is_populated:
+            etag, last_modified = wallet_validators(
+                base58_address, wallet_version.last_updated, wallet_version.risk_score
+            )
+            if is_not_modified(request, etag, last_modified):
+                return not_modified_response(etag, last_modified)
+
     # Query the database for the wallet data
     wallet_data = get_wallet_data_from_db(
         request.app.state.neo4j_driver, base58_address
@@ -23,55 +167,62 @@ async def get_wallet_data(
     # If the wallet is not found in the database, or its a stub added by connected wallets or if force_update is True
     # get the data from the external API directly
     if wallet_data is None or not wallet_data.is_populated or force_update:
-        # Use the worker to get the data from the Blockstream API
-        new_wallet_data = await get_wallet_data_from_worker(base58_address)
-        if new_wallet_data is None:
+        # Use the worker to get the data from the Blockstream API, in a scoring job answered with
+        # 202 Accepted if it takes longer than WALLET_SYNC_WAIT_S
+        # Concurrent requests for the same wallet share one call to the worker
+        job = await request.app.state.worker_client.submit_scoring_job(
+            base58_address, force_update, WALLET_SYNC_WAIT_S
+        )
+        if job.status in SCORING_JOB_ACTIVE_STATUSES:
+            return JSONResponse(
+                status_code=status.HTTP_202_ACCEPTED,
+                content=job.model_dump(mode="json"),
+                headers={"Location": f"{API_JOBS_ROUTE_PREFIX}/{job.job_id}"},
+            )
+        elif job.status == SCORING_JOB_NOT_FOUND:
             # If the wallet is not found in the external API, return a 404 response
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Wallet not found"
             )
-        else:
-            return new_wallet_data
+        elif job.status == SCORING_JOB_FAILED:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=job.error or "Error getting data from worker",
+            )
+
+        wallet_data = get_wallet_data_from_db(
+            request.app.state.neo4j_driver, base58_address
+        )
+        if wallet_data is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Wallet not found"
+            )
 
     # If the wallet is found in the database, check and it is populated, return the wallet data
-    return wallet_data
+    if response_cache is not None:
+        response_cache.set(WALLET_DATA_CACHE_ENDPOINT, base58_address, wallet_data)
+    return await conditional_wallet_response(request, response, wallet_data)
 
 
-async def get_wallet_data_from_worker(
-    base58_address: str,
-) -> Tuple[WalletData]:
+async def conditional_wallet_response(
+    request: Request, response: Response, wallet_data: WalletData
+):
     """
-    Get the wallet data from the worker.
+    Answer with 304 Not Modified if the client has the current version of the wallet data, or
+    with the wallet data and its validators.
 
     Parameters:
-    - base58_address: The base58 encoded Bitcoin address to query
+    - request: The request for the wallet data
+    - response: The response the validators are set on
+    - wallet_data: The current wallet data
 
     Returns:
-    - The wallet data
+    - The 304 response or the wallet data
     """
-    wallet_data = None
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            f"{WORKER_API_URL}{WORKER_WALLET_ROUTE_PREFIX}/{base58_address}"
-        ) as response:
-            if response.status == 200:
-                data = await response.json()
-                try:
-                    wallet_data = WalletData.model_validate(data)
-                    return wallet_data
-                except ValidationError as e:
-                    logger.error(f"Error parsing validating parsed model: {e}")
-                    return None, None
-                except Exception as e:
-                    logger.error(f"Error parsing JSON response: {e}")
-                    return None, None
-            elif response.status == 404:
-                return None, None
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Error getting data from worker",
-                )
-
-    return wallet_data
+    etag, last_modified = wallet_validators(
+        wallet_data.address, wallet_data.last_updated, wallet_data.risk_score
+    )
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    set_validators(response, etag, last_modified)
+    return await model_response(request, response, wallet_data)
@@ -0,0 +1,63 @@
+import asyncio
+import json
+from typing import AsyncIterator, List, Optional
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+from src.config import EVENT_STREAM_HEARTBEAT_S
+from src.shared.event_bus import EventBus, Subscription
+
+router = APIRouter()
+
+
+@router.get("")
+async def stream_events(
+    request: Request,
+    class_inference: Optional[List[int]] = Query(None),
+    address: Optional[List[str]] = Query(None),
+):
+    event_bus: EventBus = request.app.state.event_bus
+    subscription = event_bus.subscribe(
+        set(class_inference) if class_inference else None,
+        set(address) if address else None,
+    )
+    return StreamingResponse(
+        stream_subscription(event_bus, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def stream_subscription(
+    event_bus: EventBus, subscription: Subscription
+) -> AsyncIterator[str]:
+    """
+    Stream the events of a subscription as server-sent events, with a comment line as heartbeat
+    when no event was sent for a while.
+
+    Parameters:
+    - event_bus: The event bus of the subscription
+    - subscription: The subscription to stream
+
+    Returns:
+    - An iterator over the server-sent events
+    """
+    reported_dropped = 0
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.get(), EVENT_STREAM_HEARTBEAT_S
+                )
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+
+            if subscription.dropped > reported_dropped:
+                # Let the client know it fell behind and missed events
+                dropped = json.dumps({"count": subscription.dropped - reported_dropped})
+                yield f"event: dropped\ndata: {dropped}\n\n"
+                reported_dropped = subscription.dropped
+            yield f"event: {event.event}\ndata: {event.model_dump_json()}\n\n"
+    finally:
+        # Runs when the client disconnects
+        event_bus.unsubscribe(subscription)
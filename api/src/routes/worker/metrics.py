@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Request
+from src.models import WorkerMetrics
+
+router = APIRouter()
+
+
+@router.get("", response_model=WorkerMetrics)
+async def get_metrics(request: Request):
+    upstream_cache = request.app.state.api_worker.response_cache
+    block_processing_worker = request.app.state.block_processing_worker
+    staleness_refresh_scheduler = request.app.state.staleness_refresh_scheduler
+    neighbor_prefetcher = request.app.state.neighbor_prefetcher
+    tx_index = block_processing_worker.tx_index
+    known_addresses = block_processing_worker.known_addresses
+    return WorkerMetrics(
+        upstream_cache=upstream_cache.stats() if upstream_cache is not None else None,
+        tx_index=tx_index.stats() if tx_index is not None else None,
+        known_addresses=(
+            known_addresses.stats()
+            if known_addresses is not None and known_addresses.is_loaded
+            else None
+        ),
+        heavy_hitters=(
+            block_processing_worker.heavy_hitter_stats()
+            if block_processing_worker.heavy_hitters is not None
+            else None
+        ),
+        refresh_scheduler=(
+            block_processing_worker.refresh_scheduler.stats()
+            if block_processing_worker.refresh_scheduler is not None
+            else None
+        ),
+        staleness_refresh=(
+            staleness_refresh_scheduler.stats()
+            if staleness_refresh_scheduler is not None
+            else None
+        ),
+        prefetch=(
+            neighbor_prefetcher.stats() if neighbor_prefetcher is not None else None
+        ),
+    )
@@ -1,20 +1,42 @@
-from fastapi import APIRouter, Request, HTTPException, status
-from src.ml.random_forest import infer_wallet_data_class
-from src.extern.bitcoin_api import (
-    get_wallet_data_from_api,
-)
-from src.db.neo4j import (
-    get_wallet_data_from_db,
-    upsert_connected_wallets_in_db,
-    upsert_wallet_data_in_db,
-)
-from src.models import WalletData
+from fastapi import APIRouter, BackgroundTasks, Request, HTTPException, status
+from src.config import WALLET_BATCH_MAX_ADDRESSES, WALLET_BATCH_MAX_CONCURRENCY
+from src.db.neo4j import get_wallet_data_from_db
+from src.models import WalletBatchRequest, WalletData
+from src.worker.wallet_refresh import fetch_score_and_store_wallet, refresh_wallets
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+@router.post("/batch", status_code=status.HTTP_202_ACCEPTED)
+async def queue_wallet_batch(
+    request: Request, batch_request: WalletBatchRequest, background_tasks: BackgroundTasks
+):
+    addresses = list(dict.fromkeys(batch_request.addresses))
+    if len(addresses) > WALLET_BATCH_MAX_ADDRESSES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {WALLET_BATCH_MAX_ADDRESSES} addresses per batch",
+        )
+
+    # The API worker rate limits the Blockstream API calls, the concurrency only overlaps the
+    # scoring and database writes with the fetches
+    state = request.app.state
+    background_tasks.add_task(
+        refresh_wallets,
+        state.api_worker,
+        state.mongo_client,
+        state.neo4j_driver,
+        state.ml_session,
+        state.wallet_single_flight,
+        addresses,
+        WALLET_BATCH_MAX_CONCURRENCY,
+        state.event_bus,
+    )
+    return {"queued": len(addresses)}
+
+
 @router.get("/{base58_address}", response_model=WalletData)
 async def get_new_wallet_data(
     request: Request, base58_address: str, force_update: bool = False
@@ -28,9 +50,18 @@ async def get_new_wallet_data(
     # If the wallet is not found in the database, or its a stub added by connected wallets or if force_update is True
     # get the data from the external API directly
     if wallet_data is None or not wallet_data.is_populated or force_update:
-        # Use an external API to get the data
-        new_wallet_data, connected_wallets = await get_wallet_data_from_api(
-            request.app.state.api_worker, request.app.state.mongo_client, base58_address
+        # Concurrent requests for the same wallet share one fetch, score and store cycle
+        state = request.app.state
+        new_wallet_data, connected_wallets = await state.wallet_single_flight.do(
+            base58_address,
+            lambda: fetch_score_and_store_wallet(
+                state.api_worker,
+                state.mongo_client,
+                state.neo4j_driver,
+                state.ml_session,
+                base58_address,
+                event_bus=state.event_bus,
+            ),
         )
         if new_wallet_data is None:
             # If the wallet is not found in the external API, return a 404 response
@@ -44,21 +75,6 @@ async def get_new_wallet_data(
                 detail="Error getting connected wallets",
             )
         else:
-            # If the wallet is found in the external API, infer its class, save it to the database,
-            # query the connections while you're at it and add those to the database too
-
-            # Compute the inference for the wallet data
-            new_wallet_data = infer_wallet_data_class(
-                request.app.state.ml_session, new_wallet_data
-            )
-
-            # Add or update the wallet data and connected wallets to the database
-            upsert_wallet_data_in_db(request.app.state.neo4j_driver, new_wallet_data)
-
-            upsert_connected_wallets_in_db(
-                request.app.state.neo4j_driver, base58_address, connected_wallets
-            )
-
             return new_wallet_data
 
     # If the wallet is found in the database, check and it is populated, return the wallet data
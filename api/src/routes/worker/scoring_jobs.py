@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Query, Request, Response, HTTPException, status
+from src.config import SCORING_JOB_MAX_WAIT_S
+from src.db.mongodb import get_scoring_job
+from src.models import SCORING_JOB_ACTIVE_STATUSES, ScoringJob
+
+router = APIRouter()
+
+
+@router.post("/{base58_address}", response_model=ScoringJob)
+async def submit_scoring_job(
+    request: Request,
+    response: Response,
+    base58_address: str,
+    force_update: bool = False,
+    wait_s: float = Query(0, ge=0, le=SCORING_JOB_MAX_WAIT_S),
+):
+    job = await request.app.state.scoring_job_manager.submit(
+        base58_address, force_update, wait_s
+    )
+    if job.status in SCORING_JOB_ACTIVE_STATUSES:
+        response.status_code = status.HTTP_202_ACCEPTED
+    return job
+
+
+@router.get("/{job_id}", response_model=ScoringJob)
+async def get_scoring_job_status(request: Request, job_id: str):
+    job = get_scoring_job(request.app.state.mongo_client, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
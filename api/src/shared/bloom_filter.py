@@ -0,0 +1,122 @@
+import math
+import struct
+from hashlib import blake2b
+from typing import Iterable
+
+# Magic, number of bits, number of hashes, number of items, capacity, target error rate
+_HEADER = struct.Struct("<4sQIQQd")
+_MAGIC = b"BLM1"
+
+
+class BloomFilter:
+    """
+    A Bloom filter of strings: membership tests have no false negatives, and false positives with a
+    probability close to the target error rate as long as fewer than capacity items are added.
+
+    Positions are derived from a single 128-bit BLAKE2b digest by double hashing.
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        """
+        Initialize an empty filter sized for a capacity and a target error rate.
+
+        Parameters:
+        - capacity: The number of items the filter is sized for
+        - error_rate: The target false positive probability at capacity
+        """
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.num_bits = max(
+            8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.num_items = 0
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str) -> bool:
+        """
+        Add an item to the filter.
+
+        Parameters:
+        - key: The item
+
+        Returns:
+        - Whether the item was not in the filter yet, items are only counted once
+        """
+        is_new = False
+        for position in self._positions(key):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                is_new = True
+        if is_new:
+            self.num_items += 1
+        return is_new
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+    def estimated_false_positive_rate(self) -> float:
+        """
+        Estimate the false positive probability from the number of items added.
+        """
+        return (
+            1 - math.exp(-self.num_hashes * self.num_items / self.num_bits)
+        ) ** self.num_hashes
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the filter.
+        """
+        return (
+            _HEADER.pack(
+                _MAGIC,
+                self.num_bits,
+                self.num_hashes,
+                self.num_items,
+                self.capacity,
+                self.error_rate,
+            )
+            + self.bits
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        """
+        Deserialize a filter serialized by to_bytes.
+
+        Parameters:
+        - data: The serialized filter
+
+        Raises:
+        - ValueError: If the data is not a serialized filter
+        """
+        if len(data) < _HEADER.size:
+            raise ValueError("Truncated Bloom filter")
+        magic, num_bits, num_hashes, num_items, capacity, error_rate = (
+            _HEADER.unpack_from(data)
+        )
+        if magic != _MAGIC or len(data) - _HEADER.size != (num_bits + 7) // 8:
+            raise ValueError("Not a Bloom filter or truncated Bloom filter")
+        bloom_filter = cls.__new__(cls)
+        bloom_filter.capacity = capacity
+        bloom_filter.error_rate = error_rate
+        bloom_filter.num_bits = num_bits
+        bloom_filter.num_hashes = num_hashes
+        bloom_filter.bits = bytearray(data[_HEADER.size :])
+        bloom_filter.num_items = num_items
+        return bloom_filter
@@ -0,0 +1,128 @@
+from email.utils import formatdate, parsedate_to_datetime
+from hashlib import sha1
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+# Timestamps above this are in milliseconds (stubs are stamped with Cypher's timestamp())
+MILLISECONDS_THRESHOLD = 10**11
+
+
+def to_unix_seconds(timestamp: Optional[float]) -> int:
+    """
+    Normalize a version timestamp stored in seconds or milliseconds to seconds.
+
+    Parameters:
+    - timestamp: The timestamp, None if missing
+    """
+    if timestamp is None or timestamp < 0:
+        return 0
+    if timestamp > MILLISECONDS_THRESHOLD:
+        return int(timestamp // 1000)
+    return int(timestamp)
+
+
+def make_etag(*parts) -> str:
+    """
+    Build a strong entity tag from the parts identifying a version of a response.
+
+    Parameters:
+    - parts: The parts, e.g. the endpoint, the address and the version stamps
+    """
+    return '"' + sha1(":".join(str(part) for part in parts).encode()).hexdigest()[:20] + '"'
+
+
+def set_validators(response: Response, etag: str, last_modified: int) -> None:
+    """
+    Set the ETag and Last-Modified headers of a response.
+
+    Parameters:
+    - response: The response
+    - etag: The entity tag of the response
+    - last_modified: The unix timestamp of the last modification, in seconds
+    """
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+
+
+def is_conditional(request: Request) -> bool:
+    """
+    Check if a request carries validators to compare against.
+
+    Parameters:
+    - request: The request
+    """
+    return (
+        "if-none-match" in request.headers or "if-modified-since" in request.headers
+    )
+
+
+def is_not_modified(request: Request, etag: str, last_modified: int) -> bool:
+    """
+    Check if the client already has the current version of a response. If-None-Match takes
+    precedence over If-Modified-Since, as in RFC 9110.
+
+    Parameters:
+    - request: The request
+    - etag: The current entity tag of the response
+    - last_modified: The unix timestamp of the last modification, in seconds
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return last_modified <= since
+    return False
+
+
+def not_modified_response(etag: str, last_modified: int) -> Response:
+    """
+    Build a 304 Not Modified response with the validators.
+
+    Parameters:
+    - etag: The entity tag of the response
+    - last_modified: The unix timestamp of the last modification, in seconds
+    """
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag, last_modified)
+    return response
+
+
+def wallet_validators(
+    address: str, last_updated: Optional[float], risk_score: Optional[float]
+) -> tuple:
+    """
+    Get the entity tag and the last modification time of the wallet data of a wallet.
+
+    Parameters:
+    - address: The wallet address
+    - last_updated: The last_updated stamp of the wallet
+    - risk_score: The risk score of the wallet, updated without touching last_updated
+
+    Returns:
+    - The entity tag and the unix timestamp of the last modification in seconds
+    """
+    last_modified = to_unix_seconds(last_updated)
+    return make_etag("wallet", address, last_updated, risk_score), last_modified
+
+
+def connections_validators(address: str, connections_updated: Optional[float]) -> tuple:
+    """
+    Get the entity tag and the last modification time of the connected wallets of a wallet.
+
+    Parameters:
+    - address: The wallet address
+    - connections_updated: The connections_updated stamp of the wallet
+
+    Returns:
+    - The entity tag and the unix timestamp of the last modification in seconds
+    """
+    last_modified = to_unix_seconds(connections_updated)
+    return make_etag("connected-wallets", address, connections_updated), last_modified
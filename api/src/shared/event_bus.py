@@ -0,0 +1,166 @@
+import asyncio
+import logging
+from time import time
+from typing import List, Optional, Set
+
+from src.config import EVENT_STREAM_BUFFER_SIZE
+from src.models import ScoringEvent, ScoringJob, WalletData
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    The events of an event bus a subscriber is interested in, buffered in a bounded queue. When the
+    subscriber falls behind, the oldest buffered events are dropped so publishers never wait.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int,
+        classes: Optional[Set[int]] = None,
+        addresses: Optional[Set[str]] = None,
+    ) -> None:
+        """
+        Initialize the subscription.
+
+        Parameters:
+        - buffer_size: The maximum number of buffered events
+        - classes: Only receive wallet_scored events for wallets of these classes, None for all
+        - addresses: Only receive events about these addresses, None for all
+        """
+        self.queue: asyncio.Queue[ScoringEvent] = asyncio.Queue(maxsize=buffer_size)
+        self.classes = classes
+        self.addresses = addresses
+        self.dropped = 0
+
+    def matches(self, event: ScoringEvent) -> bool:
+        """
+        Check if an event passes the filters of the subscription.
+
+        Parameters:
+        - event: The event to check
+        """
+        if self.addresses is not None and event.address not in self.addresses:
+            return False
+        if (
+            self.classes is not None
+            and event.class_inference is not None
+            and event.class_inference not in self.classes
+        ):
+            return False
+        return True
+
+    def put(self, event: ScoringEvent) -> None:
+        """
+        Buffer an event, dropping the oldest buffered event if the buffer is full.
+
+        Parameters:
+        - event: The event to buffer
+        """
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self) -> ScoringEvent:
+        """
+        Wait for the next event.
+        """
+        return await self.queue.get()
+
+
+class EventBus:
+    """
+    Fans out the events published by the worker to the subscribed event streams. Only used from
+    the event loop, publishing never blocks.
+    """
+
+    def __init__(self, buffer_size: int = EVENT_STREAM_BUFFER_SIZE) -> None:
+        """
+        Initialize the event bus.
+
+        Parameters:
+        - buffer_size: The maximum number of buffered events per subscriber
+        """
+        self.buffer_size = buffer_size
+        self._subscriptions: List[Subscription] = []
+
+    def subscribe(
+        self,
+        classes: Optional[Set[int]] = None,
+        addresses: Optional[Set[str]] = None,
+    ) -> Subscription:
+        """
+        Subscribe to the events, the subscription must be removed with unsubscribe.
+
+        Parameters:
+        - classes: Only receive wallet_scored events for wallets of these classes, None for all
+        - addresses: Only receive events about these addresses, None for all
+
+        Returns:
+        - The subscription
+        """
+        subscription = Subscription(self.buffer_size, classes, addresses)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Remove a subscription.
+
+        Parameters:
+        - subscription: The subscription to remove
+        """
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+            if subscription.dropped:
+                logger.info(
+                    f"Event stream subscriber dropped {subscription.dropped} events"
+                )
+
+    def publish(self, event: ScoringEvent) -> None:
+        """
+        Publish an event to the matching subscriptions.
+
+        Parameters:
+        - event: The event to publish
+        """
+        for subscription in self._subscriptions:
+            if subscription.matches(event):
+                subscription.put(event)
+
+    def publish_wallet_scored(self, wallet_data: WalletData) -> None:
+        """
+        Publish that a wallet was scored and stored.
+
+        Parameters:
+        - wallet_data: The scored wallet data
+        """
+        if not self._subscriptions:
+            return
+        self.publish(
+            ScoringEvent(
+                event="wallet_scored",
+                address=wallet_data.address,
+                timestamp=time(),
+                class_inference=wallet_data.class_inference,
+            )
+        )
+
+    def publish_job(self, event: str, job: ScoringJob) -> None:
+        """
+        Publish the progress or the outcome of a scoring job.
+
+        Parameters:
+        - event: "job_progress" or "job_finished"
+        - job: The state of the job
+        """
+        if not self._subscriptions:
+            return
+        self.publish(
+            ScoringEvent(event=event, address=job.address, timestamp=time(), job=job)
+        )
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
@@ -0,0 +1,47 @@
+import aiohttp
+
+from src.config import (
+    WORKER_CLIENT_CONNECT_TIMEOUT_S,
+    WORKER_CLIENT_KEEPALIVE_S,
+    WORKER_CLIENT_MAX_CONNECTIONS,
+    WORKER_CLIENT_TIMEOUT_S,
+    WORKER_EVENTS_MAX_CONNECTIONS,
+)
+
+
+def create_worker_client_session() -> aiohttp.ClientSession:
+    """
+    Create the long lived HTTP session used to call the worker. Connections are kept alive and
+    reused between requests, up to WORKER_CLIENT_MAX_CONNECTIONS at once.
+
+    Must be called from a running event loop and closed with `await session.close()`.
+
+    Returns:
+    - The client session
+    """
+    connector = aiohttp.TCPConnector(
+        limit=WORKER_CLIENT_MAX_CONNECTIONS,
+        keepalive_timeout=WORKER_CLIENT_KEEPALIVE_S,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=WORKER_CLIENT_TIMEOUT_S, sock_connect=WORKER_CLIENT_CONNECT_TIMEOUT_S
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def create_worker_events_session() -> aiohttp.ClientSession:
+    """
+    Create the HTTP session used to proxy the worker event streams. The streams stay open
+    indefinitely, so they get their own pool of up to WORKER_EVENTS_MAX_CONNECTIONS connections
+    instead of starving the calls to the worker, and only connecting is subject to a timeout.
+
+    Must be called from a running event loop and closed with `await session.close()`.
+
+    Returns:
+    - The client session
+    """
+    connector = aiohttp.TCPConnector(limit=WORKER_EVENTS_MAX_CONNECTIONS)
+    timeout = aiohttp.ClientTimeout(
+        total=None, sock_connect=WORKER_CLIENT_CONNECT_TIMEOUT_S
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
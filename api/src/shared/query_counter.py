@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from time import time
+from typing import Dict
+
+from pymongo import MongoClient
+
+from src.config import WALLET_QUERY_FLUSH_S
+from src.db.mongodb import add_wallet_query_counts
+
+logger = logging.getLogger(__name__)
+
+
+class WalletQueryCounter:
+    """
+    Counts the wallet lookups of the API in memory and periodically adds them to the counts in
+    MongoDB, which the worker uses to rank the wallets to refresh in the background.
+    """
+
+    def __init__(
+        self, mongo_client: MongoClient, flush_interval_s: float = WALLET_QUERY_FLUSH_S
+    ) -> None:
+        """
+        Initialize the counter.
+
+        Parameters:
+        - mongo_client: The MongoDB client instance
+        - flush_interval_s: The time between two flushes of the counts in seconds
+        """
+        self.mongo_client = mongo_client
+        self.flush_interval_s = flush_interval_s
+        self._counts: Dict[str, int] = {}
+        self._running = False
+
+    def record(self, address: str) -> None:
+        """
+        Count a lookup of a wallet.
+
+        Parameters:
+        - address: The wallet address
+        """
+        self._counts[address] = self._counts.get(address, 0) + 1
+
+    async def start(self) -> None:
+        """
+        Start flushing the counts periodically.
+        """
+        logger.info("Starting wallet query counter")
+        self._running = True
+        while self._running:
+            await asyncio.sleep(self.flush_interval_s)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Add the counts recorded since the last flush to the database, they are dropped on error.
+        """
+        counts, self._counts = self._counts, {}
+        try:
+            # pymongo is blocking, keep it off the event loop
+            await asyncio.to_thread(
+                add_wallet_query_counts, self.mongo_client, counts, time()
+            )
+        except Exception as e:
+            logger.error(f"Error flushing {len(counts)} wallet query counts: {e}")
+
+    def stop(self) -> None:
+        """
+        Stop flushing the counts.
+        """
+        logger.info("Stopping wallet query counter")
+        self._running = False
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Optional, Set, Tuple
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+from src.config import (
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL_S,
+    WALLET_CHANGES_POLL_S,
+)
+from src.db.mongodb import (
+    get_latest_wallet_change_id,
+    get_wallet_changes_after,
+    has_wallet_change,
+)
+from src.models import ResponseCacheStats
+
+WALLET_CHANGES_BATCH_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    A size bounded cache of API responses keyed by endpoint and wallet address. Responses expire
+    after a time to live and the least recently used response is evicted when the cache is full.
+
+    Only used from the event loop, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_s: float = RESPONSE_CACHE_TTL_S,
+    ) -> None:
+        """
+        Initialize the cache.
+
+        Parameters:
+        - max_entries: The maximum number of cached responses
+        - ttl_s: The time to live of a cached response in seconds
+        """
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        # Least recently used first, values are (expiry time, response)
+        self._entries: OrderedDict[Tuple[str, str], Tuple[float, Any]] = OrderedDict()
+        self._endpoints: Set[str] = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, endpoint: str, address: str) -> Optional[Any]:
+        """
+        Get a cached response.
+
+        Parameters:
+        - endpoint: The name of the endpoint
+        - address: The wallet address
+
+        Returns:
+        - The cached response, None if it is not cached or expired
+        """
+        key = (endpoint, address)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, response = entry
+        if expires_at <= monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def set(self, endpoint: str, address: str, response: Any) -> None:
+        """
+        Cache a response, evicting the least recently used responses if the cache is full.
+
+        Parameters:
+        - endpoint: The name of the endpoint
+        - address: The wallet address
+        - response: The response to cache
+        """
+        key = (endpoint, address)
+        self._endpoints.add(endpoint)
+        self._entries[key] = (monotonic() + self.ttl_s, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, address: str) -> None:
+        """
+        Drop the cached responses of a wallet for every endpoint.
+
+        Parameters:
+        - address: The wallet address
+        """
+        for endpoint in self._endpoints:
+            if self._entries.pop((endpoint, address), None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        """
+        Drop every cached response.
+        """
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self) -> ResponseCacheStats:
+        """
+        Get the cache counters.
+        """
+        return ResponseCacheStats(
+            size=len(self._entries),
+            max_entries=self.max_entries,
+            ttl_s=self.ttl_s,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            expirations=self.expirations,
+            invalidations=self.invalidations,
+        )
+
+
+class WalletChangeListener:
+    """
+    Follows the wallet change feed the worker writes to in MongoDB and invalidates the cached
+    responses of the changed wallets.
+    """
+
+    def __init__(
+        self,
+        mongo_client: MongoClient,
+        response_cache: ResponseCache,
+        poll_interval_s: float = WALLET_CHANGES_POLL_S,
+    ) -> None:
+        """
+        Initialize the listener.
+
+        Parameters:
+        - mongo_client: The MongoDB client instance
+        - response_cache: The cache to invalidate
+        - poll_interval_s: The time between two reads of the change feed in seconds
+        """
+        self.mongo_client = mongo_client
+        self.response_cache = response_cache
+        self.poll_interval_s = poll_interval_s
+        self.last_change_id: Optional[ObjectId] = None
+        self._running = False
+
+    async def start(self) -> None:
+        """
+        Start following the change feed, from its current end.
+        """
+        logger.info("Starting wallet change listener")
+        self._running = True
+        self.last_change_id = await asyncio.to_thread(
+            get_latest_wallet_change_id, self.mongo_client
+        )
+        while self._running:
+            try:
+                # pymongo is blocking, keep it off the event loop
+                addresses = await asyncio.to_thread(self.read_changes)
+                if addresses is None:
+                    logger.warning(
+                        "Missed wallet changes, clearing the whole response cache"
+                    )
+                    self.response_cache.clear()
+                else:
+                    for address in addresses:
+                        self.response_cache.invalidate(address)
+            except Exception as e:
+                logger.error(f"Error in wallet change listener: {e}")
+                logger.exception(e)
+            await asyncio.sleep(self.poll_interval_s)
+
+    def stop(self) -> None:
+        """
+        Stop following the change feed.
+        """
+        logger.info("Stopping wallet change listener")
+        self._running = False
+
+    def read_changes(self) -> Optional[Set[str]]:
+        """
+        Read the changes recorded since the last read.
+
+        Returns:
+        - The addresses of the changed wallets, None if changes were dropped from the feed before
+        they were read
+        """
+        if self.last_change_id is not None and not has_wallet_change(
+            self.mongo_client, self.last_change_id
+        ):
+            self.last_change_id = get_latest_wallet_change_id(self.mongo_client)
+            return None
+
+        addresses: Set[str] = set()
+        while True:
+            changes = get_wallet_changes_after(
+                self.mongo_client, self.last_change_id, WALLET_CHANGES_BATCH_SIZE
+            )
+            if not changes:
+                return addresses
+            addresses.update(change["address"] for change in changes)
+            self.last_change_id = changes[-1]["_id"]
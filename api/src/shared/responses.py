@@ -0,0 +1,142 @@
+import asyncio
+import gzip
+from typing import Any, Optional, Tuple
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from src.config import (
+    FAST_RESPONSES_ENABLED,
+    RESPONSE_BROTLI_QUALITY,
+    RESPONSE_COMPRESSION_MIN_BYTES,
+    RESPONSE_GZIP_LEVEL,
+)
+
+try:
+    import brotli
+except ImportError:  # Brotli compression is optional, gzip is used without it
+    brotli = None
+
+
+def encode_model(model: BaseModel) -> bytes:
+    """
+    Encode a model as JSON in a single pass, without validating it again.
+
+    Parameters:
+    - model: The model to encode
+
+    Returns:
+    - The JSON encoded model
+    """
+    return model.__pydantic_serializer__.to_json(model)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Choose the content encoding of a response from the Accept-Encoding header of the request.
+
+    Parameters:
+    - accept_encoding: The Accept-Encoding header, None if missing
+
+    Returns:
+    - "br", "gzip" or None if the client accepts neither
+    """
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Compress a response body.
+
+    Parameters:
+    - body: The response body
+    - encoding: "br" or "gzip"
+
+    Returns:
+    - The compressed body
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+async def encode_response_body(
+    model: BaseModel, accept_encoding: Optional[str]
+) -> Tuple[bytes, Optional[str]]:
+    """
+    Encode a model as a response body, compressed if it is large enough and the client accepts it.
+
+    Parameters:
+    - model: The model to encode
+    - accept_encoding: The Accept-Encoding header of the request, None if missing
+
+    Returns:
+    - The body and its content encoding, None if it is not compressed
+    """
+    body = encode_model(model)
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None or len(body) < RESPONSE_COMPRESSION_MIN_BYTES:
+        return body, None
+    # Compressing megabytes takes milliseconds, keep it off the event loop
+    return await asyncio.to_thread(compress, body, encoding), encoding
+
+
+async def model_response(request: Request, response: Response, model: BaseModel) -> Any:
+    """
+    Build the response of a route returning a model it just built.
+
+    With fast responses disabled the model is returned as is, for FastAPI to validate and encode
+    against the response model of the route. Otherwise it is encoded and compressed here, which
+    skips FastAPI's validation, so only use it for models of the declared response model type.
+
+    Parameters:
+    - request: The request of the route
+    - response: The response injected into the route, its status code and headers are kept
+    - model: The model to respond with
+
+    Returns:
+    - The model, or the response with the encoded model
+    """
+    if not FAST_RESPONSES_ENABLED:
+        return model
+
+    body, encoding = await encode_response_body(
+        model, request.headers.get("accept-encoding")
+    )
+    fast_response = Response(
+        content=body,
+        status_code=response.status_code or 200,
+        media_type="application/json",
+    )
+    for name, value in response.headers.items():
+        fast_response.headers[name] = value
+    vary = [
+        value.strip()
+        for value in fast_response.headers.get("Vary", "").split(",")
+        if value.strip()
+    ]
+    if "accept-encoding" not in (value.lower() for value in vary):
+        vary.append("Accept-Encoding")
+    fast_response.headers["Vary"] = ", ".join(vary)
+    if encoding is not None:
+        fast_response.headers["Content-Encoding"] = encoding
+    return fast_response
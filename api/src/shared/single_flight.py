@@ -0,0 +1,64 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller starts the call and every caller
+    arriving while it is in flight awaits the same result, or the same exception.
+
+    The call runs in its own task, so a caller going away (e.g. a client disconnecting) does not
+    cancel the call for the other callers.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize the single flight group.
+        """
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run a call, or join the call already in flight for the key.
+
+        Parameters:
+        - key: The key identifying the call
+        - call: A function returning the awaitable to run if no call is in flight for the key
+
+        Returns:
+        - The result of the call
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def in_flight(self, key: Hashable) -> bool:
+        """
+        Check if a call is in flight for a key.
+
+        Parameters:
+        - key: The key identifying the call
+        """
+        return key in self._calls
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        """
+        Remove a finished call, so the next caller starts a new one.
+
+        Parameters:
+        - key: The key identifying the call
+        - task: The finished task
+        """
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
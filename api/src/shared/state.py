@@ -2,36 +2,58 @@ import asyncio
 import logging
 
 from contextlib import asynccontextmanager
+from typing import AsyncIterator, Tuple
 from joblib import load
-from neo4j import GraphDatabase
+from neo4j import Driver, GraphDatabase
 from pymongo import MongoClient
 import onnxruntime
 
 from src.worker.block_processing_worker import BlockProcessingWorker
+from src.worker.prefetch import NeighborPrefetcher
+from src.worker.scoring_jobs import ScoringJobManager
+from src.worker.staleness_refresh import StalenessRefreshScheduler
+from src.ml.risk_propagation import RiskPropagationEngine
 from src.shared.ml_session import MLSession
-from src.db.mongodb import set_up_database
+from src.shared.http_client import (
+    create_worker_client_session,
+    create_worker_events_session,
+)
+from src.shared.worker_client import HttpWorkerClient, LocalWorkerClient
+from src.shared.response_cache import ResponseCache, WalletChangeListener
+from src.shared.query_counter import WalletQueryCounter
+from src.shared.single_flight import SingleFlight
+from src.shared.event_bus import EventBus
+from src.db.mongodb import set_up_database, set_up_wallet_changes_collection
 from src.extern.api_worker import BlockstreamAPIWorker
 from src.config import (
     MONGO_URI,
     NEO4J_URI,
     NEO4J_USERNAME,
     NEO4J_PASSWORD,
+    PREFETCH_ENABLED,
+    RESPONSE_CACHE_ENABLED,
+    RISK_PROPAGATION_ENABLED,
     SETUP_MONGO_DB,
+    STALENESS_REFRESH_ENABLED,
+    WALLET_QUERY_COUNTING_ENABLED,
 )
 
 logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
-async def worker_lifespan(app):
+async def databases(app, setup_mongo_db: bool) -> AsyncIterator[Tuple[Driver, MongoClient]]:
     """
-    Allow access to the Neo4j database and the Blockchain.com API worker in the app state and manager
-    their life cycles.
+    Connect to the Neo4j and MongoDB databases, store the clients in the app state and close them
+    on exit.
 
     Parameters:
     - app: The FastAPI application instance
+    - setup_mongo_db: Whether the MongoDB collections and indexes are set up
+
+    Returns:
+    - The Neo4j driver and the MongoDB client
     """
-    logger.info("Starting worker")
     neo4j_driver = GraphDatabase.driver(
         NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD)
     )
@@ -43,10 +65,35 @@ async def worker_lifespan(app):
     logger.info(f"Connected to MongoDB at {MONGO_URI}")
     app.state.mongo_client = mongo_client
 
-    if SETUP_MONGO_DB:
+    if setup_mongo_db:
         set_up_database(mongo_client)
         logger.info("Set up MongoDB database")
+    else:
+        set_up_wallet_changes_collection(mongo_client)
+
+    try:
+        yield neo4j_driver, mongo_client
+    finally:
+        neo4j_driver.close()
+        logger.info("Disconnected from Neo4j")
 
+        mongo_client.close()
+        logger.info("Disconnected from MongoDB")
+
+
+@asynccontextmanager
+async def worker_components(
+    app, neo4j_driver: Driver, mongo_client: MongoClient
+) -> AsyncIterator[None]:
+    """
+    Start the machine learning session, the Blockstream API worker and the background workers,
+    store them in the app state and stop them on exit.
+
+    Parameters:
+    - app: The FastAPI application instance
+    - neo4j_driver: The Neo4j driver instance
+    - mongo_client: The MongoDB client instance
+    """
     # Load the random forest model from the onnx file
     # ? Should the file path be hardcoded?
     ort_session = onnxruntime.InferenceSession("res/random_forest_model.onnx")
@@ -63,57 +110,247 @@ async def worker_lifespan(app):
     logger.info("Started API worker")
     app.state.api_worker = blockchain_api_worker
 
+    # Coalesces concurrent refreshes of the same wallet
+    wallet_single_flight = SingleFlight()
+    app.state.wallet_single_flight = wallet_single_flight
+
+    # Fans out the scored wallets and the job progress to the event streams
+    event_bus = EventBus()
+    app.state.event_bus = event_bus
+
+    # The background refreshes wait for the blocks the worker has not processed yet
     block_processing_worker = BlockProcessingWorker(
-        mongo_client, blockchain_api_worker, ml_session, neo4j_driver
+        mongo_client, blockchain_api_worker, ml_session, neo4j_driver, event_bus
+    )
+    app.state.block_processing_worker = block_processing_worker
+
+    neighbor_prefetcher = None
+    if PREFETCH_ENABLED:
+        neighbor_prefetcher = NeighborPrefetcher(
+            mongo_client,
+            neo4j_driver,
+            blockchain_api_worker,
+            ml_session,
+            wallet_single_flight,
+            block_processing_worker,
+            event_bus,
+        )
+        app.state.neighbor_prefetch_task = asyncio.create_task(
+            neighbor_prefetcher.start()
+        )
+        logger.info("Started neighbor prefetch")
+    app.state.neighbor_prefetcher = neighbor_prefetcher
+
+    scoring_job_manager = ScoringJobManager(
+        mongo_client,
+        blockchain_api_worker,
+        ml_session,
+        neo4j_driver,
+        wallet_single_flight,
+        event_bus,
+        neighbor_prefetcher,
     )
+    scoring_job_manager.resume()
+    app.state.scoring_job_manager = scoring_job_manager
+    logger.info("Started scoring job manager")
+
     app.state.block_processing_worker_task = asyncio.create_task(
         block_processing_worker.start()
     )
     logger.info("Started block processing worker")
 
-    yield
+    risk_propagation_engine = None
+    if RISK_PROPAGATION_ENABLED:
+        risk_propagation_engine = RiskPropagationEngine(neo4j_driver)
+        app.state.risk_propagation_task = asyncio.create_task(
+            risk_propagation_engine.start()
+        )
+        logger.info("Started risk propagation")
+
+    staleness_refresh_scheduler = None
+    if STALENESS_REFRESH_ENABLED:
+        staleness_refresh_scheduler = StalenessRefreshScheduler(
+            mongo_client,
+            neo4j_driver,
+            blockchain_api_worker,
+            ml_session,
+            wallet_single_flight,
+            block_processing_worker,
+            event_bus,
+        )
+        app.state.staleness_refresh_task = asyncio.create_task(
+            staleness_refresh_scheduler.start()
+        )
+        logger.info("Started staleness refresh")
+    app.state.staleness_refresh_scheduler = staleness_refresh_scheduler
+
+    try:
+        yield
+    finally:
+        if staleness_refresh_scheduler is not None:
+            staleness_refresh_scheduler.stop()
+            app.state.staleness_refresh_task.cancel()
+            try:
+                await app.state.staleness_refresh_task
+            except asyncio.CancelledError:
+                logger.info("Staleness refresh task cancelled")
+
+        if risk_propagation_engine is not None:
+            risk_propagation_engine.stop()
+            app.state.risk_propagation_task.cancel()
+            try:
+                await app.state.risk_propagation_task
+            except asyncio.CancelledError:
+                logger.info("Risk propagation task cancelled")
+
+        await scoring_job_manager.stop()
+        logger.info("Stopped scoring job manager")
+
+        if neighbor_prefetcher is not None:
+            neighbor_prefetcher.stop()
+            app.state.neighbor_prefetch_task.cancel()
+            try:
+                await app.state.neighbor_prefetch_task
+            except asyncio.CancelledError:
+                logger.info("Neighbor prefetch task cancelled")
+
+        block_processing_worker.stop()
+        logger.info("Stopped block processing worker")
+
+        app.state.block_processing_worker_task.cancel()
+        try:
+            await app.state.block_processing_worker_task
+        except asyncio.CancelledError:
+            logger.info("Block processing worker task cancelled")
+
+        await blockchain_api_worker.close()
+        logger.info("Stopped API worker")
 
-    block_processing_worker.stop()
-    logger.info("Stopped block processing worker")
+        # ? Is this necessary?
+        app.state.ml_session = None
+        logger.info("Cleaned up random forest model session")
+
+
+@asynccontextmanager
+async def api_components(app, mongo_client: MongoClient) -> AsyncIterator[None]:
+    """
+    Start the response cache and its invalidation listener, store them in the app state and stop
+    them on exit.
+
+    Parameters:
+    - app: The FastAPI application instance
+    - mongo_client: The MongoDB client instance
+    """
+    response_cache = None
+    wallet_change_listener = None
+    if RESPONSE_CACHE_ENABLED:
+        response_cache = ResponseCache()
+        wallet_change_listener = WalletChangeListener(mongo_client, response_cache)
+        app.state.wallet_change_listener_task = asyncio.create_task(
+            wallet_change_listener.start()
+        )
+        logger.info("Started response cache")
+    app.state.response_cache = response_cache
+
+    wallet_query_counter = None
+    if WALLET_QUERY_COUNTING_ENABLED:
+        wallet_query_counter = WalletQueryCounter(mongo_client)
+        app.state.wallet_query_counter_task = asyncio.create_task(
+            wallet_query_counter.start()
+        )
+        logger.info("Started wallet query counter")
+    app.state.wallet_query_counter = wallet_query_counter
 
-    app.state.block_processing_worker_task.cancel()
     try:
-        await app.state.block_processing_worker_task
-    except asyncio.CancelledError:
-        logger.info("Block processing worker task cancelled")
+        yield
+    finally:
+        if wallet_query_counter is not None:
+            wallet_query_counter.stop()
+            app.state.wallet_query_counter_task.cancel()
+            try:
+                await app.state.wallet_query_counter_task
+            except asyncio.CancelledError:
+                logger.info("Wallet query counter task cancelled")
+            await wallet_query_counter.flush()
 
-    await blockchain_api_worker.close()
-    logger.info("Stopped API worker")
+        if wallet_change_listener is not None:
+            wallet_change_listener.stop()
+            app.state.wallet_change_listener_task.cancel()
+            try:
+                await app.state.wallet_change_listener_task
+            except asyncio.CancelledError:
+                logger.info("Wallet change listener task cancelled")
 
-    neo4j_driver.close()
-    logger.info("Disconnected from Neo4j")
 
-    mongo_client.close()
-    logger.info("Disconnected from MongoDB")
+@asynccontextmanager
+async def worker_lifespan(app):
+    """
+    Allow access to the Neo4j database and the Blockchain.com API worker in the app state and manager
+    their life cycles.
 
-    # ? Is this necessary?
-    app.state.ml_session = None
-    logger.info("Cleaned up random forest model session")
+    Parameters:
+    - app: The FastAPI application instance
+    """
+    logger.info("Starting worker")
+    async with databases(app, SETUP_MONGO_DB) as (neo4j_driver, mongo_client):
+        async with worker_components(app, neo4j_driver, mongo_client):
+            yield
 
 
 @asynccontextmanager
 async def api_lifespan(app):
     """
-    Allow access to the Neo4j database in the app state and manage
+    Allow access to the Neo4j and MongoDB databases in the app state and manage
     their life cycles.
 
     Parameters:
     - app: The FastAPI application instance
     """
     logger.info("Starting API")
-    neo4j_driver = GraphDatabase.driver(
-        NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD)
-    )
-    neo4j_driver.verify_connectivity()
-    logger.info(f"Connected to Neo4j at {NEO4J_URI} as {NEO4J_USERNAME}")
-    app.state.neo4j_driver = neo4j_driver
+    # MongoDB is used to page through the full connection lists of hub wallets
+    async with databases(app, False) as (neo4j_driver, mongo_client):
+        # Shared by the requests forwarded to the worker, so connections are reused
+        worker_session = create_worker_client_session()
+        app.state.worker_session = worker_session
+        app.state.worker_client = HttpWorkerClient(worker_session)
+        worker_events_session = create_worker_events_session()
+        app.state.worker_events_session = worker_events_session
+        logger.info("Created worker client sessions")
 
-    yield
+        try:
+            async with api_components(app, mongo_client):
+                yield
+        finally:
+            await worker_events_session.close()
+            await worker_session.close()
+            logger.info("Closed worker client sessions")
 
-    neo4j_driver.close()
-    logger.info("Disconnected from Neo4j")
+
+@asynccontextmanager
+async def all_lifespan(app):
+    """
+    Run the API and the worker in one process, sharing the database clients and the Blockstream
+    API worker, with the API calling the worker logic directly instead of over HTTP.
+
+    Parameters:
+    - app: The FastAPI application instance
+    """
+    logger.info("Starting API and worker")
+    async with databases(app, SETUP_MONGO_DB) as (neo4j_driver, mongo_client):
+        async with worker_components(app, neo4j_driver, mongo_client):
+            state = app.state
+            worker_client = LocalWorkerClient(
+                mongo_client,
+                state.api_worker,
+                state.ml_session,
+                neo4j_driver,
+                state.wallet_single_flight,
+                state.scoring_job_manager,
+                state.event_bus,
+            )
+            app.state.worker_client = worker_client
+            try:
+                async with api_components(app, mongo_client):
+                    yield
+            finally:
+                await worker_client.close()
@@ -0,0 +1,52 @@
+from time import monotonic
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at a constant rate up to its capacity. Spending may take the bucket
+    below zero, so a cost only known after the fact is paid back before the next spend.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        """
+        Initialize a full bucket.
+
+        Parameters:
+        - rate: The number of tokens added per second
+        - capacity: The maximum number of tokens in the bucket
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = monotonic()
+
+    @property
+    def tokens(self) -> float:
+        now = monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+        return self._tokens
+
+    def wait_time(self, cost: float = 1.0) -> float:
+        """
+        Get the time until a cost can be spent.
+
+        Parameters:
+        - cost: The number of tokens to spend
+
+        Returns:
+        - The time to wait in seconds, 0 if the tokens are available
+        """
+        missing = cost - self.tokens
+        return max(missing / self.rate, 0.0) if self.rate > 0 else float("inf")
+
+    def spend(self, cost: float) -> None:
+        """
+        Spend tokens, possibly going below zero.
+
+        Parameters:
+        - cost: The number of tokens to spend
+        """
+        self._tokens = self.tokens - cost
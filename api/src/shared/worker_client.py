@@ -0,0 +1,328 @@
+import asyncio
+import logging
+from typing import List, Optional, Set
+
+import aiohttp
+from fastapi import HTTPException, status
+from neo4j import Driver
+from pydantic import ValidationError
+from pymongo import MongoClient
+
+from src.config import (
+    WALLET_BATCH_MAX_CONCURRENCY,
+    WORKER_API_URL,
+    WORKER_JOBS_ROUTE_PREFIX,
+    WORKER_WALLET_ROUTE_PREFIX,
+)
+from src.extern.api_worker import BlockstreamAPIWorker
+from src.models import ScoringJob, WalletBatchRequest, WalletData
+from src.shared.event_bus import EventBus
+from src.shared.ml_session import MLSession
+from src.shared.single_flight import SingleFlight
+from src.worker.scoring_jobs import ScoringJobManager
+from src.worker.wallet_refresh import fetch_score_and_store_wallet, refresh_wallets
+
+logger = logging.getLogger(__name__)
+
+
+class HttpWorkerClient:
+    """
+    Calls the worker service over HTTP with the pooled session. Concurrent calls for the same
+    wallet share one request to the worker.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession) -> None:
+        """
+        Initialize the client.
+
+        Parameters:
+        - session: The pooled client session used to call the worker
+        """
+        self.session = session
+        self.single_flight = SingleFlight()
+
+    async def get_wallet_data(self, base58_address: str) -> Optional[WalletData]:
+        """
+        Get the wallet data, fetched and scored by the worker if it is not populated yet.
+
+        Parameters:
+        - base58_address: The base58 encoded Bitcoin address to query
+
+        Returns:
+        - The wallet data, or None if the wallet is not found
+        """
+        return await self.single_flight.do(
+            ("wallet", base58_address),
+            lambda: get_wallet_data_from_worker(self.session, base58_address),
+        )
+
+    async def queue_wallets(self, base58_addresses: List[str]) -> bool:
+        """
+        Queue wallets to be fetched and stored by the worker in the background.
+
+        Parameters:
+        - base58_addresses: The base58 encoded Bitcoin addresses to queue
+
+        Returns:
+        - Whether the worker accepted the wallets
+        """
+        return await queue_wallets_on_worker(self.session, base58_addresses)
+
+    async def submit_scoring_job(
+        self, base58_address: str, force_update: bool, wait_s: float
+    ) -> ScoringJob:
+        """
+        Submit a scoring job for a wallet and wait for it for a while.
+
+        Parameters:
+        - base58_address: The base58 encoded Bitcoin address to score
+        - force_update: Whether the wallet is refetched even if already populated
+        - wait_s: The maximum time the worker waits for the job to finish in seconds
+
+        Returns:
+        - The job, as of the end of the wait
+        """
+        return await self.single_flight.do(
+            ("job", base58_address),
+            lambda: submit_scoring_job_on_worker(
+                self.session, base58_address, force_update, wait_s
+            ),
+        )
+
+
+class LocalWorkerClient:
+    """
+    Runs the worker logic in the API process, for deployments running both in one process. Has
+    the interface of HttpWorkerClient, without the HTTP round trip and the JSON encoding.
+    """
+
+    def __init__(
+        self,
+        mongo_client: MongoClient,
+        api_worker: BlockstreamAPIWorker,
+        ml_session: MLSession,
+        neo4j_driver: Driver,
+        wallet_single_flight: SingleFlight,
+        scoring_job_manager: ScoringJobManager,
+        event_bus: Optional[EventBus] = None,
+    ) -> None:
+        """
+        Initialize the client.
+
+        Parameters:
+        - mongo_client: The MongoDB client instance
+        - api_worker: The API worker instance
+        - ml_session: The machine learning session instance
+        - neo4j_driver: The Neo4j driver instance
+        - wallet_single_flight: The single flight group coalescing refreshes of the same wallet
+        - scoring_job_manager: The scoring job manager instance
+        - event_bus: The event bus to publish the scored wallets to
+        """
+        self.mongo_client = mongo_client
+        self.api_worker = api_worker
+        self.ml_session = ml_session
+        self.neo4j_driver = neo4j_driver
+        self.wallet_single_flight = wallet_single_flight
+        self.scoring_job_manager = scoring_job_manager
+        self.event_bus = event_bus
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def get_wallet_data(self, base58_address: str) -> Optional[WalletData]:
+        """
+        Fetch, score and store a wallet, sharing the refresh already in flight for it.
+
+        Parameters:
+        - base58_address: The base58 encoded Bitcoin address to query
+
+        Returns:
+        - The wallet data, or None if the wallet is not found
+        """
+        wallet_data, connected_wallets = await self.wallet_single_flight.do(
+            base58_address,
+            lambda: fetch_score_and_store_wallet(
+                self.api_worker,
+                self.mongo_client,
+                self.neo4j_driver,
+                self.ml_session,
+                base58_address,
+                event_bus=self.event_bus,
+            ),
+        )
+        if wallet_data is not None and connected_wallets is None:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error getting connected wallets",
+            )
+        return wallet_data
+
+    async def queue_wallets(self, base58_addresses: List[str]) -> bool:
+        """
+        Fetch, score and store wallets in a background task.
+
+        Parameters:
+        - base58_addresses: The base58 encoded Bitcoin addresses to queue
+
+        Returns:
+        - True, the wallets are always accepted
+        """
+        task = asyncio.create_task(
+            refresh_wallets(
+                self.api_worker,
+                self.mongo_client,
+                self.neo4j_driver,
+                self.ml_session,
+                self.wallet_single_flight,
+                base58_addresses,
+                WALLET_BATCH_MAX_CONCURRENCY,
+                self.event_bus,
+            )
+        )
+        # Keep a reference, the event loop only holds weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def submit_scoring_job(
+        self, base58_address: str, force_update: bool, wait_s: float
+    ) -> ScoringJob:
+        """
+        Submit a scoring job for a wallet, or join its active job, and wait for it for a while.
+
+        Parameters:
+        - base58_address: The base58 encoded Bitcoin address to score
+        - force_update: Whether the wallet is refetched even if already populated
+        - wait_s: The maximum time to wait for the job to finish in seconds
+
+        Returns:
+        - The job, as of the end of the wait
+        """
+        return await self.scoring_job_manager.submit(
+            base58_address, force_update, wait_s
+        )
+
+    async def close(self) -> None:
+        """
+        Cancel the queued wallet refreshes still running.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def get_wallet_data_from_worker(
+    session: aiohttp.ClientSession,
+    base58_address: str,
+) -> Optional[WalletData]:
+    """
+    Get the wallet data from the worker.
+
+    Parameters:
+    - session: The pooled client session used to call the worker
+    - base58_address: The base58 encoded Bitcoin address to query
+
+    Returns:
+    - The wallet data, or None if the wallet is not found
+    """
+    try:
+        async with session.get(
+            f"{WORKER_API_URL}{WORKER_WALLET_ROUTE_PREFIX}/{base58_address}"
+        ) as response:
+            if response.status == 200:
+                data = await response.json()
+                try:
+                    return WalletData.model_validate(data)
+                except ValidationError as e:
+                    logger.error(f"Error parsing validating parsed model: {e}")
+                    return None
+                except Exception as e:
+                    logger.error(f"Error parsing JSON response: {e}")
+                    return None
+            elif response.status == 404:
+                return None
+            else:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Error getting data from worker",
+                )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Timed out getting data from worker",
+        )
+    except aiohttp.ClientError as e:
+        logger.error(f"Error connecting to worker: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error getting data from worker",
+        )
+
+
+async def queue_wallets_on_worker(
+    session: aiohttp.ClientSession, base58_addresses: List[str]
+) -> bool:
+    """
+    Queue wallets to be fetched and stored by the worker in the background.
+
+    Parameters:
+    - session: The pooled client session used to call the worker
+    - base58_addresses: The base58 encoded Bitcoin addresses to queue
+
+    Returns:
+    - Whether the worker accepted the wallets
+    """
+    try:
+        async with session.post(
+            f"{WORKER_API_URL}{WORKER_WALLET_ROUTE_PREFIX}/batch",
+            json=WalletBatchRequest(addresses=base58_addresses).model_dump(),
+        ) as response:
+            if response.status == 202:
+                return True
+            logger.error(f"Worker refused wallet batch with status {response.status}")
+    except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+        logger.error(f"Error queueing wallet batch on worker: {e}")
+    return False
+
+
+async def submit_scoring_job_on_worker(
+    session: aiohttp.ClientSession,
+    base58_address: str,
+    force_update: bool,
+    wait_s: float,
+) -> ScoringJob:
+    """
+    Submit a scoring job for a wallet to the worker and wait for it for a while.
+
+    Parameters:
+    - session: The pooled client session used to call the worker
+    - base58_address: The base58 encoded Bitcoin address to score
+    - force_update: Whether the wallet is refetched even if already populated
+    - wait_s: The maximum time the worker waits for the job to finish in seconds
+
+    Returns:
+    - The job, as of the end of the wait
+    """
+    try:
+        async with session.post(
+            f"{WORKER_API_URL}{WORKER_JOBS_ROUTE_PREFIX}/{base58_address}",
+            params={"force_update": str(force_update).lower(), "wait_s": wait_s},
+        ) as response:
+            if response.status in (status.HTTP_200_OK, status.HTTP_202_ACCEPTED):
+                try:
+                    return ScoringJob.model_validate(await response.json())
+                except (ValidationError, aiohttp.ContentTypeError) as e:
+                    logger.error(f"Error parsing scoring job: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error getting data from worker",
+            )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Timed out getting data from worker",
+        )
+    except aiohttp.ClientError as e:
+        logger.error(f"Error connecting to worker: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error getting data from worker",
+        )
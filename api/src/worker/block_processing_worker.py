@@ -1,13 +1,45 @@
-from time import time
-from typing import List, Dict
+from time import monotonic, time
+from typing import List, Dict, Optional
 from neo4j import Driver
 from pymongo import MongoClient
+from src.config import (
+    BULK_IMPORT_DIR,
+    BULK_IMPORT_ENABLED,
+    BULK_IMPORT_NEO4J_ADMIN,
+    BULK_IMPORT_TIP_DISTANCE,
+    HEAVY_HITTER_ENABLED,
+    HEAVY_HITTER_REFRESH_BLOCKS,
+    KNOWN_ADDRESS_FILTER_ENABLED,
+    KNOWN_ADDRESS_FILTER_SNAPSHOT_INTERVAL_S,
+    REFRESH_SCHEDULER_ENABLED,
+    REFRESH_SCHEDULER_POLL_S,
+    TX_INDEX_ENABLED,
+)
+from src.db.bulk_import import (
+    BulkGraphWriter,
+    is_graph_empty,
+    load_with_cypher,
+    neo4j_admin_import_command,
+)
+from src.db.connections import (
+    split_hub_connections,
+    store_connected_wallets,
+    store_hub_connections,
+)
 from src.db.neo4j import (
     upsert_wallet_data_in_db,
-    upsert_connected_wallets_in_db,
 )
-from src.extern.bitcoin_api import convert_to_wallet_data, get_address_data
+from src.db.tx_index import TransactionIndex
+from src.extern.bitcoin_api import (
+    MAXIMUM_TRANSACTIONS,
+    convert_to_wallet_data,
+    get_address_data,
+)
 from src.ml.random_forest import infer_wallet_data_class
+from src.worker.heavy_hitters import HeavyHitterTracker
+from src.worker.known_addresses import KnownAddresses
+from src.worker.refresh_scheduler import RefreshScheduler
+from src.shared.event_bus import EventBus
 from src.shared.ml_session import MLSession
 from src.extern.api_worker import (
     BlockstreamAPIWorker,
@@ -18,12 +50,22 @@ from src.extern.api_worker import (
 )
 from src.db.mongodb import (
     ADDRESS_NEVER_PROCESSED,
+    add_wallet_changes,
+    clear_address_dirty,
     get_address_last_processed_block_height,
+    get_dirty_addresses,
     get_last_processed_block_height,
+    mark_addresses_dirty,
     set_address_last_processed_block_height,
+    set_addresses_last_processed_block_height,
     set_last_processed_block_height,
 )
-from src.models import Block, Transaction
+from src.models import (
+    BitcoinAddressQueryResponse,
+    Block,
+    HeavyHitterStats,
+    Transaction,
+)
 import logging
 import asyncio
 
@@ -37,6 +79,7 @@ class BlockProcessingWorker:
         api_worker: BlockstreamAPIWorker,
         ml_session: MLSession,
         neo4j_driver: Driver,
+        event_bus: Optional[EventBus] = None,
     ) -> None:
         """
         Initialize the block processing worker.
@@ -46,11 +89,44 @@ class BlockProcessingWorker:
         - api_worker: The API worker instance
         - ml_session: The machine learning session instance
         - neo4j_driver: The Neo4j driver instance
+        - event_bus: The event bus to publish the scored wallets to
         """
         self.mongo_client = mongo_client
         self.api_worker = api_worker
         self.ml_session = ml_session
         self.neo4j_driver = neo4j_driver
+        self.event_bus = event_bus
+        # Far from the chain tip, wallets are written to CSV shards and loaded in bulk later
+        self.bulk_writer = (
+            BulkGraphWriter(BULK_IMPORT_DIR, on_flush=self.checkpoint_bulk_import)
+            if BULK_IMPORT_ENABLED
+            else None
+        )
+        # Addresses whose whole history is in the index are rebuilt from it, without API calls
+        self.tx_index = TransactionIndex() if TX_INDEX_ENABLED else None
+        # Addresses the filter does not contain are known to have never been processed
+        self.known_addresses = (
+            KnownAddresses(mongo_client) if KNOWN_ADDRESS_FILTER_ENABLED else None
+        )
+        self._known_addresses_saved_at = monotonic()
+        # Addresses seen in most blocks are refreshed by a separate task, at most every
+        # HEAVY_HITTER_REFRESH_BLOCKS blocks
+        self.heavy_hitters = HeavyHitterTracker() if HEAVY_HITTER_ENABLED else None
+        self._heavy_hitter_queue: asyncio.Queue = asyncio.Queue()
+        # Height of the latest block from which each heavy hitter may be refreshed again
+        self._heavy_hitter_refresh_due: Dict[str, int] = {}
+        self._heavy_hitter_task: Optional[asyncio.Task] = None
+        self.heavy_hitter_refreshes = 0
+        self.heavy_hitter_failed_refreshes = 0
+        self.heavy_hitter_deferred = 0
+        # Processed addresses seen in new blocks are refreshed once per window by a separate task
+        self.refresh_scheduler = (
+            RefreshScheduler() if REFRESH_SCHEDULER_ENABLED else None
+        )
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Height of the latest block, the deferred refreshes fetch the addresses up to it
+        self.latest_block_height: Optional[int] = None
+        self.last_processed_block_height: Optional[int] = None
         self._running = False
 
     async def start(self) -> None:
@@ -59,6 +135,24 @@ class BlockProcessingWorker:
         """
         logger.info("Starting block processing worker")
         self._running = True
+        if self.known_addresses is not None:
+            try:
+                await asyncio.to_thread(self.known_addresses.load)
+            except Exception as e:
+                logger.error(f"Error loading the known address filter, disabling it: {e}")
+                self.known_addresses = None
+        if self.heavy_hitters is not None:
+            self._heavy_hitter_task = asyncio.create_task(self.refresh_heavy_hitters())
+        if self.refresh_scheduler is not None:
+            try:
+                dirty_addresses = await asyncio.to_thread(
+                    get_dirty_addresses, self.mongo_client
+                )
+                self.refresh_scheduler.restore(dirty_addresses)
+                logger.info(f"Restored {len(dirty_addresses)} dirty addresses")
+            except Exception as e:
+                logger.error(f"Error restoring the dirty addresses: {e}")
+            self._refresh_task = asyncio.create_task(self.refresh_dirty_addresses())
         while self._running:
             try:
                 latest_block_height = await get_latest_block_height(self.api_worker)
@@ -66,6 +160,7 @@ class BlockProcessingWorker:
                     logger.error("Error fetching latest block height, retrying...")
                     await asyncio.sleep(1)
                     continue
+                self.latest_block_height = latest_block_height
 
                 last_processed_block_height = get_last_processed_block_height(
                     self.mongo_client
@@ -76,8 +171,18 @@ class BlockProcessingWorker:
                     )
                     await asyncio.sleep(1)
                     continue
+                self.last_processed_block_height = last_processed_block_height
 
                 while last_processed_block_height < latest_block_height:
+                    if (
+                        self.bulk_writer is not None
+                        and latest_block_height - last_processed_block_height
+                        <= BULK_IMPORT_TIP_DISTANCE
+                    ):
+                        if not await asyncio.to_thread(self.finish_bulk_import):
+                            self._running = False
+                            return
+
                     block_height = last_processed_block_height + 1
                     block_hash = await get_block_hash(self.api_worker, block_height)
                     if block_hash is None:
@@ -90,25 +195,22 @@ class BlockProcessingWorker:
                         f"Processing block {block_height} with hash {block_hash}"
                     )
 
-                    start_block_idx = 0
-                    block_transactions = await get_block_transactions(
-                        self.api_worker, block_hash, start_block_idx
-                    )
-                    while (
-                        block_transactions is not None and len(block_transactions) != 0
-                    ):
-                        # * Don't strictly need to await here, but would need to be careful about concurrent access
-                        # * to the DB
-                        await self.process_block_transactions(
-                            block_transactions,
-                            last_processed_block_height,
-                            latest_block_height,
+                    if self.tx_index is None:
+                        block_transactions = await self.process_block_pages(
+                            block_hash, last_processed_block_height, latest_block_height
                         )
-
-                        start_block_idx += 25
-                        block_transactions = await get_block_transactions(
-                            self.api_worker, block_hash, start_block_idx
+                    else:
+                        # The whole block is ingested before its addresses are processed, so the
+                        # index covers the addresses up to this block
+                        block_transactions = await self.ingest_block(
+                            block_height, block_hash
                         )
+                        if block_transactions is not None:
+                            await self.process_block_transactions(
+                                block_transactions,
+                                last_processed_block_height,
+                                latest_block_height,
+                            )
 
                     if block_transactions is None:
                         logger.error(
@@ -117,9 +219,17 @@ class BlockProcessingWorker:
                         await asyncio.sleep(1)
                         continue
 
-                    set_last_processed_block_height(self.mongo_client, block_height)
+                    if self.bulk_writer is not None:
+                        # Persisted with the shard holding the wallets of the block
+                        self.bulk_writer.complete_block(block_height)
+                    else:
+                        set_last_processed_block_height(self.mongo_client, block_height)
 
                     last_processed_block_height = block_height
+                    self.last_processed_block_height = block_height
+
+                    if self.known_addresses is not None:
+                        await self.sync_known_addresses()
 
                 latest_blocks = await get_latest_blocks(self.api_worker)
                 if latest_blocks is None:
@@ -152,6 +262,178 @@ class BlockProcessingWorker:
         """
         logger.info("Stopping block processing worker")
         self._running = False
+        if self._heavy_hitter_task is not None:
+            self._heavy_hitter_task.cancel()
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        if self.bulk_writer is not None:
+            # Keep the buffered wallets, the shards are picked up again on restart
+            self.bulk_writer.flush()
+        if self.tx_index is not None:
+            self.tx_index.close()
+        if self.known_addresses is not None and self.known_addresses.is_loaded:
+            self.known_addresses.save()
+
+    async def sync_known_addresses(self) -> None:
+        """
+        Add the addresses processed outside of the block worker to the known address filter, and
+        snapshot it if the last snapshot is old enough.
+        """
+        await asyncio.to_thread(self.known_addresses.catch_up)
+        if (
+            monotonic() - self._known_addresses_saved_at
+            >= KNOWN_ADDRESS_FILTER_SNAPSHOT_INTERVAL_S
+        ):
+            await asyncio.to_thread(self.known_addresses.save)
+            self._known_addresses_saved_at = monotonic()
+
+    async def process_block_pages(
+        self,
+        block_hash: str,
+        last_processed_block_height: int,
+        latest_block_height: int,
+    ) -> Optional[List[Transaction]]:
+        """
+        Fetch and process the transactions of a block one page at a time.
+
+        Parameters:
+        - block_hash: The hash of the block
+        - last_processed_block_height: The height of the last processed block
+        - latest_block_height: The height of the latest block
+
+        Returns:
+        - The last page fetched, empty once the whole block is processed, None on error
+        """
+        start_block_idx = 0
+        block_transactions = await get_block_transactions(
+            self.api_worker, block_hash, start_block_idx
+        )
+        while block_transactions is not None and len(block_transactions) != 0:
+            # * Don't strictly need to await here, but would need to be careful about concurrent access
+            # * to the DB
+            await self.process_block_transactions(
+                block_transactions,
+                last_processed_block_height,
+                latest_block_height,
+            )
+
+            start_block_idx += 25
+            block_transactions = await get_block_transactions(
+                self.api_worker, block_hash, start_block_idx
+            )
+        return block_transactions
+
+    async def ingest_block(
+        self, block_height: int, block_hash: str
+    ) -> Optional[List[Transaction]]:
+        """
+        Fetch all the transactions of a block and ingest them into the transaction index.
+
+        Parameters:
+        - block_height: The height of the block
+        - block_hash: The hash of the block
+
+        Returns:
+        - The transactions of the block, None on error
+        """
+        block_transactions = []
+        start_block_idx = 0
+        while True:
+            page_transactions = await get_block_transactions(
+                self.api_worker, block_hash, start_block_idx
+            )
+            if page_transactions is None:
+                return None
+            if len(page_transactions) == 0:
+                break
+            block_transactions.extend(page_transactions)
+            start_block_idx += 25
+
+        await asyncio.to_thread(
+            self.tx_index.ingest_block, block_height, block_transactions
+        )
+        return block_transactions
+
+    async def get_address_data(
+        self, address: str, latest_block_height: int
+    ) -> Optional[BitcoinAddressQueryResponse]:
+        """
+        Get the history of an address, rebuilt from the transaction index if it covers the address
+        or fetched from the Blockstream API otherwise.
+
+        Parameters:
+        - address: The address
+        - latest_block_height: The height of the latest block
+
+        Returns:
+        - The address data, None on error
+        """
+        if self.tx_index is None:
+            return await get_address_data(
+                self.api_worker, address, mongo_client=self.mongo_client
+            )
+
+        address_data = await asyncio.to_thread(
+            self.tx_index.get_address_data, address, MAXIMUM_TRANSACTIONS
+        )
+        if address_data is not None:
+            return address_data
+
+        address_data = await get_address_data(
+            self.api_worker, address, mongo_client=self.mongo_client
+        )
+        if address_data is not None and address_data.sample_segments is None:
+            # The history is complete up to the tip the API was at, later blocks are ingested
+            await asyncio.to_thread(
+                self.tx_index.ingest_address_history,
+                address,
+                address_data.transactions,
+                latest_block_height,
+            )
+        return address_data
+
+    def checkpoint_bulk_import(
+        self, processed_addresses: Dict[str, int], block_height: Optional[int]
+    ) -> None:
+        """
+        Persist the progress of the bulk import once a shard is on disk, so a crash only reprocesses
+        the blocks whose wallets were still buffered.
+
+        Parameters:
+        - processed_addresses: The addresses written to the shard, with the height they were processed up to
+        - block_height: The height of the last block whose wallets are all written
+        """
+        set_addresses_last_processed_block_height(self.mongo_client, processed_addresses)
+        if self.known_addresses is not None:
+            for address in processed_addresses:
+                self.known_addresses.add(address)
+        if block_height is not None:
+            set_last_processed_block_height(self.mongo_client, block_height)
+
+    def finish_bulk_import(self) -> bool:
+        """
+        Merge the bulk import shards, load them into Neo4j and switch to merging wallets one by one.
+
+        With BULK_IMPORT_NEO4J_ADMIN and an empty store, the merged files are left for neo4j-admin
+        instead, which needs the database stopped, and the worker must stop until they are imported.
+
+        Returns:
+        - Whether the import was loaded and the worker can go on
+        """
+        logger.info("Close to the chain tip, loading the bulk import into Neo4j")
+        self.bulk_writer.merge_shards()
+        if BULK_IMPORT_NEO4J_ADMIN and is_graph_empty(self.neo4j_driver):
+            logger.warning(
+                "The graph is empty, stopping the block processing worker for the bulk import. "
+                "Stop Neo4j, run the command below where the merged files are visible, then "
+                "restart Neo4j and the worker: "
+                + " ".join(neo4j_admin_import_command(self.bulk_writer.directory))
+            )
+            return False
+        load_with_cypher(self.neo4j_driver)
+        self.bulk_writer.remove_merged_files()
+        self.bulk_writer = None
+        return True
 
     async def process_block_transactions(
         self,
@@ -184,33 +466,209 @@ class BlockProcessingWorker:
                 if tx_output.scriptpubkey_address:
                     unique_addresses.add(tx_output.scriptpubkey_address)
 
-        # Process each unique address
+        if self.heavy_hitters is not None:
+            self.heavy_hitters.observe(last_processed_block_height + 1, unique_addresses)
+
+        # Process each unique address. In bulk mode every address is written to the shards with
+        # its block, the refreshes could not write until the bulk import is loaded
+        bulk = self.bulk_writer is not None
+        dirty_addresses = []
         for address in unique_addresses:
-            response = None
-            address_last_processed_block_height = (
-                get_address_last_processed_block_height(self.mongo_client, address)
-            )
+            if (
+                not bulk
+                and self.heavy_hitters is not None
+                and self.heavy_hitters.is_heavy(address)
+            ):
+                # Refreshed by the heavy hitter task, so the block is not held up by it
+                self.schedule_heavy_hitter_refresh(address, latest_block_height)
+                continue
+
+            if (
+                not bulk
+                and self.refresh_scheduler is not None
+                and address in self.refresh_scheduler
+            ):
+                dirty_addresses.append(address)  # Already waiting for a refresh
+                continue
+
+            if self.known_addresses is not None and not self.known_addresses.might_contain(
+                address
+            ):
+                address_last_processed_block_height = ADDRESS_NEVER_PROCESSED
+            else:
+                address_last_processed_block_height = (
+                    get_address_last_processed_block_height(self.mongo_client, address)
+                )
+                if (
+                    self.known_addresses is not None
+                    and address_last_processed_block_height == ADDRESS_NEVER_PROCESSED
+                ):
+                    self.known_addresses.record_false_positive()
             if address_last_processed_block_height >= last_processed_block_height:
                 continue  # This address has already been processed for this block
 
-            response = await get_address_data(self.api_worker, address)
-            if response is None:
-                logger.error(f"Error fetching data for address {address}")
-                continue
+            if not bulk and self.refresh_scheduler is not None:
+                if address_last_processed_block_height != ADDRESS_NEVER_PROCESSED:
+                    # Refreshed by the refresh task once its window is over
+                    dirty_addresses.append(address)
+                    continue
+                self.refresh_scheduler.immediate += 1
+
+            await self.process_address(address, latest_block_height)
+
+        if self.refresh_scheduler is not None:
+            newly_dirty = self.refresh_scheduler.mark_dirty(
+                dirty_addresses, last_processed_block_height + 1
+            )
+            await asyncio.to_thread(
+                mark_addresses_dirty,
+                self.mongo_client,
+                newly_dirty,
+                last_processed_block_height + 1,
+            )
+
+    async def process_address(self, address: str, latest_block_height: int) -> bool:
+        """
+        Fetch, score and store an address.
 
-            # Update the MongoDB databaseM
+        Parameters:
+        - address: The address
+        - latest_block_height: The height of the latest block
+
+        Returns:
+        - Whether the address was processed
+        """
+        response = await self.get_address_data(address, latest_block_height)
+        if response is None:
+            logger.error(f"Error fetching data for address {address}")
+            return False
+
+        # Update the MongoDB database, in bulk mode once the wallet is written to a shard
+        if self.bulk_writer is None:
             set_address_last_processed_block_height(
                 self.mongo_client, address, latest_block_height
             )
+            if self.known_addresses is not None:
+                self.known_addresses.add(address)
 
-            # Update in Neo4j
-            wallet_data, connected_wallets = convert_to_wallet_data(response)
+        # Update in Neo4j
+        wallet_data, connected_wallets = convert_to_wallet_data(response)
 
-            # Compute the inference for the wallet data
-            wallet_data = infer_wallet_data_class(self.ml_session, wallet_data)
+        # Compute the inference for the wallet data
+        wallet_data = infer_wallet_data_class(self.ml_session, wallet_data)
 
-            # Add or update the wallet data and connected wallets to the database
+        # Add or update the wallet data and connected wallets to the database
+        if self.bulk_writer is not None:
+            edge_connections, full_connections = split_hub_connections(
+                connected_wallets
+            )
+            store_hub_connections(self.mongo_client, address, full_connections)
+            self.bulk_writer.add_wallet(wallet_data, edge_connections.summary)
+            self.bulk_writer.add_connected_wallets(address, edge_connections)
+            self.bulk_writer.add_processed_address(address, latest_block_height)
+        else:
             upsert_wallet_data_in_db(self.neo4j_driver, wallet_data)
-            upsert_connected_wallets_in_db(
-                self.neo4j_driver, address, connected_wallets
+            store_connected_wallets(
+                self.neo4j_driver, self.mongo_client, address, connected_wallets
             )
+            add_wallet_changes(self.mongo_client, [address])
+
+        if self.event_bus is not None:
+            self.event_bus.publish_wallet_scored(wallet_data)
+        return True
+
+    def schedule_heavy_hitter_refresh(
+        self, address: str, latest_block_height: int
+    ) -> None:
+        """
+        Queue a refresh of a heavy hitter, unless it was refreshed in the last
+        HEAVY_HITTER_REFRESH_BLOCKS blocks or is already queued.
+
+        Parameters:
+        - address: The address of the heavy hitter
+        - latest_block_height: The height of the latest block
+        """
+        if latest_block_height < self._heavy_hitter_refresh_due.get(address, 0):
+            self.heavy_hitter_deferred += 1
+            return
+        self._heavy_hitter_refresh_due[address] = (
+            latest_block_height + HEAVY_HITTER_REFRESH_BLOCKS
+        )
+        self._heavy_hitter_queue.put_nowait((address, latest_block_height))
+
+        # Forget the addresses that are due again, they are rescheduled if still heavy hitters
+        if len(self._heavy_hitter_refresh_due) > 2 * self.heavy_hitters.capacity:
+            self._heavy_hitter_refresh_due = {
+                due_address: due_height
+                for due_address, due_height in self._heavy_hitter_refresh_due.items()
+                if due_height > latest_block_height
+            }
+
+    async def refresh_heavy_hitters(self) -> None:
+        """
+        Refresh the queued heavy hitters one at a time, alongside the block processing.
+        """
+        while True:
+            # Nothing is queued in bulk mode, see process_block_transactions
+            address, latest_block_height = await self._heavy_hitter_queue.get()
+            try:
+                if await self.process_address(address, latest_block_height):
+                    self.heavy_hitter_refreshes += 1
+                else:
+                    self.heavy_hitter_failed_refreshes += 1
+            except Exception as e:
+                logger.error(f"Error refreshing heavy hitter {address}: {e}")
+                self.heavy_hitter_failed_refreshes += 1
+
+    async def refresh_dirty_addresses(self) -> None:
+        """
+        Refresh the dirty addresses whose window is over one at a time, alongside the block
+        processing. Addresses refreshed meanwhile, e.g. by an interactive request, are skipped.
+        """
+        while True:
+            await asyncio.sleep(REFRESH_SCHEDULER_POLL_S)
+            # The addresses restored on start wait in the scheduler until the bulk import is
+            # loaded, writing to the shards while they are loaded would lose the wallet
+            if self.latest_block_height is None or self.bulk_writer is not None:
+                continue
+            for address, dirty_since_height in self.refresh_scheduler.take_due(
+                self.latest_block_height
+            ):
+                try:
+                    address_last_processed_block_height = await asyncio.to_thread(
+                        get_address_last_processed_block_height,
+                        self.mongo_client,
+                        address,
+                    )
+                    if address_last_processed_block_height >= dirty_since_height:
+                        # Processed without going through the scheduler, which left the mark
+                        await asyncio.to_thread(
+                            clear_address_dirty,
+                            self.mongo_client,
+                            address,
+                            dirty_since_height,
+                        )
+                        self.refresh_scheduler.already_fresh += 1
+                        continue
+                    if await self.process_address(address, self.latest_block_height):
+                        self.refresh_scheduler.refreshed += 1
+                        continue
+                except Exception as e:
+                    logger.error(f"Error refreshing dirty address {address}: {e}")
+                # Retried once the window is over again
+                self.refresh_scheduler.failed_refreshes += 1
+                self.refresh_scheduler.restore([(address, self.latest_block_height)])
+
+    def heavy_hitter_stats(self) -> HeavyHitterStats:
+        """
+        Get the counters of the heavy hitter refresh policy.
+        """
+        return HeavyHitterStats(
+            blocks_observed=self.heavy_hitters.blocks_observed,
+            tracked=self.heavy_hitters.tracked,
+            heavy_hitters=self.heavy_hitters.heavy_hitters(),
+            refreshes=self.heavy_hitter_refreshes,
+            failed_refreshes=self.heavy_hitter_failed_refreshes,
+            deferred=self.heavy_hitter_deferred,
+            queued=self._heavy_hitter_queue.qsize(),
+        )
@@ -0,0 +1,155 @@
+import heapq
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from src.config import (
+    HEAVY_HITTER_CAPACITY,
+    HEAVY_HITTER_MIN_BLOCKS,
+    HEAVY_HITTER_MIN_SHARE,
+    HEAVY_HITTER_WINDOW_BLOCKS,
+)
+from src.models import HeavyHitter
+
+# Decayed counts are scaled back down before the occurrence weight overflows
+_MAXIMUM_WEIGHT = 1e100
+
+
+class HeavyHitterTracker:
+    """
+    Tracks the addresses seen in the largest share of the recent blocks with a Space-Saving sketch:
+    capacity addresses are monitored, and an address seen for the first time replaces the monitored
+    address with the lowest count, inheriting its count as the error bound. An address is only
+    guaranteed to stay monitored if it is seen in more than a 1 / capacity share of all the address
+    occurrences, so the capacity must exceed the number of addresses per block divided by min_share.
+
+    Counts decay exponentially with the age of the blocks, an occurrence window_blocks blocks ago
+    weighs about a third of an occurrence in the current block. The decay is applied by growing the
+    weight of new occurrences instead of shrinking the existing counts.
+    """
+
+    def __init__(
+        self,
+        capacity: int = HEAVY_HITTER_CAPACITY,
+        window_blocks: int = HEAVY_HITTER_WINDOW_BLOCKS,
+        min_share: float = HEAVY_HITTER_MIN_SHARE,
+        min_blocks: int = HEAVY_HITTER_MIN_BLOCKS,
+    ) -> None:
+        """
+        Initialize an empty tracker.
+
+        Parameters:
+        - capacity: The number of monitored addresses
+        - window_blocks: The number of blocks over which the counts decay by a factor e
+        - min_share: The share of the recent blocks an address must be seen in to be a heavy hitter
+        - min_blocks: The number of blocks to observe before any address is a heavy hitter
+        """
+        self.capacity = capacity
+        self.min_share = min_share
+        self.min_blocks = min_blocks
+        self._decay = 1 - 1 / window_blocks
+        # Weight of an occurrence in the current block, and decayed number of blocks observed
+        self._weight = 1.0
+        self._total = 0.0
+        # Monitored addresses with their count and the error bound of the count
+        self._counts: Dict[str, List[float]] = {}
+        # Min-heap of (count, address), entries are stale once the count of the address changed
+        self._heap: List[Tuple[float, str]] = []
+        self._block_height: Optional[int] = None
+        self._block_addresses: Set[str] = set()
+        self.blocks_observed = 0
+
+    def observe(self, block_height: int, addresses: Iterable[str]) -> None:
+        """
+        Count the addresses seen in a block. A block can be observed in several parts, an address
+        is counted once per block.
+
+        Parameters:
+        - block_height: The height of the block
+        - addresses: The addresses seen in the block
+        """
+        if block_height != self._block_height:
+            if self._block_height is not None:
+                self._weight /= self._decay
+            self._total += self._weight
+            self._block_height = block_height
+            self._block_addresses = set()
+            self.blocks_observed += 1
+            if self._weight > _MAXIMUM_WEIGHT:
+                self._rescale()
+
+        for address in addresses:
+            if address in self._block_addresses:
+                continue
+            self._block_addresses.add(address)
+            self._increment(address)
+
+    def _increment(self, address: str) -> None:
+        entry = self._counts.get(address)
+        if entry is not None:
+            entry[0] += self._weight
+        elif len(self._counts) < self.capacity:
+            entry = self._counts[address] = [self._weight, 0.0]
+        else:
+            # Replace the monitored address with the lowest count
+            while True:
+                count, victim = heapq.heappop(self._heap)
+                victim_entry = self._counts.get(victim)
+                if victim_entry is not None and victim_entry[0] == count:
+                    break
+            del self._counts[victim]
+            entry = self._counts[address] = [count + self._weight, count]
+        heapq.heappush(self._heap, (entry[0], address))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self) -> None:
+        self._heap = [(entry[0], address) for address, entry in self._counts.items()]
+        heapq.heapify(self._heap)
+
+    def _rescale(self) -> None:
+        for entry in self._counts.values():
+            entry[0] /= self._weight
+            entry[1] /= self._weight
+        self._total /= self._weight
+        self._weight = 1.0
+        self._rebuild_heap()
+
+    @property
+    def tracked(self) -> int:
+        return len(self._counts)
+
+    def share(self, address: str) -> float:
+        """
+        Get a lower bound of the decayed share of the recent blocks an address was seen in.
+
+        Parameters:
+        - address: The address
+        """
+        entry = self._counts.get(address)
+        if entry is None or self._total == 0:
+            return 0.0
+        return (entry[0] - entry[1]) / self._total
+
+    def is_heavy(self, address: str) -> bool:
+        """
+        Check if an address is a heavy hitter.
+
+        Parameters:
+        - address: The address
+        """
+        return (
+            self.blocks_observed >= self.min_blocks
+            and self.share(address) >= self.min_share
+        )
+
+    def heavy_hitters(self) -> List[HeavyHitter]:
+        """
+        Get the heavy hitters, largest share first.
+        """
+        if self.blocks_observed < self.min_blocks:
+            return []
+        shares = [(self.share(address), address) for address in self._counts]
+        return [
+            HeavyHitter(address=address, share=share)
+            for share, address in sorted(shares, reverse=True)
+            if share >= self.min_share
+        ]
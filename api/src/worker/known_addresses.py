@@ -0,0 +1,208 @@
+import logging
+import os
+import struct
+import threading
+from time import time
+from typing import Optional, Tuple
+
+from pymongo import MongoClient
+
+from src.config import (
+    KNOWN_ADDRESS_FILTER_CAPACITY,
+    KNOWN_ADDRESS_FILTER_ERROR_RATE,
+    KNOWN_ADDRESS_FILTER_PATH,
+)
+from src.db.mongodb import count_processed_addresses, iter_processed_addresses
+from src.models import KnownAddressFilterStats
+from src.shared.bloom_filter import BloomFilter
+
+# Time the snapshot was caught up to, followed by the serialized filter
+_SNAPSHOT_HEADER = struct.Struct("<d")
+# Addresses processed slightly before the last catch up are read again, to cover writes that were
+# in flight or made by another process with a skewed clock
+CATCH_UP_MARGIN_S = 60
+
+logger = logging.getLogger(__name__)
+
+
+class KnownAddresses:
+    """
+    A Bloom filter of the addresses in the MongoDB addresses collection. An address the filter does
+    not contain has never been processed, so its last processed block height is not looked up.
+
+    The block worker adds the addresses it processes itself, the addresses processed elsewhere (e.g.
+    by wallet refreshes) are picked up by catch_up from their updated_at timestamp. Until then, such
+    an address may be processed again, which is wasteful but not wrong.
+
+    Calls are serialized with a lock, so the filter can be loaded and saved from worker threads.
+    """
+
+    def __init__(
+        self,
+        mongo_client: MongoClient,
+        path: str = KNOWN_ADDRESS_FILTER_PATH,
+        capacity: int = KNOWN_ADDRESS_FILTER_CAPACITY,
+        error_rate: float = KNOWN_ADDRESS_FILTER_ERROR_RATE,
+    ) -> None:
+        """
+        Initialize the known addresses, load must be called before they are used.
+
+        Parameters:
+        - mongo_client: The MongoDB client instance
+        - path: The path of the snapshot file
+        - capacity: The minimum number of addresses the filter is sized for
+        - error_rate: The target false positive probability of the filter
+        """
+        self.mongo_client = mongo_client
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filter: Optional[BloomFilter] = None
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.definite_misses = 0
+        self.false_positives = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._filter is not None
+
+    def load(self) -> None:
+        """
+        Load the filter from its snapshot and catch up with the addresses processed since, or build
+        it from the addresses collection if there is no usable snapshot.
+        """
+        # Leave room for growth, a filter past its capacity has more false positives
+        capacity = max(self.capacity, 2 * count_processed_addresses(self.mongo_client))
+        bloom_filter, synced_at = self._read_snapshot()
+        if bloom_filter is not None and bloom_filter.capacity < capacity // 2:
+            logger.info("Known address filter snapshot is too small, rebuilding it")
+            bloom_filter = None
+
+        if bloom_filter is None:
+            bloom_filter = BloomFilter(capacity, self.error_rate)
+            synced_at = 0.0
+            with self._lock:
+                self._filter = bloom_filter
+                self._synced_at = synced_at
+            self._add_processed_addresses(None)
+            logger.info(
+                f"Built known address filter with {bloom_filter.num_items} addresses"
+            )
+        else:
+            with self._lock:
+                self._filter = bloom_filter
+                self._synced_at = synced_at
+            self.catch_up()
+            logger.info(
+                f"Loaded known address filter with {bloom_filter.num_items} addresses"
+            )
+
+    def catch_up(self) -> None:
+        """
+        Add the addresses processed since the last catch up.
+        """
+        self._add_processed_addresses(self._synced_at - CATCH_UP_MARGIN_S)
+
+    def _add_processed_addresses(self, updated_since: Optional[float]) -> None:
+        """
+        Add the processed addresses to the filter, streamed from the database.
+
+        Parameters:
+        - updated_since: If set, only the addresses processed at or after this unix timestamp
+        """
+        synced_at = time()
+        for address in iter_processed_addresses(self.mongo_client, updated_since):
+            with self._lock:
+                self._filter.add(address)
+        with self._lock:
+            self._synced_at = synced_at
+
+    def add(self, address: str) -> None:
+        """
+        Add a processed address.
+
+        Parameters:
+        - address: The address
+        """
+        with self._lock:
+            self._filter.add(address)
+
+    def might_contain(self, address: str) -> bool:
+        """
+        Check if an address may have been processed.
+
+        Parameters:
+        - address: The address
+
+        Returns:
+        - False if the address has definitely never been processed
+        """
+        self.lookups += 1
+        with self._lock:
+            contained = address in self._filter
+        if not contained:
+            self.definite_misses += 1
+        return contained
+
+    def record_false_positive(self) -> None:
+        """
+        Record that an address the filter let through had never been processed.
+        """
+        self.false_positives += 1
+
+    def save(self) -> None:
+        """
+        Write a snapshot of the filter, replacing the previous one atomically.
+        """
+        with self._lock:
+            data = _SNAPSHOT_HEADER.pack(self._synced_at) + self._filter.to_bytes()
+        try:
+            with open(self.path + ".tmp", "wb") as file:
+                file.write(data)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError as e:
+            logger.error(f"Error saving the known address filter snapshot: {e}")
+
+    def _read_snapshot(self) -> Tuple[Optional[BloomFilter], float]:
+        """
+        Read the snapshot of the filter.
+
+        Returns:
+        - The filter and the time it was caught up to, None and 0 if there is no usable snapshot
+        """
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+            (synced_at,) = _SNAPSHOT_HEADER.unpack_from(data)
+            return BloomFilter.from_bytes(data[_SNAPSHOT_HEADER.size :]), synced_at
+        except FileNotFoundError:
+            return None, 0.0
+        except (OSError, ValueError, struct.error) as e:
+            logger.error(f"Ignoring unreadable known address filter snapshot: {e}")
+            return None, 0.0
+
+    def stats(self) -> KnownAddressFilterStats:
+        """
+        Get the filter counters.
+        """
+        with self._lock:
+            bloom_filter = self._filter
+            stats = dict(
+                items=bloom_filter.num_items,
+                capacity=bloom_filter.capacity,
+                memory_bytes=bloom_filter.memory_bytes,
+                estimated_false_positive_rate=bloom_filter.estimated_false_positive_rate(),
+            )
+        never_processed = self.definite_misses + self.false_positives
+        return KnownAddressFilterStats(
+            **stats,
+            lookups=self.lookups,
+            definite_misses=self.definite_misses,
+            false_positives=self.false_positives,
+            observed_false_positive_rate=(
+                self.false_positives / never_processed if never_processed else None
+            ),
+        )
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from time import time
+from typing import Dict, List, Optional
+
+from neo4j import Driver
+from pymongo import MongoClient
+
+from src.config import (
+    PREFETCH_HIT_WINDOW_S,
+    PREFETCH_MAX_ROOTS,
+    PREFETCH_NEIGHBORS,
+    PREFETCH_PAUSE_S,
+)
+from src.db.mongodb import count_prefetch_hits, set_wallet_prefetched_at
+from src.db.neo4j import get_wallet_data_batch_from_db, get_wallet_version_from_db
+from src.extern.api_worker import BlockstreamAPIWorker
+from src.models import ConnectedWallets, PrefetchStats
+from src.shared.event_bus import EventBus
+from src.shared.ml_session import MLSession
+from src.shared.single_flight import SingleFlight
+from src.worker.block_processing_worker import BlockProcessingWorker
+from src.worker.wallet_refresh import fetch_score_and_store_wallet, is_upstream_busy
+
+logger = logging.getLogger(__name__)
+
+
+def top_neighbors(connected_wallets: ConnectedWallets, limit: int) -> List[str]:
+    """
+    Get the counterparties of a wallet with the largest amounts transacted, both directions added up.
+
+    Parameters:
+    - connected_wallets: The connected wallets of the wallet
+    - limit: The maximum number of counterparties
+
+    Returns:
+    - The addresses of the counterparties, largest amount first
+    """
+    amounts: Dict[str, float] = {}
+    for connections in (
+        connected_wallets.inbound_connections,
+        connected_wallets.outbound_connections,
+    ):
+        for address, details in connections.items():
+            amounts[address] = amounts.get(address, 0.0) + details.amount_transacted
+    amounts.pop(connected_wallets.wallet_address, None)
+    return sorted(amounts, key=amounts.get, reverse=True)[:limit]
+
+
+class NeighborPrefetcher:
+    """
+    Prefetches the stub neighbors of the wallets fetched interactively, which analysts usually
+    expand next, so their lookups are served from the database.
+
+    Neighbors are prefetched one at a time through the wallet single flight, only while no other
+    upstream traffic is waiting, and joined by an interactive lookup of the same wallet. Analysts
+    move on, so only the prefetches of the PREFETCH_MAX_ROOTS most recent wallets are kept queued.
+    """
+
+    def __init__(
+        self,
+        mongo_client: MongoClient,
+        neo4j_driver: Driver,
+        api_worker: BlockstreamAPIWorker,
+        ml_session: MLSession,
+        wallet_single_flight: SingleFlight,
+        block_processing_worker: BlockProcessingWorker,
+        event_bus: Optional[EventBus] = None,
+    ) -> None:
+        """
+        Initialize the prefetcher.
+
+        Parameters:
+        - mongo_client: The MongoDB client instance
+        - neo4j_driver: The Neo4j driver instance
+        - api_worker: The API worker instance
+        - ml_session: The machine learning session instance
+        - wallet_single_flight: The single flight group coalescing refreshes of the same wallet
+        - block_processing_worker: The block processing worker, the prefetches wait for its blocks
+        - event_bus: The event bus to publish the scored wallets to
+        """
+        self.mongo_client = mongo_client
+        self.neo4j_driver = neo4j_driver
+        self.api_worker = api_worker
+        self.ml_session = ml_session
+        self.wallet_single_flight = wallet_single_flight
+        self.block_processing_worker = block_processing_worker
+        self.event_bus = event_bus
+        # Neighbors waiting to be prefetched, oldest first, with the wallet they were queued for
+        self._queue: OrderedDict[str, str] = OrderedDict()
+        # Wallets the queued neighbors were queued for, least recent first
+        self._roots: OrderedDict[str, None] = OrderedDict()
+        self._wake_up = asyncio.Event()
+        self._running = False
+
+        self.scheduled = 0
+        self.prefetched = 0
+        self.already_populated = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    async def start(self) -> None:
+        """
+        Start prefetching the queued neighbors.
+        """
+        logger.info("Starting neighbor prefetch")
+        self._running = True
+        while self._running:
+            if not self._queue:
+                self._wake_up.clear()
+                await self._wake_up.wait()
+                continue
+            if is_upstream_busy(
+                self.api_worker, self.wallet_single_flight, self.block_processing_worker
+            ):
+                await asyncio.sleep(PREFETCH_PAUSE_S)
+                continue
+
+            address, _ = self._queue.popitem(last=False)
+            try:
+                await self.prefetch(address)
+            except Exception as e:
+                logger.error(f"Error prefetching wallet {address}: {e}")
+                self.failed += 1
+
+    def stop(self) -> None:
+        """
+        Stop prefetching, the queued neighbors are dropped.
+        """
+        logger.info("Stopping neighbor prefetch")
+        self._running = False
+        self._wake_up.set()
+
+    async def schedule(
+        self, root_address: str, connected_wallets: ConnectedWallets
+    ) -> None:
+        """
+        Queue the prefetch of the top stub neighbors of a wallet fetched interactively, and cancel
+        the queued prefetches of the wallets fetched before the PREFETCH_MAX_ROOTS most recent ones.
+
+        Parameters:
+        - root_address: The address of the wallet fetched interactively
+        - connected_wallets: The connected wallets of the wallet
+        """
+        neighbors = top_neighbors(connected_wallets, PREFETCH_NEIGHBORS)
+        if not neighbors:
+            return
+        # pymongo and the Neo4j driver are blocking, keep them off the event loop
+        known_wallets = await asyncio.to_thread(
+            get_wallet_data_batch_from_db, self.neo4j_driver, neighbors, len(neighbors)
+        )
+        stubs = [
+            address
+            for address in neighbors
+            if address not in known_wallets or not known_wallets[address].is_populated
+        ]
+        if not stubs:
+            return
+
+        self._roots[root_address] = None
+        self._roots.move_to_end(root_address)
+        for address in stubs:
+            if address not in self._queue:
+                self.scheduled += 1
+            self._queue[address] = root_address
+        while len(self._roots) > PREFETCH_MAX_ROOTS:
+            stale_root, _ = self._roots.popitem(last=False)
+            self.cancel(stale_root)
+        self._wake_up.set()
+
+    def cancel(self, root_address: str) -> int:
+        """
+        Drop the queued prefetches of the neighbors of a wallet. A prefetch already running goes on,
+        an interactive lookup may be waiting on it.
+
+        Parameters:
+        - root_address: The address of the wallet the neighbors were queued for
+
+        Returns:
+        - The number of prefetches dropped
+        """
+        self._roots.pop(root_address, None)
+        addresses = [
+            address for address, root in self._queue.items() if root == root_address
+        ]
+        for address in addresses:
+            del self._queue[address]
+        self.cancelled += len(addresses)
+        return len(addresses)
+
+    async def prefetch(self, address: str) -> None:
+        """
+        Fetch, score and store a neighbor unless it was populated meanwhile, and record the time of
+        the prefetch for the hit rate.
+
+        Parameters:
+        - address: The address of the neighbor
+        """
+        wallet_version = await asyncio.to_thread(
+            get_wallet_version_from_db, self.neo4j_driver, address
+        )
+        if wallet_version is not None and wallet_version.is_populated:
+            self.already_populated += 1
+            return
+
+        wallet_data, connected_wallets = await self.wallet_single_flight.do(
+            address,
+            lambda: fetch_score_and_store_wallet(
+                self.api_worker,
+                self.mongo_client,
+                self.neo4j_driver,
+                self.ml_session,
+                address,
+                event_bus=self.event_bus,
+            ),
+        )
+        if wallet_data is None or connected_wallets is None:
+            self.failed += 1
+            return
+        self.prefetched += 1
+        await asyncio.to_thread(
+            set_wallet_prefetched_at, self.mongo_client, address, time()
+        )
+
+    def stats(self) -> PrefetchStats:
+        """
+        Get the prefetch counters, with the hit rate of the prefetches within PREFETCH_HIT_WINDOW_S.
+        """
+        recent_prefetches, recent_hits = count_prefetch_hits(
+            self.mongo_client, time() - PREFETCH_HIT_WINDOW_S
+        )
+        return PrefetchStats(
+            scheduled=self.scheduled,
+            prefetched=self.prefetched,
+            already_populated=self.already_populated,
+            cancelled=self.cancelled,
+            failed=self.failed,
+            queued=len(self._queue),
+            recent_prefetches=recent_prefetches,
+            recent_hits=recent_hits,
+            hit_rate=recent_hits / recent_prefetches if recent_prefetches else None,
+        )
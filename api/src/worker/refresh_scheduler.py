@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Iterable, List, Tuple
+
+from src.config import REFRESH_WINDOW_BLOCKS, REFRESH_WINDOW_S
+from src.models import RefreshSchedulerStats
+
+
+class RefreshScheduler:
+    """
+    The set of already scored addresses that appeared in new blocks and are waiting to be refreshed.
+    An address is refreshed once window_blocks blocks or window_s seconds after it first became dirty,
+    however many blocks it appears in meanwhile.
+
+    Only used from the event loop, so no locking is needed.
+    """
+
+    def __init__(
+        self, window_blocks: int = REFRESH_WINDOW_BLOCKS, window_s: float = REFRESH_WINDOW_S
+    ) -> None:
+        """
+        Initialize an empty scheduler.
+
+        Parameters:
+        - window_blocks: The number of blocks an address stays dirty before it is refreshed
+        - window_s: The number of seconds an address stays dirty before it is refreshed
+        """
+        self.window_blocks = window_blocks
+        self.window_s = window_s
+        # Dirty addresses, oldest first, with the height of the block and the time they became dirty
+        self._dirty: OrderedDict[str, Tuple[int, float]] = OrderedDict()
+
+        self.marked = 0
+        self.coalesced = 0
+        self.refreshed = 0
+        self.failed_refreshes = 0
+        self.already_fresh = 0
+        self.immediate = 0
+
+    def __len__(self) -> int:
+        return len(self._dirty)
+
+    def __contains__(self, address: str) -> bool:
+        return address in self._dirty
+
+    def mark_dirty(self, addresses: Iterable[str], block_height: int) -> List[str]:
+        """
+        Mark addresses seen in a block as dirty.
+
+        Parameters:
+        - addresses: The addresses
+        - block_height: The height of the block
+
+        Returns:
+        - The addresses that were not dirty yet
+        """
+        now = monotonic()
+        newly_dirty = []
+        for address in addresses:
+            self.marked += 1
+            if address in self._dirty:
+                # Covered by the refresh already scheduled, this is a refresh saved
+                self.coalesced += 1
+                continue
+            self._dirty[address] = (block_height, now)
+            newly_dirty.append(address)
+        return newly_dirty
+
+    def restore(self, entries: Iterable[Tuple[str, int]]) -> None:
+        """
+        Restore dirty addresses, e.g. the ones persisted before a restart or whose refresh failed.
+
+        Parameters:
+        - entries: The addresses with the height of the block they became dirty in, oldest first
+        """
+        now = monotonic()
+        for address, block_height in entries:
+            self._dirty.setdefault(address, (block_height, now))
+
+    def take_due(self, latest_block_height: int) -> List[Tuple[str, int]]:
+        """
+        Remove and return the addresses whose window is over.
+
+        Parameters:
+        - latest_block_height: The height of the latest processed block
+
+        Returns:
+        - The addresses with the height of the block they became dirty in, oldest first
+        """
+        now = monotonic()
+        due = []
+        while self._dirty:
+            address, (block_height, dirty_at) = next(iter(self._dirty.items()))
+            if (
+                latest_block_height - block_height < self.window_blocks
+                and now - dirty_at < self.window_s
+            ):
+                break
+            del self._dirty[address]
+            due.append((address, block_height))
+        return due
+
+    def stats(self) -> RefreshSchedulerStats:
+        """
+        Get the scheduler counters.
+        """
+        oldest_dirty_age_s = None
+        if self._dirty:
+            _, dirty_at = next(iter(self._dirty.values()))
+            oldest_dirty_age_s = monotonic() - dirty_at
+        return RefreshSchedulerStats(
+            dirty=len(self._dirty),
+            oldest_dirty_age_s=oldest_dirty_age_s,
+            marked=self.marked,
+            coalesced=self.coalesced,
+            refreshed=self.refreshed,
+            failed_refreshes=self.failed_refreshes,
+            already_fresh=self.already_fresh,
+            immediate=self.immediate,
+        )
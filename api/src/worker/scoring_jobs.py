@@ -0,0 +1,225 @@
+import asyncio
+import logging
+from math import ceil
+from time import time
+from typing import Dict, Optional
+from uuid import uuid4
+
+from neo4j import Driver
+from pymongo import MongoClient
+
+from src.config import BLOCKSTREAM_RATE_LIMIT_MS
+from src.db.mongodb import (
+    get_active_scoring_job,
+    get_active_scoring_jobs,
+    get_scoring_job,
+    insert_scoring_job,
+    update_scoring_job,
+)
+from src.extern.api_worker import BlockstreamAPIWorker
+from src.models import (
+    SCORING_JOB_DONE,
+    SCORING_JOB_FAILED,
+    SCORING_JOB_NOT_FOUND,
+    SCORING_JOB_PENDING,
+    SCORING_JOB_RUNNING,
+    ScoringJob,
+)
+from src.shared.event_bus import EventBus
+from src.shared.ml_session import MLSession
+from src.shared.single_flight import SingleFlight
+from src.worker.prefetch import NeighborPrefetcher
+from src.worker.wallet_refresh import fetch_score_and_store_wallet
+
+# Number of transactions per page of the Blockstream API
+TRANSACTIONS_PER_PAGE = 25
+
+logger = logging.getLogger(__name__)
+
+
+class ScoringJobManager:
+    """
+    Runs the jobs fetching, scoring and storing wallets in the background. Jobs are persisted in
+    MongoDB, so clients can poll them from any API instance and unfinished jobs are resumed when
+    the worker restarts.
+    """
+
+    def __init__(
+        self,
+        mongo_client: MongoClient,
+        api_worker: BlockstreamAPIWorker,
+        ml_session: MLSession,
+        neo4j_driver: Driver,
+        wallet_single_flight: SingleFlight,
+        event_bus: Optional[EventBus] = None,
+        neighbor_prefetcher: Optional[NeighborPrefetcher] = None,
+    ) -> None:
+        """
+        Initialize the scoring job manager.
+
+        Parameters:
+        - mongo_client: The MongoDB client instance
+        - api_worker: The API worker instance
+        - ml_session: The machine learning session instance
+        - neo4j_driver: The Neo4j driver instance
+        - wallet_single_flight: The single flight group coalescing refreshes of the same wallet
+        - event_bus: The event bus to publish the job progress and the scored wallets to
+        - neighbor_prefetcher: The prefetcher the neighbors of the scored wallets are queued on
+        """
+        self.mongo_client = mongo_client
+        self.api_worker = api_worker
+        self.ml_session = ml_session
+        self.neo4j_driver = neo4j_driver
+        self.wallet_single_flight = wallet_single_flight
+        self.event_bus = event_bus
+        self.neighbor_prefetcher = neighbor_prefetcher
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def resume(self) -> None:
+        """
+        Restart the jobs left pending or running by a previous worker process.
+        """
+        jobs = get_active_scoring_jobs(self.mongo_client)
+        for job in jobs:
+            self._start(job)
+        if jobs:
+            logger.info(f"Resumed {len(jobs)} scoring jobs")
+
+    async def stop(self) -> None:
+        """
+        Cancel the running jobs, they stay active in the database and are resumed on restart.
+        """
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def submit(
+        self, base58_address: str, force_update: bool, wait_s: float
+    ) -> ScoringJob:
+        """
+        Submit a scoring job for a wallet, or join its active job, and wait for it for a while.
+
+        Parameters:
+        - base58_address: The base58 encoded Bitcoin address to score
+        - force_update: Whether the wallet is refetched even if already populated
+        - wait_s: The maximum time to wait for the job to finish in seconds
+
+        Returns:
+        - The job, as of the end of the wait
+        """
+        job = get_active_scoring_job(self.mongo_client, base58_address)
+        if job is None or job.job_id not in self._tasks:
+            if job is None:
+                now = time()
+                job = ScoringJob(
+                    job_id=uuid4().hex,
+                    address=base58_address,
+                    force_update=force_update,
+                    status=SCORING_JOB_PENDING,
+                    created_at=now,
+                    updated_at=now,
+                )
+                insert_scoring_job(self.mongo_client, job)
+            self._start(job)
+
+        task = self._tasks.get(job.job_id)
+        if task is not None and wait_s > 0:
+            try:
+                await asyncio.wait_for(asyncio.shield(task), wait_s)
+            except asyncio.TimeoutError:
+                pass
+        return get_scoring_job(self.mongo_client, job.job_id)
+
+    def _start(self, job: ScoringJob) -> None:
+        """
+        Start running a job in the background.
+
+        Parameters:
+        - job: The job to run
+        """
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job.job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.job_id, None))
+
+    async def _run(self, job: ScoringJob) -> None:
+        """
+        Run a job, recording its progress and outcome in the database.
+
+        Parameters:
+        - job: The job to run
+        """
+        job = self._update(job, status=SCORING_JOB_RUNNING)
+
+        def on_progress(tx_count: int, pages_fetched: int) -> None:
+            nonlocal job
+            estimated_pages = max(ceil(tx_count / TRANSACTIONS_PER_PAGE), 1)
+            job = self._update(
+                job,
+                tx_count=tx_count,
+                estimated_pages=estimated_pages,
+                estimated_seconds=max(estimated_pages - pages_fetched, 0)
+                * BLOCKSTREAM_RATE_LIMIT_MS
+                / 1000.0,
+                pages_fetched=pages_fetched,
+            )
+            if self.event_bus is not None:
+                self.event_bus.publish_job("job_progress", job)
+
+        try:
+            # Jobs joining a refresh already in flight for the wallet get no progress updates
+            wallet_data, connected_wallets = await self.wallet_single_flight.do(
+                job.address,
+                lambda: fetch_score_and_store_wallet(
+                    self.api_worker,
+                    self.mongo_client,
+                    self.neo4j_driver,
+                    self.ml_session,
+                    job.address,
+                    on_progress,
+                    self.event_bus,
+                ),
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in scoring job {job.job_id} for {job.address}: {e}")
+            logger.exception(e)
+            status, error = SCORING_JOB_FAILED, str(e)
+        else:
+            if wallet_data is None:
+                status, error = SCORING_JOB_NOT_FOUND, None
+            elif connected_wallets is None:
+                status, error = SCORING_JOB_FAILED, "Error getting connected wallets"
+            else:
+                status, error = SCORING_JOB_DONE, None
+
+        job = self._update(
+            job,
+            status=status,
+            error=error,
+            estimated_seconds=0.0 if status == SCORING_JOB_DONE else None,
+        )
+        if self.event_bus is not None:
+            self.event_bus.publish_job("job_finished", job)
+
+        # The neighbors of a wallet opened interactively are likely to be opened next
+        if status == SCORING_JOB_DONE and self.neighbor_prefetcher is not None:
+            try:
+                await self.neighbor_prefetcher.schedule(job.address, connected_wallets)
+            except Exception as e:
+                logger.error(f"Error scheduling the prefetch of {job.address}: {e}")
+
+    def _update(self, job: ScoringJob, **fields) -> ScoringJob:
+        """
+        Update fields of a job in the database.
+
+        Parameters:
+        - job: The job to update
+        - fields: The fields to set
+
+        Returns:
+        - The updated job
+        """
+        fields["updated_at"] = time()
+        update_scoring_job(self.mongo_client, job.job_id, **fields)
+        return job.model_copy(update=fields)
@@ -0,0 +1,301 @@
+import asyncio
+import heapq
+import logging
+from math import ceil, log1p
+from time import time
+from typing import Dict, List, Optional, Tuple
+
+from neo4j import Driver
+from pymongo import MongoClient
+
+from src.config import (
+    BLOCKSTREAM_RATE_LIMIT_MS,
+    STALENESS_REFRESH_AGE_HORIZON_S,
+    STALENESS_REFRESH_AGE_WEIGHT,
+    STALENESS_REFRESH_BUDGET_SHARE,
+    STALENESS_REFRESH_MAX_NEIGHBORS,
+    STALENESS_REFRESH_MIN_SCORE,
+    STALENESS_REFRESH_PAGE_SIZE,
+    STALENESS_REFRESH_PASS_INTERVAL_S,
+    STALENESS_REFRESH_PAUSE_S,
+    STALENESS_REFRESH_PER_PAGE,
+    STALENESS_REFRESH_QUERY_WEIGHT,
+    STALENESS_REFRESH_RISK_WEIGHT,
+    STALENESS_REFRESH_STUB_WEIGHT,
+)
+from src.db.mongodb import (
+    get_staleness_refresh_cursor,
+    get_wallet_query_counts,
+    set_staleness_refresh_cursor,
+)
+from src.db.neo4j import get_wallet_staleness_page_from_db
+from src.extern.api_worker import BlockstreamAPIWorker
+from src.extern.bitcoin_api import MAXIMUM_TRANSACTIONS
+from src.models import StalenessRefreshStats, WalletData
+from src.shared.event_bus import EventBus
+from src.shared.ml_session import MLSession
+from src.shared.single_flight import SingleFlight
+from src.shared.token_bucket import TokenBucket
+from src.worker.block_processing_worker import BlockProcessingWorker
+from src.worker.scoring_jobs import TRANSACTIONS_PER_PAGE
+from src.worker.wallet_refresh import fetch_score_and_store_wallet, is_upstream_busy
+
+# Populated wallets are timestamped in seconds, timestamps past this are in milliseconds
+_MILLISECOND_TIMESTAMPS = 10**11
+
+logger = logging.getLogger(__name__)
+
+
+def staleness_score(
+    is_populated: bool,
+    query_count: int,
+    neighbor_risk: float,
+    last_updated: float,
+    now: float,
+) -> float:
+    """
+    Score how much a wallet would gain from a refresh, higher first. Stubs have no data yet, the
+    other terms of a populated wallet grow with the age of its data, so a wallet looked up often
+    or close to risky wallets is refreshed more often but not right after a refresh.
+
+    Parameters:
+    - is_populated: Whether the wallet is populated or a stub
+    - query_count: The number of times the wallet was looked up through the API
+    - neighbor_risk: The highest risk score of the connected wallets
+    - last_updated: The timestamp of the last update to the wallet data
+    - now: The current unix timestamp
+
+    Returns:
+    - The score
+    """
+    if not is_populated:
+        staleness = 1.0
+    else:
+        if last_updated > _MILLISECOND_TIMESTAMPS:
+            last_updated /= 1000
+        staleness = min(
+            max(now - last_updated, 0) / STALENESS_REFRESH_AGE_HORIZON_S, 1.0
+        )
+    return STALENESS_REFRESH_STUB_WEIGHT * (not is_populated) + staleness * (
+        STALENESS_REFRESH_AGE_WEIGHT
+        + STALENESS_REFRESH_QUERY_WEIGHT * log1p(query_count)
+        + STALENESS_REFRESH_RISK_WEIGHT * neighbor_risk
+    )
+
+
+def estimated_requests(wallet_data: Optional[WalletData]) -> int:
+    """
+    Estimate the number of upstream requests a wallet refresh cost, from the transactions fetched.
+
+    Parameters:
+    - wallet_data: The refreshed wallet data, None if the wallet was not found
+
+    Returns:
+    - The number of requests
+    """
+    if wallet_data is None:
+        return 1
+    transactions = min(wallet_data.total_txs, MAXIMUM_TRANSACTIONS)
+    return 1 + ceil(transactions / TRANSACTIONS_PER_PAGE)
+
+
+class StalenessRefreshScheduler:
+    """
+    Refreshes the wallets that gain the most from a refresh (stubs, wallets looked up often, close
+    to risky wallets, or with old data) with the upstream request budget left over by the
+    interactive requests and the block processing.
+
+    The wallets are scanned in pages ordered by address, the cursor is persisted so a restart
+    resumes the scan. The best wallets of each page over STALENESS_REFRESH_MIN_SCORE are refreshed
+    before the next page is read. Refreshes are paced by a token bucket holding a share of the
+    upstream request rate, and wait while other upstream requests are queued or in flight.
+    """
+
+    def __init__(
+        self,
+        mongo_client: MongoClient,
+        neo4j_driver: Driver,
+        api_worker: BlockstreamAPIWorker,
+        ml_session: MLSession,
+        wallet_single_flight: SingleFlight,
+        block_processing_worker: BlockProcessingWorker,
+        event_bus: Optional[EventBus] = None,
+        budget_share: float = STALENESS_REFRESH_BUDGET_SHARE,
+    ) -> None:
+        """
+        Initialize the scheduler.
+
+        Parameters:
+        - mongo_client: The MongoDB client instance
+        - neo4j_driver: The Neo4j driver instance
+        - api_worker: The API worker instance
+        - ml_session: The machine learning session instance
+        - wallet_single_flight: The single flight group coalescing refreshes of the same wallet
+        - block_processing_worker: The block processing worker, the refreshes wait for its blocks
+        - event_bus: The event bus to publish the scored wallets to
+        - budget_share: The share of the upstream request rate the refreshes may spend
+        """
+        self.mongo_client = mongo_client
+        self.neo4j_driver = neo4j_driver
+        self.api_worker = api_worker
+        self.ml_session = ml_session
+        self.wallet_single_flight = wallet_single_flight
+        self.block_processing_worker = block_processing_worker
+        self.event_bus = event_bus
+        request_rate = 1000.0 / BLOCKSTREAM_RATE_LIMIT_MS
+        # A burst of up to a minute of budget after an idle period
+        self.budget = TokenBucket(
+            budget_share * request_rate, max(budget_share * request_rate * 60, 1.0)
+        )
+        # Min-heap of (-score, address) of the wallets of the current page left to refresh
+        self._candidates: List[Tuple[float, str]] = []
+        self._pass_finished = False
+        self._running = False
+
+        self.passes = 0
+        self.scanned = 0
+        self.refreshed = 0
+        self.failed_refreshes = 0
+        self.estimated_requests = 0.0
+        self.paused = 0
+
+    async def start(self) -> None:
+        """
+        Start scanning and refreshing the wallets.
+        """
+        logger.info("Starting staleness refresh")
+        self._running = True
+        after = await asyncio.to_thread(get_staleness_refresh_cursor, self.mongo_client)
+        while self._running:
+            try:
+                if not self._candidates:
+                    if self._pass_finished:
+                        await asyncio.sleep(STALENESS_REFRESH_PASS_INTERVAL_S)
+                        self._pass_finished = False
+                    after = await asyncio.to_thread(self.scan_page, after)
+                    if after == "":
+                        self.passes += 1
+                        self._pass_finished = True
+                    continue
+
+                await self.wait_for_budget()
+                _, address = heapq.heappop(self._candidates)
+                await self.refresh(address)
+            except Exception as e:
+                logger.error(f"Error in staleness refresh: {e}")
+                logger.exception(e)
+                await asyncio.sleep(STALENESS_REFRESH_PAUSE_S)
+
+    def stop(self) -> None:
+        """
+        Stop scanning and refreshing the wallets.
+        """
+        logger.info("Stopping staleness refresh")
+        self._running = False
+
+    def scan_page(self, after: str) -> str:
+        """
+        Score the next page of wallets and keep the best ones as the candidates to refresh.
+
+        Parameters:
+        - after: The address the page starts after
+
+        Returns:
+        - The address the next page starts after, "" once the scan is back at the first wallet
+        """
+        wallets = get_wallet_staleness_page_from_db(
+            self.neo4j_driver,
+            after,
+            STALENESS_REFRESH_PAGE_SIZE,
+            STALENESS_REFRESH_MAX_NEIGHBORS,
+        )
+        query_counts = get_wallet_query_counts(
+            self.mongo_client, [wallet["address"] for wallet in wallets]
+        )
+        now = time()
+        scores: Dict[str, float] = {}
+        for wallet in wallets:
+            score = staleness_score(
+                wallet["is_populated"],
+                query_counts.get(wallet["address"], 0),
+                wallet["neighbor_risk"],
+                wallet["last_updated"],
+                now,
+            )
+            if score >= STALENESS_REFRESH_MIN_SCORE:
+                scores[wallet["address"]] = score
+        self.scanned += len(wallets)
+
+        best = heapq.nlargest(
+            STALENESS_REFRESH_PER_PAGE, scores.items(), key=lambda item: item[1]
+        )
+        self._candidates = [(-score, address) for address, score in best]
+        heapq.heapify(self._candidates)
+
+        if len(wallets) == STALENESS_REFRESH_PAGE_SIZE:
+            after = wallets[-1]["address"]
+        else:
+            after = ""
+        set_staleness_refresh_cursor(self.mongo_client, after)
+        return after
+
+    async def wait_for_budget(self) -> None:
+        """
+        Wait until the budget allows a refresh and no other traffic needs the upstream capacity.
+        """
+        while True:
+            if is_upstream_busy(
+                self.api_worker, self.wallet_single_flight, self.block_processing_worker
+            ):
+                self.paused += 1
+                await asyncio.sleep(STALENESS_REFRESH_PAUSE_S)
+                continue
+            wait_time = self.budget.wait_time()
+            if wait_time == 0:
+                return
+            await asyncio.sleep(wait_time)
+
+    async def refresh(self, address: str) -> None:
+        """
+        Fetch, score and store a wallet, sharing a refresh already in flight, and charge its
+        estimated cost to the budget.
+
+        Parameters:
+        - address: The wallet address
+        """
+        try:
+            wallet_data, _ = await self.wallet_single_flight.do(
+                address,
+                lambda: fetch_score_and_store_wallet(
+                    self.api_worker,
+                    self.mongo_client,
+                    self.neo4j_driver,
+                    self.ml_session,
+                    address,
+                    event_bus=self.event_bus,
+                ),
+            )
+        except Exception as e:
+            logger.error(f"Error refreshing stale wallet {address}: {e}")
+            self.failed_refreshes += 1
+            cost = 1
+        else:
+            self.refreshed += 1
+            cost = estimated_requests(wallet_data)
+        self.budget.spend(cost)
+        self.estimated_requests += cost
+
+    def stats(self) -> StalenessRefreshStats:
+        """
+        Get the background refresh counters.
+        """
+        return StalenessRefreshStats(
+            passes=self.passes,
+            scanned=self.scanned,
+            candidates=len(self._candidates),
+            refreshed=self.refreshed,
+            failed_refreshes=self.failed_refreshes,
+            estimated_requests=self.estimated_requests,
+            paused=self.paused,
+            budget_tokens=self.budget.tokens,
+        )
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+from neo4j import Driver
+from pymongo import MongoClient
+
+from src.db.connections import store_connected_wallets
+from src.db.mongodb import add_wallet_changes
+from src.db.neo4j import upsert_wallet_data_in_db
+from src.extern.api_worker import BlockstreamAPIWorker, ProgressCallback
+from src.extern.bitcoin_api import get_wallet_data_from_api
+from src.ml.random_forest import infer_wallet_data_class
+from src.models import ConnectedWallets, WalletData
+from src.shared.event_bus import EventBus
+from src.shared.ml_session import MLSession
+from src.shared.single_flight import SingleFlight
+from src.worker.block_processing_worker import BlockProcessingWorker
+
+logger = logging.getLogger(__name__)
+
+
+async def fetch_score_and_store_wallet(
+    api_worker: BlockstreamAPIWorker,
+    mongo_client: MongoClient,
+    neo4j_driver: Driver,
+    ml_session: MLSession,
+    base58_address: str,
+    on_progress: Optional[ProgressCallback] = None,
+    event_bus: Optional[EventBus] = None,
+) -> Tuple[Optional[WalletData], Optional[ConnectedWallets]]:
+    """
+    Fetch a wallet from the Blockstream API, infer its class and store it with its connected wallets.
+
+    Parameters:
+    - api_worker: The API worker instance
+    - mongo_client: The MongoDB client instance
+    - neo4j_driver: The Neo4j driver instance
+    - ml_session: The machine learning session instance
+    - base58_address: The base58 encoded Bitcoin address to refresh
+    - on_progress: Called as the transaction pages of the wallet are fetched
+    - event_bus: The event bus to publish the scored wallet to
+
+    Returns:
+    - The scored wallet data, None if the wallet is not found
+    - The connected wallets, None if they could not be fetched, nothing is stored in that case
+    """
+    wallet_data, connected_wallets = await get_wallet_data_from_api(
+        api_worker, mongo_client, base58_address, on_progress
+    )
+    if wallet_data is None or connected_wallets is None:
+        return wallet_data, connected_wallets
+
+    # Compute the inference for the wallet data
+    wallet_data = infer_wallet_data_class(ml_session, wallet_data)
+
+    # Add or update the wallet data and connected wallets to the database
+    upsert_wallet_data_in_db(neo4j_driver, wallet_data)
+    store_connected_wallets(
+        neo4j_driver, mongo_client, base58_address, connected_wallets
+    )
+    add_wallet_changes(mongo_client, [base58_address])
+    if event_bus is not None:
+        event_bus.publish_wallet_scored(wallet_data)
+
+    return wallet_data, connected_wallets
+
+
+def is_upstream_busy(
+    api_worker: BlockstreamAPIWorker,
+    wallet_single_flight: SingleFlight,
+    block_processing_worker: BlockProcessingWorker,
+) -> bool:
+    """
+    Check if interactive requests or block processing need the upstream capacity, so background
+    refreshes should wait.
+
+    Parameters:
+    - api_worker: The API worker instance
+    - wallet_single_flight: The single flight group of the wallet refreshes in flight
+    - block_processing_worker: The block processing worker
+    """
+    return (
+        api_worker.queue.qsize() > 0
+        or len(wallet_single_flight) > 0
+        or (
+            block_processing_worker.latest_block_height is not None
+            and block_processing_worker.last_processed_block_height is not None
+            and block_processing_worker.latest_block_height
+            > block_processing_worker.last_processed_block_height
+        )
+    )
+
+
+async def refresh_wallets(
+    api_worker: BlockstreamAPIWorker,
+    mongo_client: MongoClient,
+    neo4j_driver: Driver,
+    ml_session: MLSession,
+    wallet_single_flight: SingleFlight,
+    base58_addresses: List[str],
+    concurrency: int,
+    event_bus: Optional[EventBus] = None,
+) -> None:
+    """
+    Fetch, score and store many wallets, sharing the refreshes already in flight.
+
+    Parameters:
+    - api_worker: The API worker instance
+    - mongo_client: The MongoDB client instance
+    - neo4j_driver: The Neo4j driver instance
+    - ml_session: The machine learning session instance
+    - wallet_single_flight: The single flight group coalescing refreshes of the same wallet
+    - base58_addresses: The base58 encoded Bitcoin addresses to refresh
+    - concurrency: The maximum number of wallets refreshed at once
+    - event_bus: The event bus to publish the scored wallets to
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def refresh(base58_address: str) -> None:
+        async with semaphore:
+            try:
+                await wallet_single_flight.do(
+                    base58_address,
+                    lambda: fetch_score_and_store_wallet(
+                        api_worker,
+                        mongo_client,
+                        neo4j_driver,
+                        ml_session,
+                        base58_address,
+                        event_bus=event_bus,
+                    ),
+                )
+            except Exception as e:
+                logger.error(f"Error refreshing wallet {base58_address}: {e}")
+
+    await asyncio.gather(*(refresh(address) for address in base58_addresses))
+    logger.info(f"Refreshed a batch of {len(base58_addresses)} wallets")